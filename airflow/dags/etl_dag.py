@@ -1,13 +1,12 @@
 
-from airflow.sdk import dag, task, task_group
-import os, pendulum, sys
+from airflow.sdk import dag, task, task_group, get_current_context
+import os, re, pendulum, sys
 from datetime import datetime, timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from airflow.providers.amazon.aws.sensors.s3 import S3KeySensor
 from airflow.operators.empty import EmptyOperator
-from airflow.providers.common.sql.operators.sql import SQLExecuteQueryOperator
 from airflow.providers.postgres.hooks.postgres import PostgresHook
 import boto3
 import pandas as pd
@@ -16,6 +15,14 @@ import pandas as pd
 from etl_scripts import extract as extract_module
 from etl_scripts import transform as transform_module
 from etl_scripts import load as load_module
+from etl_scripts import manifest as manifest_module
+from etl_scripts import pipeline
+from etl_scripts import metrics
+from etl_scripts import profiling
+from etl_scripts import db
+from etl_scripts import comparables
+from etl_scripts import vehicle_history
+from etl_scripts import changes
 from scraper import setup
 from scraper import scrape_auction as scraper
 from scraper import save_auctions
@@ -40,6 +47,40 @@ main_auction_file = f"auctions_{saving_date}.json"
 rescraped_auction_obj_key = f"rescraped_{saving_date}.json"
 
 
+def push_stage_metrics()->dict:
+    # export per-stage timings/throughput/memory and keep a compact copy in XCom. Named after the
+    # task instance: the main and rescrape transforms run the same function, and a shared name
+    # would make the second overwrite the first's Prometheus textfile
+    ti = get_current_context()['ti']
+    task_name = ti.task_id if ti.map_index is None or ti.map_index < 0 else f"{ti.task_id}_{ti.map_index}"
+    summary = metrics.export(re.sub(r'[^A-Za-z0-9_]', '_', task_name))
+    ti.xcom_push(key='metrics', value=summary)
+    return summary
+
+
+def postgres_dsn()->str:
+    # the Airflow connection as a DSN, so connections come from the worker's pool (etl_scripts.db)
+    return PostgresHook(postgres_conn_id="postgres_default_local").get_uri()
+
+
+def run_sql_file(staging_table:str, filename:str):
+    with db.connection(postgres_dsn()) as conn:
+        pipeline.run_sql_file(conn, filename, staging_table)
+
+
+def task_profiler(s3_client):
+    # cProfile/tracemalloc the task when the run has params.profile=true (or CARSNBIDS_PROFILE=1);
+    # results go next to the processed output under _profiles/<run_id>/
+    context = get_current_context()
+    return profiling.profile_task(
+        context['ti'].task_id,
+        s3_client,
+        processed_auctions_bucket,
+        f"{profiling.PROFILE_PREFIX}/{context['run_id']}",
+        enabled=profiling.profiling_enabled(context['params']),
+    )
+
+
 default_args = {
     'owner': 'brian',
     'depends_on_past': False,
@@ -56,7 +97,9 @@ default_args = {
     schedule='* * * * *', # update this
     catchup=False,
     tags=["cars&bids"],
-    default_args = default_args
+    default_args = default_args,
+    # transform_engine: 'pandas' or 'polars' for this run (default: TRANSFORM_ENGINE)
+    params={"profile": False, "transform_engine": None},
 )
 def carsnbids_dag():
 
@@ -79,51 +122,53 @@ def carsnbids_dag():
         ):
         @task(task_id="transform_task")
         def transform(s3_client, main_object_key:str, raw_auctions_bucket:str=None, processed_auctions_bucket:str=None):
-            processed_auction_keys = []
-            rescrape_urls = []
-
-            if not main_object_key:
-                return {"processed_auction_keys": processed_auction_keys, "rescrape_urls": rescrape_urls}
-
-            # read file
-            auction_data = transform_module.load_json_from_s3(s3_client, raw_auctions_bucket, main_object_key)
-
-            # convert to a list of dicts
-            transformed_data = transform_module.convert_to_list_dicts(auction_data)
-
-            # create df
-            df = transform_module.create_auction_df(transformed_data)
-
-            # filter out bad urls
-            filtered_df, rescrape_urls = transform_module.get_and_remove_invalid_auctions(df)
-            if filtered_df.empty:
-                return {"processed_auction_keys": processed_auction_keys, "rescrape_urls": rescrape_urls}
-
-            # clean and transform filtered_df
-            cleaned_df = transform_module.clean_and_transform(filtered_df)
-
-            # upload transformed auctions to processed auctions bucket
-            processed_auction_keys = load_module.load_to_s3(s3_client, processed_auctions_bucket, cleaned_df)
-            
-            return {"processed_auction_keys": processed_auction_keys, "rescrape_urls": rescrape_urls}
+            metrics.reset()
+            with task_profiler(s3_client):
+                results = pipeline.transform_object(
+                    s3_client, main_object_key, raw_auctions_bucket, processed_auctions_bucket,
+                    engine=get_current_context()['params'].get('transform_engine'),
+                )
+            push_stage_metrics()
+            return results
     
         @task(task_id="rescrape_task")
         def rescrape_auction_urls(s3_client, rescraped_auctions_bucket:str, rescrape_object_key:str, transform_results:dict):
             rescrape_urls = transform_results.get('rescrape_urls')
             if not rescrape_urls:
                 return None
-            
+
+            # skip the scrape if this exact set of urls was already rescraped into rescrape_object_key
+            manifest = manifest_module.load_manifest(s3_client, processed_auctions_bucket)
+            existing_etag = manifest_module.get_object_etag(s3_client, rescraped_auctions_bucket, rescrape_object_key)
+            if manifest_module.get_rescrape_entry(manifest, rescraped_auctions_bucket, rescrape_object_key, rescrape_urls, existing_etag):
+                print(f"{rescrape_object_key} already rescraped, skipping")
+                return rescrape_object_key
+
+            metrics.reset()
+            s3_client = metrics.counting(s3_client)
             driver = setup.driver_setup()
             rescrapred_auction_data = []
             
-            for url in rescrape_urls:
-                auction_data = scraper.scrape_auction_data(driver, url)
-                rescrapred_auction_data.append(auction_data)
-
-            uploaded_object_key = save_auctions.save_auction_data_to_s3(
-                s3_client, rescraped_auctions_bucket, rescrapred_auction_data, rescrape_object_key
-            )
+            with task_profiler(s3_client):
+                with metrics.stage('scrape_auction_data', rows=len(rescrape_urls)):
+                    for url in rescrape_urls:
+                        auction_data = scraper.scrape_auction_data(driver, url)
+                        rescrapred_auction_data.append(auction_data)
+
+                with metrics.stage('save_auction_data_to_s3', rows=len(rescrapred_auction_data)):
+                    uploaded_object_key = save_auctions.save_auction_data_to_s3(
+                        s3_client, rescraped_auctions_bucket, rescrapred_auction_data, rescrape_object_key
+                    )
             setup.driver_teardown(driver)
+            push_stage_metrics()
+
+            uploaded_etag = manifest_module.get_object_etag(s3_client, rescraped_auctions_bucket, uploaded_object_key)
+            manifest_module.update_manifest(
+                s3_client, processed_auctions_bucket,
+                lambda manifest: manifest_module.record_rescrape(
+                    manifest, rescraped_auctions_bucket, uploaded_object_key, rescrape_urls, uploaded_etag
+                ),
+            )
 
             return uploaded_object_key
         
@@ -169,50 +214,73 @@ def carsnbids_dag():
         if not object_keys:
             return None
 
-         # empty staging table before loading new data
-        empty_staging = SQLExecuteQueryOperator(
-            task_id="empty_staging_table",
-            conn_id="postgres_default_local",
-            sql="sql/empty_staging.sql",
-        )
+        # every run loads into its own UNLOGGED staging table, so runs and backfills can overlap
+        @task(task_id="create_staging_table")
+        def create_staging_table()->str:
+            staging_table = pipeline.staging_table_name(get_current_context()['run_id'])
+            run_sql_file(staging_table, 'create_staging.sql')
+            return staging_table
 
         @task(task_id="load_to_postgres_staging")
-        def load_to_postgres_staging(s3_client, object_keys:list)->int:
+        def load_to_postgres_staging(s3_client, object_keys:list, staging_table:str)->dict:
 
-            hook = PostgresHook(postgres_conn_id="postgres_default_local")
-            conn = hook.get_conn()
-            cursor = conn.cursor()
-        
-            try:
-                # read auction file(s) from s3
-                auction_data = []
-                for key in object_keys:
-                    data = transform_module.load_json_from_s3(s3_client,processed_auctions_bucket,key=key,ndjson=True)
-                    auction_data.extend(data)
-
-                # create a df
-                df = pd.DataFrame(auction_data)
-
-                # load to staging table
-                inserted_rows = load_module.load_to_postgres(df, conn, cursor)
-                return inserted_rows
-            
-            except Exception as e:
-                raise
-
-            finally:
-                cursor.close()
-                conn.close()
+            metrics.reset()
+            with db.connection(postgres_dsn()) as conn, task_profiler(s3_client):
+                results = pipeline.load_keys_to_staging(s3_client, processed_auctions_bucket, object_keys, conn, staging_table)
+            push_stage_metrics()
+            return results
 
         # load dim and fact tables from staging
-        load_fact_and_dims = SQLExecuteQueryOperator(
-            task_id="load_fact_and_dims",
-            conn_id="postgres_default_local",
-            sql="sql/load_tables.sql",
-        )
-
-        load_to_staging = load_to_postgres_staging(s3_client, object_keys)
-        empty_staging >> load_to_staging >> load_fact_and_dims
+        @task(task_id="load_fact_and_dims")
+        def load_fact_and_dims(staging_table:str)->dict:
+            # inserted/updated/unchanged row counts per table; the changed auctions go to auction_changelog
+            with db.connection(postgres_dsn()) as conn:
+                return pipeline.load_warehouse_tables(conn, staging_table, get_current_context()['run_id'])
+
+        # the run's change feed as NDJSON next to the processed files, for downstream consumers
+        @task(task_id="export_change_feed")
+        def export_change_feed(s3_client)->dict:
+            with db.connection(postgres_dsn()) as conn:
+                return changes.export_changes(conn, s3_client, processed_auctions_bucket, get_current_context()['run_id'])
+
+        # update the dashboard aggregates for the days this run touched
+        @task(task_id="refresh_market_stats")
+        def refresh_market_stats(staging_table:str)->dict:
+            with db.connection(postgres_dsn()) as conn:
+                return pipeline.refresh_market_stats(conn, staging_table)
+
+        # recompute the auction history of the VINs this run loaded (relist/flip flags)
+        @task(task_id="refresh_vehicle_history")
+        def refresh_vehicle_history(staging_table:str)->dict:
+            with db.connection(postgres_dsn()) as conn:
+                return vehicle_history.refresh_history(conn, staging_table)
+
+        # merge the run's sold auctions into the shared comparables index; the merge starts from
+        # the shared copy and is redone if another run uploaded in the meantime
+        @task(task_id="update_comparables_index")
+        def update_comparables_index(s3_client, staging_table:str)->dict:
+            with db.connection(postgres_dsn()) as conn:
+                return comparables.sync_index(conn, s3_client, processed_auctions_bucket, staging_table)
+
+        # runs even if the load failed, so failed runs don't leave their staging table behind
+        @task(task_id="drop_staging_table", trigger_rule="all_done")
+        def drop_staging_table(staging_table:str):
+            run_sql_file(staging_table, 'drop_staging.sql')
+
+        @task(task_id="mark_keys_loaded")
+        def mark_keys_loaded(s3_client, staging_results:dict):
+            return pipeline.mark_keys_loaded(s3_client, processed_auctions_bucket, staging_results.get('loaded_keys'))
+
+        staging_table = create_staging_table()
+        load_to_staging = load_to_postgres_staging(s3_client, object_keys, staging_table)
+        load_tables = load_fact_and_dims(staging_table)
+        mark_loaded = mark_keys_loaded(s3_client, load_to_staging)
+        market_stats = refresh_market_stats(staging_table)
+        vin_history = refresh_vehicle_history(staging_table)
+        comparables_index = update_comparables_index(s3_client, staging_table)
+        change_feed = export_change_feed(s3_client)
+        load_to_staging >> load_tables >> [market_stats, vin_history, comparables_index, change_feed] >> mark_loaded
+        [market_stats, vin_history, comparables_index] >> drop_staging_table(staging_table)
         return load_to_staging
     
 
@@ -0,0 +1,202 @@
+import os, time, random, hashlib, sqlite3, tempfile
+from contextlib import contextmanager
+import botocore.exceptions
+import pandas as pd
+from dotenv import load_dotenv
+
+from etl_scripts import ndjson
+from etl_scripts import storage
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+# SQLite file in the processed bucket: auction_id -> (processed day file, hash of its record)
+AUCTION_INDEX_OBJECT_KEY = os.getenv('AUCTION_INDEX_OBJECT_KEY', '_auction_index.sqlite')
+AUCTION_INDEX_UPDATE_ATTEMPTS = int(os.getenv('AUCTION_INDEX_UPDATE_ATTEMPTS', 10))
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+
+def day_object_key(auction_date)->str:
+    # the processed day file an auction lands in by default, as named by load_to_s3
+    return f"{auction_date.date()}.json"
+
+
+def content_hashes(df:pd.DataFrame)->pd.Series:
+    """
+    md5 of every processed record, as it is serialized into the day files.
+    """
+    lines = ndjson.encode_lines(df)
+    return pd.Series([hashlib.md5(line).hexdigest() for line in lines], index=df.index, dtype=object)
+
+
+class AuctionIndex:
+    """
+    Persistent auction_id -> (processed_key, content_hash) map, kept in SQLite so a lookup is a
+    primary key probe and the file only holds one small row per auction ever processed.
+    """
+    def __init__(self, path:str, etag:str=None):
+        self.path = path
+        # ETag of the S3 object the file was downloaded from (None: there was none)
+        self.etag = etag
+        self.changed = False
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS auctions ("
+            " auction_id TEXT PRIMARY KEY,"
+            " processed_key TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL"
+            ") WITHOUT ROWID"
+        )
+
+    def lookup(self, auction_ids)->dict:
+        """
+        Returns {auction_id: (processed_key, content_hash)} for the ids that are indexed.
+        """
+        ids = [auction_id for auction_id in dict.fromkeys(auction_ids) if isinstance(auction_id, str)]
+        found = {}
+        for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+            batch = ids[start:start + LOOKUP_BATCH_SIZE]
+            rows = self.conn.execute(
+                f"SELECT auction_id, processed_key, content_hash FROM auctions WHERE auction_id IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            found.update((auction_id, (key, content_hash)) for auction_id, key, content_hash in rows)
+        return found
+
+    def record(self, auction_ids, processed_keys, hashes):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO auctions (auction_id, processed_key, content_hash) VALUES (?, ?, ?) "
+                "ON CONFLICT (auction_id) DO UPDATE SET processed_key = excluded.processed_key, content_hash = excluded.content_hash",
+                [row for row in zip(auction_ids, processed_keys, hashes) if isinstance(row[0], str)],
+            )
+        self.changed = True
+
+    def close(self):
+        self.conn.close()
+
+
+def route_auctions(index:AuctionIndex, df:pd.DataFrame)->tuple:
+    """
+    Decides where each cleaned auction goes before it is written to S3.
+
+    - an auction already indexed with the same content hash is an exact duplicate and dropped
+    - an auction already indexed under another day file (e.g. a rescrape whose date resolved to
+      a different day) is routed to that file, so it never exists in two day files
+    - everything else goes to the day file of its auction_date
+
+    Returns:
+        tuple: (remaining DataFrame, Series of target object keys, Series of content hashes,
+            all aligned on the DataFrame's index, and the sorted day files holding the dropped
+            duplicates). The caller still reports those files: a transform retried after its
+            index was saved finds only duplicates, and its files must still be loaded.
+    """
+    hashes = content_hashes(df)
+    known = index.lookup(df['auction_id'])
+
+    auction_ids = df['auction_id'].astype(object)
+    known_keys = auction_ids.map(lambda auction_id: known[auction_id][0] if auction_id in known else None)
+    known_hashes = auction_ids.map(lambda auction_id: known[auction_id][1] if auction_id in known else None)
+    duplicate = known_hashes.eq(hashes)
+    object_keys = known_keys.where(known_keys.notna(), df['auction_date'].map(day_object_key))
+
+    duplicate_keys = sorted(set(object_keys[duplicate]))
+    if duplicate.any():
+        print(f"{int(duplicate.sum())} auction(s) already processed unchanged, skipping")
+    keep = ~duplicate
+    return df[keep], object_keys[keep], hashes[keep], duplicate_keys
+
+
+def drop_stale_copies(index:AuctionIndex, df:pd.DataFrame, object_key:str)->pd.DataFrame:
+    """
+    Drops records of a processed day file that the index places in another file, i.e. copies
+    left behind before the auction was routed elsewhere.
+    """
+    known = index.lookup(df['auction_id'])
+    stale = df['auction_id'].astype(object).map(
+        lambda auction_id: auction_id in known and known[auction_id][0] != object_key
+    ).astype(bool)
+    if stale.any():
+        print(f"{object_key}: skipping {int(stale.sum())} auction(s) indexed under another day file")
+    return df[~stale]
+
+
+def save_index(s3_client, bucket:str, index:AuctionIndex, key:str=AUCTION_INDEX_OBJECT_KEY):
+    """
+    Uploads the index with a conditional write: it only succeeds if the object in S3 is still
+    the one the index was downloaded from. Otherwise botocore raises a ClientError that
+    `storage.is_precondition_failed` recognises.
+    """
+    with open(index.path, 'rb') as f:
+        s3_client.put_object(Bucket=bucket, Key=key, Body=f.read(), **storage.write_condition(index.etag))
+
+
+@contextmanager
+def opened(s3_client, bucket:str, key:str=AUCTION_INDEX_OBJECT_KEY, save:bool=True):
+    """
+    Downloads the index from the processed bucket into a temporary file, yields it, and uploads
+    it again if it was changed (and `save` is True). Starts a new, empty index if none exists;
+    any other S3 error is raised, so a failed read can never be saved over the index.
+
+    Writers should go through `update`, which retries when another run saved the index first.
+
+    Example:
+        with auction_index.opened(s3_client, processed_auctions_bucket, save=False) as index:
+            df = auction_index.drop_stale_copies(index, df, object_key)
+    """
+    fd, path = tempfile.mkstemp(suffix='.sqlite', prefix='auction-index-')
+    try:
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+            body, etag = response['Body'].read(), response['ETag']
+        except botocore.exceptions.ClientError as e:
+            if not storage.is_not_found(e):
+                os.close(fd)
+                raise
+            body, etag = b'', None
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+
+        index = AuctionIndex(path, etag)
+        try:
+            yield index
+        finally:
+            index.close()
+
+        if save and index.changed:
+            save_index(s3_client, bucket, index, key)
+    finally:
+        os.remove(path)
+
+
+def update(s3_client, bucket:str, apply, key:str=AUCTION_INDEX_OBJECT_KEY, attempts:int=AUCTION_INDEX_UPDATE_ATTEMPTS):
+    """
+    Runs `apply(index)` on the current index and saves it with a conditional write.
+
+    Transforms can run at the same time: when the write fails because another run saved the
+    index first, it is downloaded again and `apply` re-run, so routing decisions are always
+    made against every auction recorded so far. Day files written by a failed attempt may keep
+    copies of auctions the retry routed elsewhere; `drop_stale_copies` skips them at load time.
+
+    Example:
+        keys = auction_index.update(s3_client, bucket, lambda index: route_write_and_record(index, df))
+
+    Returns:
+        Whatever `apply` returned in the attempt that was saved.
+    """
+    for attempt in range(attempts):
+        with opened(s3_client, bucket, key, save=False) as index:
+            result = apply(index)
+            if not index.changed:
+                return result
+            try:
+                save_index(s3_client, bucket, index, key)
+                return result
+            except botocore.exceptions.ClientError as e:
+                if not storage.is_precondition_failed(e):
+                    raise
+        print(f"{bucket}/{key} was updated by another run, retrying")
+        time.sleep(random.uniform(0, 0.05 * 2**attempt))
+    raise RuntimeError(f"could not update {bucket}/{key} after {attempts} attempts")
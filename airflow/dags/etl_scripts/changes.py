@@ -0,0 +1,52 @@
+import os, re
+from dotenv import load_dotenv
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+# Per-run change feed: load_tables.sql records the auctions a load inserted or updated in
+# auction_changelog, and export_changes writes the run's rows to the processed bucket as
+# <CHANGES_PREFIX>/<YYYY-MM-DD>/<run id>.ndjson (one auction_changelog row per line).
+CHANGES_PREFIX = os.getenv('CHANGES_PREFIX', '_changes')
+
+# Postgres renders the JSON, so the rows are never decoded in Python
+CHANGES_QUERY = """
+SELECT to_char(MIN(captured_at) OVER () AT TIME ZONE 'UTC', 'YYYY-MM-DD'), change_type, row_to_json(c)::TEXT
+FROM auction_changelog c
+WHERE run_id = %s
+ORDER BY auction_time, auction_id
+"""
+
+
+def change_key(run_id:str, day:str, prefix:str=CHANGES_PREFIX)->str:
+    # run ids contain ':' and '+' (scheduled__2025-01-04T00:00:00+00:00)
+    return f"{prefix}/{day}/{re.sub(r'[^A-Za-z0-9_.-]', '_', run_id)}.ndjson"
+
+
+def export_changes(conn, s3_client, bucket:str, run_id:str, prefix:str=CHANGES_PREFIX)->dict:
+    """
+    Writes the auction_changelog rows of one run to the processed bucket as NDJSON.
+
+    Runs with no changes write nothing. Exporting a run again rewrites the same object.
+
+    Returns:
+        dict: {"key": object key or None, "inserted": int, "updated": int}
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(CHANGES_QUERY, (run_id,))
+        rows = cursor.fetchall()
+    conn.commit()
+
+    counts = {"insert": 0, "update": 0}
+    for _, change_type, _ in rows:
+        counts[change_type] += 1
+
+    key = None
+    if rows:
+        key = change_key(run_id, rows[0][0], prefix)
+        body = "".join(f"{line}\n" for _, _, line in rows).encode('utf-8')
+        s3_client.put_object(Bucket=bucket, Key=key, Body=body, ContentType='application/x-ndjson')
+    print(f"change feed: {counts['insert']} inserted, {counts['update']} updated auction(s)"
+          f"{f' -> {bucket}/{key}' if key else ''}")
+    return {"key": key, "inserted": counts['insert'], "updated": counts['update']}
@@ -0,0 +1,312 @@
+import os, io, json, time, random, tarfile, tempfile
+import botocore.exceptions
+import numpy as np
+from dotenv import load_dotenv
+from psycopg2 import sql
+
+from etl_scripts import storage
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+# Comparable-sales index: every sold auction as one fixed-size record, sorted by
+# (make/model group, manufacture_year, mileage), so the sales of one make and model are one
+# contiguous slice and the years inside it can be binary searched.
+#   comparables.npy   structured array (COMPARABLES_DTYPE), opened with np.load(mmap_mode='r')
+#   comparables.json  group keys ("make|model", lowercase) and the [start, end) slice of each group
+COMPARABLES_DIR = os.path.expanduser(os.getenv('COMPARABLES_DIR', '~/airflow/data/comparables'))
+COMPARABLES_PREFIX = os.getenv('COMPARABLES_PREFIX', '_comparables')
+ARRAY_FILE = 'comparables.npy'
+GROUPS_FILE = 'comparables.json'
+# the shared copy is one tar of both files, so it can be replaced with a single conditional write
+BUNDLE_FILE = 'comparables.tar'
+COMPARABLES_UPDATE_ATTEMPTS = int(os.getenv('COMPARABLES_UPDATE_ATTEMPTS', 5))
+
+# one model year apart counts as much as this many miles apart
+YEAR_WEIGHT_MILES = int(os.getenv('COMPARABLES_YEAR_WEIGHT_MILES', 10_000))
+# distance added for a sale without mileage
+MISSING_MILEAGE_MILES = 50_000
+# years searched around the requested one before falling back to the whole make/model
+MAX_YEAR_GAP = 3
+
+COMPARABLES_DTYPE = np.dtype([
+    ("group", np.int32),
+    ("year", np.int16),
+    ("mileage", np.int32),      # -1 when unknown
+    ("price", np.int32),
+    ("auction_time", np.int64), # epoch seconds
+    ("auction_id", "S16"),
+])
+
+SOLD_AUCTIONS_QUERY = """
+SELECT
+    make_dim.make,
+    model_dim.model,
+    vd.manufacture_year,
+    vd.mileage,
+    af.max_bid,
+    EXTRACT(EPOCH FROM af.auction_time)::BIGINT,
+    af.auction_id
+FROM auction_fact af
+JOIN vehicle_dim vd ON af.vehicle_id = vd.vehicle_id
+JOIN vehicle_make_dim make_dim ON vd.make_id = make_dim.id
+JOIN vehicle_model_dim model_dim ON vd.model_id = model_dim.id
+JOIN auction_status_dim asd ON af.auction_status = asd.id
+WHERE asd.status = 'sold'
+    AND af.max_bid IS NOT NULL
+    AND vd.manufacture_year IS NOT NULL
+"""
+
+
+def group_key(make:str, model:str)->str:
+    return f"{make.strip().lower()}|{model.strip().lower()}"
+
+
+def fetch_sold_auctions(conn, staging_table:str=None)->tuple:
+    """
+    Reads sold auctions from the warehouse, optionally only those in a run's staging table.
+
+    Returns:
+        tuple: (group keys per row, structured array of COMPARABLES_DTYPE with group unset,
+            auction_ids present in the staging table)
+    """
+    query = sql.SQL(SOLD_AUCTIONS_QUERY)
+    staged_ids = None
+    with conn.cursor() as cursor:
+        if staging_table:
+            query = query + sql.SQL(" AND af.auction_id IN (SELECT auction_id FROM {staging})").format(
+                staging=sql.Identifier(staging_table)
+            )
+            cursor.execute(sql.SQL("SELECT DISTINCT auction_id FROM {staging} WHERE auction_id IS NOT NULL").format(
+                staging=sql.Identifier(staging_table)
+            ))
+            staged_ids = np.array([row[0] for row in cursor.fetchall()], dtype="S16")
+        cursor.execute(query)
+        rows = cursor.fetchall()
+    conn.commit()
+
+    records = np.empty(len(rows), dtype=COMPARABLES_DTYPE)
+    keys = []
+    for i, (make, model, year, mileage, price, auction_time, auction_id) in enumerate(rows):
+        keys.append(group_key(make, model))
+        records[i] = (-1, year, -1 if mileage is None else mileage, price, auction_time, auction_id.encode('utf-8'))
+    return keys, records, staged_ids
+
+
+def build_index(keys:list, records:np.ndarray)->tuple:
+    """
+    Sorts records by (group, year, mileage) and computes the slice of every group.
+
+    Returns:
+        tuple: (sorted structured array, {"keys": [...], "slices": {key: [start, end]}})
+    """
+    group_keys = sorted(set(keys))
+    group_ids = {key: i for i, key in enumerate(group_keys)}
+    records = records.copy()
+    records["group"] = np.fromiter((group_ids[key] for key in keys), dtype=np.int32, count=len(keys))
+
+    records = records[np.lexsort((records["mileage"], records["year"], records["group"]))]
+    bounds = np.searchsorted(records["group"], np.arange(len(group_keys) + 1))
+    slices = {key: [int(bounds[i]), int(bounds[i + 1])] for i, key in enumerate(group_keys)}
+    return records, {"keys": group_keys, "slices": slices}
+
+
+def merge_index(index, keys:list, records:np.ndarray, replaced_ids:np.ndarray)->tuple:
+    """
+    Adds freshly loaded sales to an existing index. Existing rows whose auction_id is in
+    `replaced_ids` (everything the run loaded) are dropped first, so updated and no longer
+    sold auctions don't linger.
+    """
+    existing = np.asarray(index.records)
+    if replaced_ids is not None and len(replaced_ids):
+        existing = existing[~np.isin(existing["auction_id"], replaced_ids)]
+    existing_keys = [index.groups["keys"][group] for group in existing["group"]]
+    return build_index(existing_keys + keys, np.concatenate([existing, records]))
+
+
+def save_index(records:np.ndarray, groups:dict, directory:str=COMPARABLES_DIR)->list:
+    """
+    Writes the index files atomically (readers keep their old mmap until they reopen).
+
+    Returns:
+        list: Paths of the written files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    groups = {**groups, "rows": int(len(records)), "built_at": int(time.time())}
+    paths = []
+    for name, write in (
+        (ARRAY_FILE, lambda f: np.save(f, records, allow_pickle=False)),
+        (GROUPS_FILE, lambda f: f.write(json.dumps(groups).encode('utf-8'))),
+    ):
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        path = os.path.join(directory, name)
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def upload_index(s3_client, bucket:str, etag:str=None, directory:str=COMPARABLES_DIR, prefix:str=COMPARABLES_PREFIX):
+    """
+    Uploads the local index as the shared copy for workers and hosts that didn't build it.
+
+    The write is conditional: it only succeeds if the shared copy still has `etag` (the one
+    `download_index` returned), or with no `etag` if there is none yet. Otherwise botocore
+    raises a ClientError that `storage.is_precondition_failed` recognises.
+    """
+    bundle = io.BytesIO()
+    with tarfile.open(fileobj=bundle, mode='w') as tar:
+        for name in (ARRAY_FILE, GROUPS_FILE):
+            tar.add(os.path.join(directory, name), arcname=name)
+    key = f"{prefix}/{BUNDLE_FILE}"
+    s3_client.put_object(Bucket=bucket, Key=key, Body=bundle.getvalue(), **storage.write_condition(etag))
+    print(f"comparables index uploaded to {bucket}/{key}")
+
+
+def download_index(s3_client, bucket:str, directory:str=COMPARABLES_DIR, prefix:str=COMPARABLES_PREFIX)->str:
+    """
+    Fetches the shared copy of the index into `directory`.
+
+    Only a missing shared copy returns None; any other S3 error is raised, so a failed read
+    never lets a run rebuild and upload over the shared index.
+
+    Returns:
+        str: ETag of the shared copy, or None if there is none yet.
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=f"{prefix}/{BUNDLE_FILE}")
+    except botocore.exceptions.ClientError as e:
+        if storage.is_not_found(e):
+            return None
+        raise
+    body = response['Body'].read()
+
+    os.makedirs(directory, exist_ok=True)
+    with tarfile.open(fileobj=io.BytesIO(body), mode='r') as tar:
+        for name in (ARRAY_FILE, GROUPS_FILE):
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(tar.extractfile(name).read())
+            os.replace(tmp_path, os.path.join(directory, name))
+    return response['ETag']
+
+
+class ComparablesIndex:
+    """
+    Read-only view of a saved index. The array is memory-mapped, so opening it costs the same
+    for 1k or 10M sales and processes share the pages.
+
+    Example:
+        index = ComparablesIndex.open()
+        index.nearest("Porsche", "911", year=2012, mileage=40_000, k=5)
+    """
+    def __init__(self, records:np.ndarray, groups:dict):
+        self.records = records
+        self.groups = groups
+
+    @classmethod
+    def open(cls, directory:str=COMPARABLES_DIR):
+        records = np.load(os.path.join(directory, ARRAY_FILE), mmap_mode='r', allow_pickle=False)
+        with open(os.path.join(directory, GROUPS_FILE)) as f:
+            groups = json.load(f)
+        return cls(records, groups)
+
+    def nearest(self, make:str, model:str, year:int, mileage:int=None, k:int=5)->list:
+        """
+        Returns up to `k` sales of the same make and model, closest in year and mileage first.
+
+        Distance is |year difference| * YEAR_WEIGHT_MILES + |mileage difference|, in miles.
+
+        Returns:
+            list: dicts with auction_id, year, mileage, price, auction_time and distance.
+        """
+        bounds = self.groups["slices"].get(group_key(make, model))
+        if not bounds:
+            return []
+        group = self.records[bounds[0]:bounds[1]]
+
+        # rows are sorted by year inside the group: look at nearby years only, unless
+        # that leaves fewer than k candidates
+        years = group["year"]
+        start, end = np.searchsorted(years, [year - MAX_YEAR_GAP, year + MAX_YEAR_GAP + 1])
+        if end - start < k:
+            start, end = 0, len(group)
+        candidates = group[start:end]
+
+        distance = np.abs(candidates["year"].astype(np.int64) - year) * YEAR_WEIGHT_MILES
+        if mileage is None:
+            distance += MISSING_MILEAGE_MILES
+        else:
+            miles = candidates["mileage"].astype(np.int64)
+            distance += np.where(miles < 0, MISSING_MILEAGE_MILES, np.abs(miles - mileage))
+
+        count = min(k, len(candidates))
+        if count == 0:
+            return []
+        nearest = np.argpartition(distance, count - 1)[:count]
+        nearest = nearest[np.argsort(distance[nearest], kind='stable')]
+        return [
+            {
+                "auction_id": candidates["auction_id"][i].decode('utf-8'),
+                "year": int(candidates["year"][i]),
+                "mileage": None if candidates["mileage"][i] < 0 else int(candidates["mileage"][i]),
+                "price": int(candidates["price"][i]),
+                "auction_time": int(candidates["auction_time"][i]),
+                "distance": int(distance[i]),
+            }
+            for i in nearest
+        ]
+
+
+def refresh_index(conn, staging_table:str=None, directory:str=COMPARABLES_DIR)->dict:
+    """
+    Rebuilds the comparables index from the warehouse, or, with a `staging_table` and an
+    existing index, merges in just the auctions that run loaded.
+
+    Returns:
+        dict: {"rows": int, "groups": int, "incremental": bool}
+    """
+    existing = None
+    if staging_table and os.path.exists(os.path.join(directory, ARRAY_FILE)):
+        existing = ComparablesIndex.open(directory)
+
+    if existing is None:
+        keys, records, _ = fetch_sold_auctions(conn)
+        records, groups = build_index(keys, records)
+    else:
+        keys, records, staged_ids = fetch_sold_auctions(conn, staging_table)
+        records, groups = merge_index(existing, keys, records, staged_ids)
+
+    save_index(records, groups, directory)
+    result = {"rows": int(len(records)), "groups": len(groups["keys"]), "incremental": existing is not None}
+    print(f"comparables index: {result['rows']} sale(s) in {result['groups']} make/model group(s)"
+          f"{' (incremental)' if result['incremental'] else ''}")
+    return result
+
+
+def sync_index(conn, s3_client, bucket:str, staging_table:str=None, directory:str=COMPARABLES_DIR,
+               prefix:str=COMPARABLES_PREFIX, attempts:int=COMPARABLES_UPDATE_ATTEMPTS)->dict:
+    """
+    Merges a run's sold auctions into the shared index in S3 (see `refresh_index`).
+
+    The shared copy is downloaded first. Without one, the local copy may be stale, so the index
+    is rebuilt from the warehouse. When another run uploads while this one merges, the
+    conditional upload fails and the merge is redone on top of the other run's index.
+
+    Returns:
+        dict: {"rows": int, "groups": int, "incremental": bool}
+    """
+    for attempt in range(attempts):
+        etag = download_index(s3_client, bucket, directory, prefix)
+        results = refresh_index(conn, staging_table if etag else None, directory)
+        try:
+            upload_index(s3_client, bucket, etag, directory, prefix)
+            return results
+        except botocore.exceptions.ClientError as e:
+            if not storage.is_precondition_failed(e):
+                raise
+        print(f"{bucket}/{prefix}/{BUNDLE_FILE} was updated by another run, retrying")
+        time.sleep(random.uniform(0, 0.05 * 2**attempt))
+    raise RuntimeError(f"could not update {bucket}/{prefix}/{BUNDLE_FILE} after {attempts} attempts")
@@ -0,0 +1,144 @@
+import os, hashlib, threading, weakref
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import psycopg2
+from psycopg2 import pool, extras
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+DB_USER = os.getenv('DB_USER')
+DB_PASSWORD = os.getenv('DB_PASSWORD')
+DB_HOST = os.getenv('DB_HOST')
+DB_PORT = os.getenv('DB_PORT')
+DB_NAME = os.getenv('DB_NAME')
+
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 4))
+# session settings of every pooled connection. The manifest records files as loaded once the
+# warehouse load commits, so that commit must be durable: an asynchronous commit lost in a crash
+# would leave the files marked loaded but missing from the warehouse. The staging inserts turn it
+# off for their own transaction (pipeline.load_keys_to_staging). work_mem covers the staging joins/sorts.
+DB_SYNCHRONOUS_COMMIT = os.getenv('DB_SYNCHRONOUS_COMMIT', 'on')
+DB_WORK_MEM = os.getenv('DB_WORK_MEM', '64MB')
+DB_BATCH_SIZE = int(os.getenv('DB_BATCH_SIZE', 1000))
+DB_MAX_PREPARED = 50
+
+_lock = threading.Lock()
+_pools = {}
+# names of the statements already prepared on each connection
+_prepared = weakref.WeakKeyDictionary()
+# pool each borrowed connection belongs to
+_owners = weakref.WeakKeyDictionary()
+
+
+def env_dsn()->str:
+    """
+    DSN built from the DB_* variables in ~/airflow/.env.
+    """
+    return psycopg2.extensions.make_dsn(
+        dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT
+    )
+
+
+def session_options()->str:
+    return f"-c synchronous_commit={DB_SYNCHRONOUS_COMMIT} -c work_mem={DB_WORK_MEM}"
+
+
+def get_pool(dsn:str=None)->pool.ThreadedConnectionPool:
+    """
+    Returns the connection pool of `dsn` (default: `env_dsn()`), creating it on first use.
+
+    Pools live for the whole process, so every task run by the same worker process reuses
+    the same connections instead of connecting (and authenticating) again.
+    """
+    dsn = dsn or env_dsn()
+    with _lock:
+        if dsn not in _pools:
+            _pools[dsn] = pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, dsn, options=session_options())
+        return _pools[dsn]
+
+
+def getconn(dsn:str=None):
+    """
+    Borrows a connection from the pool of `dsn`. Give it back with `putconn`.
+    """
+    connection_pool = get_pool(dsn)
+    conn = connection_pool.getconn()
+    _owners[conn] = connection_pool
+    return conn
+
+
+def putconn(conn):
+    """
+    Returns a borrowed connection to its pool, rolling back an unfinished transaction.
+    Broken connections are closed instead of reused.
+    """
+    if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+    _owners.pop(conn).putconn(conn, close=bool(conn.closed))
+
+
+@contextmanager
+def connection(dsn:str=None):
+    """
+    Borrows a connection from the pool of `dsn` and gives it back afterwards.
+
+    A transaction left open (e.g. because the block raised) is rolled back; broken
+    connections are closed instead of returned to the pool.
+
+    Example:
+        with db.connection(dsn) as conn:
+            pipeline.run_sql_file(conn, 'create_tables.sql')
+    """
+    conn = getconn(dsn)
+    try:
+        yield conn
+    finally:
+        putconn(conn)
+
+
+def close_pools():
+    with _lock:
+        for connection_pool in _pools.values():
+            connection_pool.closeall()
+        _pools.clear()
+
+
+def statement_name(query:str)->str:
+    # stable, short and valid as an identifier, whatever the query (or table name) is
+    return "stmt_" + hashlib.md5(query.encode('utf-8')).hexdigest()[:16]
+
+
+def prepare(cursor, query:str)->str:
+    """
+    Prepares `query` (with $1..$n placeholders) once per connection and returns its name.
+    """
+    name = statement_name(query)
+    prepared = _prepared.setdefault(cursor.connection, set())
+    if name not in prepared:
+        if len(prepared) >= DB_MAX_PREPARED:
+            # e.g. inserts into the staging tables of many earlier runs
+            cursor.execute("DEALLOCATE ALL")
+            prepared.clear()
+        cursor.execute(f"PREPARE {name} AS {query}")
+        prepared.add(name)
+    return name
+
+
+def execute_prepared(cursor, query:str, rows:list, page_size:int=DB_BATCH_SIZE):
+    """
+    Runs a prepared `query` for every row, sending `page_size` EXECUTEs per round trip.
+
+    Args:
+        cursor: psycopg2 cursor.
+        query (str): Statement with $1..$n placeholders, e.g. "INSERT INTO t (a, b) VALUES ($1, $2)".
+        rows (list): One tuple of n parameters per execution.
+    """
+    if not rows:
+        return
+    param_count = len(rows[0])
+    name = prepare(cursor, query)
+    execute = f"EXECUTE {name} ({', '.join(['%s'] * param_count)})"
+    extras.execute_batch(cursor, execute, rows, page_size=page_size)
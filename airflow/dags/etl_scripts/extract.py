@@ -4,6 +4,8 @@ import os
 import boto3
 import json
 
+from etl_scripts import s3_cache
+
 script_dir = os.path.dirname(os.path.abspath(__file__))
 env_file_path = os.path.expanduser("~/airflow/.env")
 load_dotenv(dotenv_path=env_file_path)
@@ -16,7 +18,7 @@ RAW_AUCTIONS_BUCKET = os.getenv('RAW_AUCTIONS_BUCKET')
 
 def read_auction_file(object_key:str)->dict:
     """
-    Reads and parses a JSON auction file from an S3 bucket.
+    Reads and parses a JSON auction file from an S3 bucket (through the local S3 cache).
 
     Connects to AWS S3 using credentials defined in the environment,
     retrieves the object specified by `object_key` from the RAW_AUCTIONS_BUCKET,
@@ -34,7 +36,7 @@ def read_auction_file(object_key:str)->dict:
         aws_access_key_id = AWS_ACCESS_KEY_ID,
         aws_secret_access_key = AWS_SECRET_ACCESS_KEY
     )
-    response = s3.get_object(Bucket=RAW_AUCTIONS_BUCKET, Key=object_key)
+    response = s3_cache.get_object(s3, RAW_AUCTIONS_BUCKET, object_key)
     content = response['Body'].read().decode('utf-8')
     data = json.loads(content)
     return data
@@ -5,10 +5,15 @@ import numpy as np
 from dotenv import load_dotenv
 import psycopg2
 from sqlalchemy import create_engine
-from airflow.providers.postgres.hooks.postgres import PostgresHook
 import psycopg2
 from psycopg2 import sql
 
+from etl_scripts import schema
+from etl_scripts import db
+from etl_scripts import ndjson
+from etl_scripts import s3_cache
+from etl_scripts import storage
+
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 env_file_path = os.path.expanduser("~/airflow/.env")
@@ -28,14 +33,9 @@ DB_NAME = os.getenv('DB_NAME')
 
 
 def enforce_column_types(df):
-    # df['auction_date'] = pd.to_datetime(df['auction_date'], errors='coerce')
-    numeric_cols = ['mileage', 'bid_count', 'highest_bid_value', 'manufacture_year', 'max_bid', 'min_bid']
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    df['reserve_met'] = df['reserve_met'].astype(bool)
-    return df
-
-def load_to_s3(s3_client, bucket, df)->list:
+    return schema.apply_schema(df)
+
+def load_to_s3(s3_client, bucket, df, object_keys:pd.Series=None)->list:
     """
     Uploads a cleaned DataFrame to an S3 bucket in NDJSON format, grouped by auction date.
 
@@ -43,7 +43,8 @@ def load_to_s3(s3_client, bucket, df)->list:
     and for each group:
       - Writes the group as NDJSON to memory.
       - Checks if a corresponding object (file) already exists in the S3 bucket.
-        - If it exists: reads existing data, appends the new group data, and writes the merged data back to S3.
+        - If it exists: reads existing data, appends the new group data, and writes the merged data back to S3
+          (the upload is skipped when the merged file is identical to the existing one).
         - If it does not exist: uploads the new group data directly.
     
     Parameters:
@@ -55,103 +56,146 @@ def load_to_s3(s3_client, bucket, df)->list:
         The name of the target S3 bucket.
 
     df : pandas.DataFrame
-        The cleaned DataFrame containing an 'auction_date' column in datetime format.
-        The function creates a temporary column 'auction_saving_date' (date-only) to group the data.
+        The cleaned DataFrame containing an 'auction_date' column in datetime format,
+        with the processed schema applied (see `etl_scripts.schema`).
+
+    object_keys : pandas.Series, optional
+        Target object key of every row (aligned on df's index), e.g. from
+        `auction_index.route_auctions`. Defaults to the day file of each row's auction_date.
     
     Returns:
         - a list of uploaded objects keys
     """
     uploaded_objects = []
-    def check_object_exists(bucket,object_key):
+    def get_object_etag(bucket,object_key):
+        # ETag of the existing object, or None if there is none (other errors must not look
+        # like a missing file, which would be overwritten with the new group only)
         try:
             response = s3_client.head_object(Bucket=bucket, Key=object_key)
-            return True
+            return response['ETag']
         except botocore.exceptions.ClientError as e:
-            return False
+            if storage.is_not_found(e):
+                return None
+            raise
         
 
-    # group the df by auction_saving_date
-    df['auction_saving_date'] = df['auction_date'].dt.date
-    for auction_day, group in df.groupby('auction_saving_date'):
-        # create object key
-        group_object_key = f'{auction_day}.json'
-
-        ndjson_str = group.to_json(orient='records', lines=True)
-        new_data = [json.loads(line) for line in ndjson_str.splitlines()]
-
+    # group the df by auction day (or by the given target file)
+    if object_keys is None:
+        object_keys = df['auction_date'].dt.date.astype(str) + '.json'
+    for group_object_key, group in df.groupby(object_keys):
 
         # check if key exists in bucket
-        if check_object_exists(bucket, group_object_key):
-            response = s3_client.get_object(Bucket=bucket, Key=group_object_key)
-            existing_data = [json.loads(line) for line in response['Body'].read().decode('utf-8').splitlines()]
+        existing_etag = get_object_etag(bucket, group_object_key)
+        if existing_etag:
+            response = s3_cache.get_object(s3_client, bucket, group_object_key, etag=existing_etag)
+            existing_body = response['Body'].read()
+            existing_data = ndjson.decode_records(existing_body)
 
             # combine existing and new auction data
-            combined_data = existing_data + new_data
+            # the existing records come back from JSON, so they get the schema applied;
+            # the new group already has it and only needs it restored after concat
+            existing_df = enforce_column_types(pd.DataFrame(existing_data).drop(columns=['auction_saving_date'], errors='ignore'))
+            merged_df = enforce_column_types(pd.concat([group, existing_df], ignore_index=True))
 
-            # create df
             # sort data by auction_date in desc order
-            # drop duplicates based on auction_id
-            df = pd.DataFrame(combined_data)
-            df = enforce_column_types(df) 
-            df = df.drop(columns=['auction_saving_date']).sort_values('auction_date', ascending=False).reset_index(drop=True)
-            df = df.drop_duplicates('auction_id', keep='first')
-
-
-            # upload updated data back to s3
-            ndjson_str = "\n".join(json.dumps(record) for record in df.to_dict(orient='records'))
-            s3_client.put_object(Bucket=bucket, Key=group_object_key, Body=ndjson_str.encode('utf-8'), ContentType='application/json')
+            # drop duplicates based on auction_id (the new record wins when the dates are equal)
+            merged_df = merged_df.sort_values('auction_date', ascending=False, kind='stable').reset_index(drop=True)
+            merged_df = merged_df.drop_duplicates('auction_id', keep='first')
+
+            # upload updated data back to s3, unless the merge changed nothing
+            body = ndjson.encode_frame(merged_df)
+            if body == existing_body:
+                print(f"{group_object_key} unchanged, skipping upload")
+                uploaded_objects.append(group_object_key)
+                continue
+            s3_cache.put_object(s3_client, bucket, group_object_key, body, ContentType='application/json')
             uploaded_objects.append(group_object_key)
 
         else:
-            ndjson_str = "\n".join(json.dumps(record) for record in new_data)
-            s3_client.put_object(Bucket=bucket, Key=group_object_key, Body=ndjson_str, ContentType='application/json')
+            body = ndjson.encode_frame(group)
+            s3_cache.put_object(s3_client, bucket, group_object_key, body, ContentType='application/json')
             uploaded_objects.append(group_object_key)
 
     return uploaded_objects
 
 def psycopg_connection(user:str,password:str,host:str,port:int,db_name:str):
-    connection = psycopg2.connect(
-        dbname=db_name,
-        user=user,
-        password=password,
-        host=host,
-        port=port
-        
-    )
+    # borrowed from the process-wide pool (etl_scripts.db); close_psycopg_connection gives it back
+    dsn = psycopg2.extensions.make_dsn(dbname=db_name, user=user, password=password, host=host, port=port)
+    connection = db.getconn(dsn)
     cursor = connection.cursor()
     return connection, cursor
 
 def close_psycopg_connection(conn, cursor):
     cursor.close()
-    conn.close()
-
-def load_to_postgres(df, conn, cursor):
-        insert_columns = [
-            "auction_date","auction_id","vin","seller_type","reserve_status","reserve_met","auction_status",
-            "auction_title","auction_subtitle","make","model","exterior_color","interior_color",
-            "body_style","mileage","engine","drivetrain","transmission","transmission_type", "gears",
-            "title_status_cleaned","title_state","city","state","bid_count", "view_count", "watcher_count",
-            "highest_bid_value","max_bid","min_bid","mean_bid","median_bid","bid_range","bids",
-            "highlight_count","equipment_count","mod_count","flaw_count","service_count","included_items_count",
-            "video_count","manufacture_year","location","auction_url","seller"  
-        ]
-        insert_df = df[insert_columns]
+    db.putconn(conn)
+
+STAGING_INSERT_COLUMNS = [
+    "auction_date","auction_id","vin","seller_type","reserve_status","reserve_met","auction_status",
+    "auction_title","auction_subtitle","make","model","exterior_color","interior_color",
+    "body_style","mileage","engine","drivetrain","transmission","transmission_type", "gears",
+    "title_status_cleaned","title_state","city","state","bid_count", "view_count", "watcher_count",
+    "highest_bid_value","max_bid","min_bid","mean_bid","median_bid","bid_range","bids",
+    "highlight_count","equipment_count","mod_count","flaw_count","service_count","included_items_count",
+    "video_count","manufacture_year","location","auction_url","seller","bid_times","bid_bidders"
+]
+# added after the first processed files were written, so older files may lack them
+LEGACY_STAGING_COLUMNS = ["bid_times", "bid_bidders"]
+
+def load_to_postgres(df, conn, cursor, seen_ids:set=None, commit:bool=True, table:str='staging'):
+        """
+        Inserts processed auctions into a staging table (the run's own table, see
+        `pipeline.staging_table_name`).
+
+        Rows are deduplicated on `auction_id`, keeping the most recent `auction_date`. When the data
+        is loaded in chunks, pass the same `seen_ids` set to every call (newest chunk first) so an
+        auction already inserted by an earlier chunk is skipped; the set is updated in place.
+
+        Args:
+            df (pd.DataFrame): Processed auctions (one day file or chunk).
+            conn: psycopg2 connection.
+            cursor: psycopg2 cursor.
+            seen_ids (set): auction_ids already loaded by earlier chunks (optional).
+            commit (bool): Commit after the insert.
+            table (str): Staging table to insert into.
+
+        Returns:
+            int: Number of rows inserted.
+        """
+        # processed files written before bid_times/bid_bidders existed load them as NULL;
+        # any other missing column means the file doesn't match the staging table
+        missing = [c for c in STAGING_INSERT_COLUMNS if c not in df.columns and c not in LEGACY_STAGING_COLUMNS]
+        if missing:
+            raise ValueError(f"Processed auctions are missing staging columns: {', '.join(missing)}")
+        insert_df = df.reindex(columns=STAGING_INSERT_COLUMNS)
         
-        insert_df = insert_df.replace({np.nan: None})
-        insert_df = insert_df.sort_values('auction_date', ascending=False).reset_index(drop=True)
+        insert_df = insert_df.sort_values('auction_date', ascending=False)
         insert_df = insert_df.drop_duplicates('auction_id', keep='first')
+        if seen_ids is not None:
+            insert_df = insert_df[~insert_df['auction_id'].isin(seen_ids)]
+            seen_ids.update(insert_df['auction_id'].dropna())
+        if insert_df.empty:
+            return 0
+
+        # staging keeps auction_date as epoch milliseconds
+        if pd.api.types.is_datetime64_any_dtype(insert_df['auction_date']):
+            epoch_ms = (insert_df['auction_date'].astype('int64') // 10**6).astype('Int64')
+            insert_df = insert_df.assign(auction_date=epoch_ms.mask(insert_df['auction_date'].isna()))
+
+        # typed columns (categories, nullable ints, arrow strings) -> plain Python values, NA -> None
+        insert_df = insert_df.astype(object).where(insert_df.notna(), None)
 
         data = list(insert_df.itertuples(index=False, name=None))
         query = sql.SQL("INSERT INTO {table} ({columns}) VALUES ({placeholders})").format(
-            table = sql.Identifier('staging'),
-            columns = sql.SQL(", ").join(map(sql.Identifier, insert_columns)),
-            placeholders = sql.SQL(", ").join(sql.Placeholder()*len(insert_columns))
-            
+            table = sql.Identifier(table),
+            columns = sql.SQL(", ").join(map(sql.Identifier, STAGING_INSERT_COLUMNS)),
+            placeholders = sql.SQL(", ").join(sql.SQL(f"${i}") for i in range(1, len(STAGING_INSERT_COLUMNS) + 1))
         )
 
-        cursor.executemany(query, data)    
-        conn.commit()
-        return cursor.rowcount
+        # prepared once per pooled connection, then sent in batches of EXECUTEs
+        db.execute_prepared(cursor, query.as_string(cursor), data)
+        if commit:
+            conn.commit()
+        return len(data)
 
 
 
@@ -0,0 +1,177 @@
+import os, json, time, random, hashlib
+import botocore
+from dotenv import load_dotenv
+
+from etl_scripts import storage
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+MANIFEST_OBJECT_KEY = os.getenv('MANIFEST_OBJECT_KEY', '_manifest.json')
+# times a manifest update is re-applied when another run wrote the manifest in between
+MANIFEST_UPDATE_ATTEMPTS = int(os.getenv('MANIFEST_UPDATE_ATTEMPTS', 10))
+
+
+def empty_manifest()->dict:
+    return {"sources": {}, "rescrapes": {}, "processed": {}}
+
+
+def get_object_etag(s3_client, bucket:str, key:str):
+    """
+    Returns the ETag of an S3 object (without quotes), or None if the object does not exist.
+    Other S3 errors (access denied, throttling, ...) are raised.
+    """
+    try:
+        response = s3_client.head_object(Bucket=bucket, Key=key)
+    except botocore.exceptions.ClientError as e:
+        if storage.is_not_found(e):
+            return None
+        raise
+    return response['ETag'].strip('"')
+
+
+def read_manifest(s3_client, bucket:str, key:str=MANIFEST_OBJECT_KEY)->tuple:
+    """
+    Reads the processing manifest from S3.
+
+    The manifest maps every source object (raw or rescraped) and its ETag to the processed
+    keys it produced, and every processed object to the ETag that was last loaded into Postgres.
+
+    Only a missing manifest starts an empty one; any other S3 error is raised, so a failed
+    read can never be saved back over the recorded entries.
+
+    Args:
+        s3_client: A boto3 S3 client.
+        bucket (str): Bucket holding the manifest (the processed auctions bucket).
+        key (str): Manifest object key.
+
+    Returns:
+        tuple: (manifest dict, its ETag or None if no manifest exists yet)
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except botocore.exceptions.ClientError as e:
+        if storage.is_not_found(e):
+            return empty_manifest(), None
+        raise
+
+    manifest = empty_manifest()
+    manifest.update(json.loads(response['Body'].read().decode('utf-8')))
+    return manifest, response['ETag'].strip('"')
+
+
+def load_manifest(s3_client, bucket:str, key:str=MANIFEST_OBJECT_KEY)->dict:
+    # read-only view; changes go through update_manifest
+    return read_manifest(s3_client, bucket, key)[0]
+
+
+def save_manifest(s3_client, bucket:str, manifest:dict, etag:str=None, key:str=MANIFEST_OBJECT_KEY)->str:
+    """
+    Writes the manifest if the stored one still has `etag` (None: if there is none yet).
+
+    Raises a PreconditionFailed ClientError when another run saved the manifest since it
+    was read; `update_manifest` handles that by re-reading and re-applying its change.
+    """
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'),
+        ContentType='application/json',
+        **storage.write_condition(etag),
+    )
+    return key
+
+
+def update_manifest(s3_client, bucket:str, change, key:str=MANIFEST_OBJECT_KEY, attempts:int=MANIFEST_UPDATE_ATTEMPTS)->dict:
+    """
+    Applies `change` (a function editing the manifest in place, e.g. one `record_*` call)
+    to the current manifest and saves it with a conditional write.
+
+    Runs can update the manifest at the same time: when the write fails because another run
+    saved first, the manifest is read again and `change` re-applied, so no entry is lost.
+
+    Example:
+        manifest.update_manifest(s3_client, bucket, lambda m: manifest.record_loaded(m, loaded_keys))
+
+    Returns:
+        dict: The saved manifest.
+    """
+    for attempt in range(attempts):
+        manifest, etag = read_manifest(s3_client, bucket, key)
+        change(manifest)
+        try:
+            save_manifest(s3_client, bucket, manifest, etag, key)
+            return manifest
+        except botocore.exceptions.ClientError as e:
+            if not storage.is_precondition_failed(e):
+                raise
+        print(f"{bucket}/{key} was updated by another run, retrying")
+        time.sleep(random.uniform(0, 0.05 * 2**attempt))
+    raise RuntimeError(f"could not update {bucket}/{key} after {attempts} attempts")
+
+
+def get_source_entry(manifest:dict, bucket:str, key:str, etag:str):
+    """
+    Returns the recorded transform results for a source object if it was already processed
+    with the same ETag, otherwise None.
+    """
+    if not etag:
+        return None
+    entry = manifest['sources'].get(f"{bucket}/{key}")
+    if entry and entry.get('etag') == etag:
+        return entry
+    return None
+
+
+def record_source(manifest:dict, bucket:str, key:str, etag:str, processed_keys:list, rescrape_urls:list)->dict:
+    manifest['sources'][f"{bucket}/{key}"] = {
+        "etag": etag,
+        "processed_keys": list(processed_keys),
+        "rescrape_urls": list(rescrape_urls),
+        "status": "transformed",
+    }
+    return manifest
+
+
+def urls_fingerprint(urls:list)->str:
+    return hashlib.sha256("\n".join(sorted(urls)).encode('utf-8')).hexdigest()
+
+
+def get_rescrape_entry(manifest:dict, bucket:str, key:str, urls:list, etag:str):
+    """
+    Returns the recorded rescrape if `key` was produced from the same set of urls and
+    has not changed since, otherwise None.
+    """
+    if not etag:
+        return None
+    entry = manifest['rescrapes'].get(f"{bucket}/{key}")
+    if entry and entry.get('etag') == etag and entry.get('urls') == urls_fingerprint(urls):
+        return entry
+    return None
+
+
+def record_rescrape(manifest:dict, bucket:str, key:str, urls:list, etag:str)->dict:
+    manifest['rescrapes'][f"{bucket}/{key}"] = {"etag": etag, "urls": urls_fingerprint(urls)}
+    return manifest
+
+
+def is_loaded(manifest:dict, key:str, etag:str)->bool:
+    """
+    True if the processed object `key` was already loaded into the warehouse with this ETag.
+    """
+    entry = manifest['processed'].get(key)
+    return bool(etag) and entry is not None and entry.get('etag') == etag and entry.get('status') == 'loaded'
+
+
+def record_loaded(manifest:dict, loaded_keys:dict)->dict:
+    """
+    Marks processed objects as loaded.
+
+    Args:
+        manifest (dict): The manifest.
+        loaded_keys (dict): {processed object key: ETag that was loaded}
+    """
+    for key, etag in loaded_keys.items():
+        manifest['processed'][key] = {"etag": etag, "status": "loaded"}
+    return manifest
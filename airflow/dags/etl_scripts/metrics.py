@@ -0,0 +1,258 @@
+import os, time, socket, resource, threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+METRICS_PREFIX = os.getenv('METRICS_PREFIX', 'carsnbids')
+METRICS_TEXTFILE_DIR = os.getenv('METRICS_TEXTFILE_DIR')  # node_exporter textfile collector dir
+STATSD_HOST = os.getenv('STATSD_HOST')
+STATSD_PORT = int(os.getenv('STATSD_PORT', 8125))
+
+_lock = threading.Lock()
+_s3_bytes = {"read": 0, "written": 0}
+recorded_stages = []
+# [record, peak RSS MB seen so far] of every stage still running (nested or in other threads)
+_open_stages = []
+
+
+def reset():
+    """
+    Clears the stages recorded so far. Call at the start of every task.
+    """
+    with _lock:
+        recorded_stages.clear()
+
+
+def _add_s3_bytes(direction:str, count:int):
+    with _lock:
+        _s3_bytes[direction] += count
+
+
+def _s3_snapshot()->tuple:
+    with _lock:
+        return _s3_bytes["read"], _s3_bytes["written"]
+
+
+class _CountingBody:
+    def __init__(self, body):
+        self._body = body
+
+    def read(self, *args, **kwargs):
+        data = self._body.read(*args, **kwargs)
+        _add_s3_bytes("read", len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._body, name)
+
+
+class CountingS3Client:
+    """
+    Wraps an S3 client and counts the bytes read from and written to S3.
+    """
+    def __init__(self, s3_client):
+        self._client = s3_client
+
+    def get_object(self, **kwargs):
+        response = self._client.get_object(**kwargs)
+        response['Body'] = _CountingBody(response['Body'])
+        return response
+
+    def put_object(self, **kwargs):
+        body = kwargs.get('Body', b'')
+        _add_s3_bytes("written", len(body.encode('utf-8') if isinstance(body, str) else body))
+        return self._client.put_object(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def counting(s3_client):
+    if isinstance(s3_client, CountingS3Client):
+        return s3_client
+    return CountingS3Client(s3_client)
+
+
+def reset_peak_rss():
+    # Linux lets a process reset its RSS high-water mark, which gives per-stage peaks.
+    # Within stage() use _start_peak_tracking, which keeps the peaks of enclosing stages.
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb()->float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _start_peak_tracking(record:dict):
+    # the high-water mark is process-wide: fold it into every open stage before clearing it,
+    # so an enclosing stage still sees the peak reached before this one started
+    with _lock:
+        if _open_stages:
+            current = peak_rss_mb()
+            for entry in _open_stages:
+                entry[1] = max(entry[1], current)
+        reset_peak_rss()
+        _open_stages.append([record, 0.0])
+
+
+def _stop_peak_tracking(record:dict)->float:
+    with _lock:
+        for i, (open_record, peak) in enumerate(_open_stages):
+            if open_record is record:
+                del _open_stages[i]
+                return max(peak, peak_rss_mb())
+    return peak_rss_mb()
+
+
+@contextmanager
+def stage(name:str, rows:int=None):
+    """
+    Records wall time, row count, S3 bytes and peak RSS for a block of pipeline code.
+
+    The yielded dict can be updated inside the block, e.g. `m['rows'] = len(df)` when the
+    row count is only known at the end. Repeated stages with the same name (one per file or
+    chunk) are summed into one entry. Stages can be nested: an outer stage's peak RSS covers
+    its inner stages.
+
+    Example:
+        with metrics.stage('clean_and_transform', rows=len(df)) as m:
+            df = transform_module.clean_and_transform(df)
+    """
+    record = {"stage": name, "rows": rows}
+    read_before, written_before = _s3_snapshot()
+    _start_peak_tracking(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = time.perf_counter() - start
+        read_after, written_after = _s3_snapshot()
+        record["seconds"] = round(seconds, 4)
+        record["rows_per_second"] = round(record["rows"] / seconds, 1) if record["rows"] and seconds else None
+        record["s3_bytes_read"] = read_after - read_before
+        record["s3_bytes_written"] = written_after - written_before
+        record["peak_rss_mb"] = round(_stop_peak_tracking(record), 1)
+        with _lock:
+            _record_stage(record)
+
+
+def _record_stage(record:dict):
+    # stages that run once per chunk/file are accumulated into a single entry
+    for existing in recorded_stages:
+        if existing["stage"] == record["stage"]:
+            existing["rows"] = (existing["rows"] or 0) + (record["rows"] or 0)
+            existing["seconds"] = round(existing["seconds"] + record["seconds"], 4)
+            existing["rows_per_second"] = round(existing["rows"] / existing["seconds"], 1) if existing["rows"] and existing["seconds"] else None
+            existing["s3_bytes_read"] += record["s3_bytes_read"]
+            existing["s3_bytes_written"] += record["s3_bytes_written"]
+            existing["peak_rss_mb"] = max(existing["peak_rss_mb"], record["peak_rss_mb"])
+            return
+    recorded_stages.append(record)
+
+
+def summary(stages:list=None)->dict:
+    """
+    Compact per-stage summary, small enough for XCom.
+    """
+    stages = recorded_stages if stages is None else stages
+    return {
+        s["stage"]: {
+            "rows": s["rows"],
+            "s": s["seconds"],
+            "rows_s": s["rows_per_second"],
+            "s3_in": s["s3_bytes_read"],
+            "s3_out": s["s3_bytes_written"],
+            "rss_mb": s["peak_rss_mb"],
+        }
+        for s in stages
+    }
+
+
+def _metric_values(record:dict)->dict:
+    return {
+        "stage_seconds": record["seconds"],
+        "stage_rows": record["rows"],
+        "stage_rows_per_second": record["rows_per_second"],
+        "stage_s3_bytes_read": record["s3_bytes_read"],
+        "stage_s3_bytes_written": record["s3_bytes_written"],
+        "stage_peak_rss_mb": record["peak_rss_mb"],
+    }
+
+
+def write_prometheus_textfile(task:str, stages:list=None, directory:str=METRICS_TEXTFILE_DIR):
+    """
+    Writes the recorded stages as a Prometheus text-format file (for node_exporter's textfile collector).
+
+    Returns:
+        str: Path of the written file, or None if no directory is configured.
+    """
+    if not directory:
+        return None
+    stages = recorded_stages if stages is None else stages
+
+    lines = []
+    for metric in _metric_values(stages[0]) if stages else []:
+        lines.append(f"# TYPE {METRICS_PREFIX}_{metric} gauge")
+        for record in stages:
+            value = _metric_values(record)[metric]
+            if value is not None:
+                lines.append(f'{METRICS_PREFIX}_{metric}{{task="{task}",stage="{record["stage"]}"}} {value}')
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{METRICS_PREFIX}_{task}.prom")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+    return path
+
+
+def send_statsd(task:str, stages:list=None, host:str=STATSD_HOST, port:int=STATSD_PORT):
+    """
+    Sends the recorded stages to StatsD as gauges (fire-and-forget UDP).
+    """
+    if not host:
+        return
+    stages = recorded_stages if stages is None else stages
+
+    packets = []
+    for record in stages:
+        for metric, value in _metric_values(record).items():
+            if value is not None:
+                packets.append(f"{METRICS_PREFIX}.{task}.{record['stage']}.{metric}:{value}|g")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for packet in packets:
+            sock.sendto(packet.encode('utf-8'), (host, port))
+    except OSError as e:
+        print(f"Could not send metrics to statsd: {e}")
+    finally:
+        sock.close()
+
+
+def export(task:str)->dict:
+    """
+    Exports the recorded stages to the configured sinks and returns the XCom summary.
+    """
+    write_prometheus_textfile(task)
+    send_statsd(task)
+    result = summary()
+    for name, values in result.items():
+        print(f"[metrics] {task}.{name}: {values}")
+    return result
@@ -0,0 +1,87 @@
+import json
+import pandas as pd
+
+# orjson is optional (pip install '.[fast]'); the standard library produces the same documents
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Processed day files are NDJSON, one auction per line, in column order:
+#   - datetimes (auction_date) as epoch milliseconds, like DataFrame.to_json
+#   - NaN / NA / NaT as null
+#   - list columns (bids, bid_times, ...) as JSON arrays
+
+
+def _is_missing(value)->bool:
+    return value is None or value is pd.NA or value is pd.NaT or (isinstance(value, float) and value != value)
+
+
+def _column_values(col:pd.Series)->list:
+    # one vectorised conversion per column to plain Python values
+    if pd.api.types.is_datetime64_any_dtype(col):
+        epoch_ms = col.astype('int64') // 10**6
+        return epoch_ms.astype(object).where(col.notna(), None).tolist()
+    if col.dtype == object:
+        # may hold lists, so missing values are checked one by one
+        return [None if _is_missing(value) else value for value in col.tolist()]
+    return col.astype(object).where(col.notna(), None).tolist()
+
+
+def _default(value):
+    # numpy scalars and anything else orjson/json don't know natively
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+if orjson is not None:
+    def _dumps(record:dict)->bytes:
+        return orjson.dumps(record, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    def _loads(body:bytes):
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # day files written before this module (json.dumps over to_dict records) hold bare
+            # NaN tokens for missing numbers, which only the standard library accepts
+            return json.loads(body)
+else:
+    def _dumps(record:dict)->bytes:
+        return json.dumps(record, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    _loads = json.loads
+
+
+def encode_lines(df:pd.DataFrame)->list:
+    """
+    Serializes every row of `df` to one JSON document (bytes, no trailing newline).
+    """
+    columns = list(df.columns)
+    values = [_column_values(df[col]) for col in columns]
+    return [_dumps(dict(zip(columns, row))) for row in zip(*values)]
+
+
+def encode_frame(df:pd.DataFrame)->bytes:
+    """
+    Serializes `df` to NDJSON bytes in a single pass, straight from the columns.
+    """
+    lines = encode_lines(df)
+    return b"\n".join(lines) + b"\n" if lines else b""
+
+
+def decode_records(body)->list:
+    """
+    Parses NDJSON bytes (or str) into a list of dicts with a single JSON parse: JSON strings
+    can't contain raw newlines, so the lines can be joined into one array.
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    body = body.strip()
+    if not body:
+        return []
+    return _loads(b"[" + body.replace(b"\n", b",") + b"]")
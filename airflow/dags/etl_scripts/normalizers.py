@@ -0,0 +1,188 @@
+import os, re, json, tempfile
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+# Text normalizers of low-cardinality columns (transmission, drivetrain, location, ...).
+# They run once per distinct value (`map_unique`) instead of once per row, and their results
+# are kept in a JSON memo across runs: {"version": MEMO_VERSION, "normalizers": {name: {value: result}}}.
+# Leave NORMALIZER_MEMO_PATH empty to disable the memo.
+NORMALIZER_MEMO_PATH = os.path.expanduser(os.getenv('NORMALIZER_MEMO_PATH', '~/airflow/data/normalizer_memo.json'))
+NORMALIZER_MEMO_MAX_ENTRIES = int(os.getenv('NORMALIZER_MEMO_MAX_ENTRIES', 100_000))
+# bump whenever a normalizer's output changes, so memos written by older code are discarded
+MEMO_VERSION = 1
+
+
+def first_line(value):
+    # 'model' and 'seller' carry UI text ('Follow', ...) after a newline
+    if not isinstance(value, str):
+        return None
+    return value.split('\n')[0].strip()
+
+
+def split_title_status(title_status):
+    # 'Clean (CA)' -> ('Clean', 'CA')
+    if not isinstance(title_status, str):
+        return None, None
+    status = re.search(r'^(.*?) \(', title_status)
+    state = re.search(r'\((.*?)\)', title_status)
+    return (status.group(1) if status else None), (state.group(1) if state else None)
+
+
+def extract_city_state(location):
+    if not isinstance(location, str):
+        return None, None
+    parts = location.rsplit(",", 1)
+    if len(parts) == 2:
+        city = parts[0].strip()
+        state = parts[1].strip().split(" ")[0]
+        return city, state
+    return parts[0].strip(), None
+
+
+def clean_transmission(trans_str):
+    if not trans_str or not isinstance(trans_str, str):
+        return None, None
+
+    trans_str = trans_str.lower()
+    transmission_type = 'Other'
+    if 'manual' in trans_str:
+        transmission_type = 'Manual'
+    elif 'auto' in trans_str:
+        transmission_type = 'Automatic'
+
+    match = re.search(r'(\d+)-speed', trans_str)
+    gears = int(match.group(1)) if match else None
+
+    return transmission_type, gears
+
+
+def clean_drivetrain(drive_str):
+    if not drive_str or not isinstance(drive_str, str):
+        return 'Other'
+
+    drive_str = drive_str.lower()
+
+    if '4wd' in drive_str and 'awd' in drive_str:
+        return '4WD/AWD'
+    elif 'front' in drive_str:
+        return 'FWD'
+    elif 'rear' in drive_str:
+        return 'RWD'
+    elif 'awd' in drive_str or 'all-wheel' in drive_str:
+        return 'AWD'
+    elif '4wd' in drive_str or 'four-wheel' in drive_str:
+        return '4WD'
+    else:
+        return 'Other'
+
+
+class NormalizerMemo:
+    """
+    Results of the normalizers for strings seen in earlier runs, keyed by normalizer name.
+
+    Example:
+        memo = NormalizerMemo.load()
+        df['drivetrain'] = map_unique(df['drivetrain'], clean_drivetrain, memo)
+        memo.save()
+    """
+    def __init__(self, path:str=None, entries:dict=None):
+        self.path = path
+        self.entries = entries or {}
+        # results added since loading, per normalizer (what a worker process hands back)
+        self.added = {}
+        self.changed = False
+
+    @classmethod
+    def load(cls, path:str=NORMALIZER_MEMO_PATH):
+        entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    saved = json.load(f)
+            except ValueError:
+                saved = {}
+            if saved.get('version') == MEMO_VERSION:
+                # tuples come back from JSON as lists
+                entries = {
+                    name: {value: tuple(result) if isinstance(result, list) else result for value, result in results.items()}
+                    for name, results in saved.get('normalizers', {}).items()
+                }
+        return cls(path, entries)
+
+    def results(self, name:str)->dict:
+        return self.entries.setdefault(name, {})
+
+    def add(self, name:str, new_results:dict):
+        results = self.results(name)
+        room = NORMALIZER_MEMO_MAX_ENTRIES - len(results)
+        if room <= 0 or not new_results:
+            return
+        added = self.added.setdefault(name, {})
+        for value, result in list(new_results.items())[:room]:
+            results[value] = result
+            added[value] = result
+        self.changed = True
+
+    def save(self):
+        """
+        Writes the memo atomically if anything was added (concurrent writers: the last one wins).
+        """
+        if not self.path or not self.changed:
+            return
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"version": MEMO_VERSION, "normalizers": self.entries}, f)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+
+def map_unique(series:pd.Series, normalizer, memo:NormalizerMemo=None, fields:int=1):
+    """
+    Applies `normalizer` once per distinct value of `series` and maps the results back by
+    factorized code, so the cost follows the number of distinct strings, not rows.
+
+    Args:
+        series (pd.Series): Column to normalize.
+        normalizer: Function of one value; returns a tuple of `fields` values when fields > 1.
+        memo (NormalizerMemo): Optional results of earlier runs, updated with new strings.
+        fields (int): Number of values the normalizer returns.
+
+    Returns:
+        pd.Series, or a tuple of `fields` Series, aligned with `series`.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    known = memo.results(normalizer.__name__) if memo is not None else {}
+    computed = {}
+    results = []
+    for value in uniques:
+        if isinstance(value, str) and value in known:
+            result = known[value]
+        else:
+            result = normalizer(value)
+            if isinstance(value, str):
+                computed[value] = result
+        results.append(result)
+    if memo is not None:
+        memo.add(normalizer.__name__, computed)
+
+    # missing values get the normalizer's result for None, in the last slot (code -1)
+    results.append(normalizer(None))
+    codes = np.asarray(codes)
+    if fields == 1:
+        table = np.empty(len(results), dtype=object)
+        table[:] = results
+        return pd.Series(table[codes], index=series.index, dtype=object)
+
+    columns = []
+    for field in range(fields):
+        table = np.empty(len(results), dtype=object)
+        table[:] = [result[field] for result in results]
+        columns.append(pd.Series(table[codes], index=series.index, dtype=object))
+    return tuple(columns)
@@ -0,0 +1,310 @@
+import os, re, hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from psycopg2 import sql
+
+from etl_scripts import transform as transform_module
+from etl_scripts import load as load_module
+from etl_scripts import manifest as manifest_module
+from etl_scripts import auction_index as auction_index_module
+from etl_scripts import transform_engines
+from etl_scripts import metrics
+from etl_scripts import schema
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sql_dir = os.path.join(os.path.dirname(script_dir), 'sql')
+
+# staging load: threads downloading/decoding processed files, and how many decoded files may
+# wait in memory for the database writer
+LOAD_PREFETCH_WORKERS = int(os.getenv('LOAD_PREFETCH_WORKERS', 4))
+LOAD_PREFETCH_DEPTH = int(os.getenv('LOAD_PREFETCH_DEPTH', 8))
+
+# table the per-run staging tables are created from
+STAGING_TEMPLATE_TABLE = 'staging'
+
+
+def transform_object(s3_client, main_object_key:str, raw_auctions_bucket:str, processed_auctions_bucket:str, engine:str=None)->dict:
+    """
+    Transforms one raw (or rescraped) auction file and uploads the result to the processed bucket.
+
+    Objects that were already transformed with the same ETag are skipped using the manifest.
+
+    Args:
+        s3_client: A boto3 S3 client (or a storage backend from `etl_scripts.storage`).
+        main_object_key (str): Key of the raw auction file.
+        raw_auctions_bucket (str): Bucket holding the raw file.
+        processed_auctions_bucket (str): Bucket receiving the processed day files.
+        engine (str): Transform engine ('pandas' or 'polars', default: TRANSFORM_ENGINE).
+
+    Returns:
+        dict: {"processed_auction_keys": [...], "rescrape_urls": [...]}
+    """
+    processed_auction_keys = []
+    rescrape_urls = []
+
+    if not main_object_key:
+        return {"processed_auction_keys": processed_auction_keys, "rescrape_urls": rescrape_urls}
+
+    engine = transform_engines.get_engine(engine)
+    s3_client = metrics.counting(s3_client)
+
+    # skip objects that were already transformed with the same ETag
+    manifest = manifest_module.load_manifest(s3_client, processed_auctions_bucket)
+    source_etag = manifest_module.get_object_etag(s3_client, raw_auctions_bucket, main_object_key)
+    entry = manifest_module.get_source_entry(manifest, raw_auctions_bucket, main_object_key, source_etag)
+    if entry:
+        print(f"{main_object_key} ({source_etag}) already transformed, skipping")
+        return {"processed_auction_keys": entry['processed_keys'], "rescrape_urls": entry['rescrape_urls']}
+
+    # read file
+    with metrics.stage('read_raw') as m:
+        auction_data = transform_module.load_json_from_s3(s3_client, raw_auctions_bucket, main_object_key, etag=source_etag)
+        m['rows'] = len(auction_data)
+
+    # flatten into per-column lists (only the columns of TRANSFORM_PROJECTION)
+    with metrics.stage('convert_to_columns', rows=len(auction_data)):
+        columns = transform_module.convert_to_columns(auction_data)
+
+    # create df
+    with metrics.stage('create_auction_df', rows=len(auction_data)):
+        df = transform_module.create_auction_df(columns)
+
+    # filter out bad urls
+    with metrics.stage('get_and_remove_invalid_auctions', rows=len(df)):
+        filtered_df, rescrape_urls = engine.get_and_remove_invalid_auctions(df)
+    if not filtered_df.empty:
+        # clean and transform filtered_df
+        with metrics.stage('clean_and_transform', rows=len(filtered_df)):
+            cleaned_df = engine.clean_and_transform(filtered_df)
+
+        def route_and_upload(auction_index)->list:
+            # drop auctions already processed unchanged, send updates to the day file that has them
+            with metrics.stage('route_auctions', rows=len(cleaned_df)):
+                routed_df, object_keys, content_hashes, duplicate_keys = auction_index_module.route_auctions(auction_index, cleaned_df)
+            if routed_df.empty:
+                return duplicate_keys
+
+            # upload transformed auctions to processed auctions bucket
+            with metrics.stage('load_to_s3', rows=len(routed_df)):
+                uploaded_keys = load_module.load_to_s3(
+                    s3_client, processed_auctions_bucket, routed_df, object_keys=object_keys
+                )
+            auction_index.record(routed_df['auction_id'], object_keys, content_hashes)
+            # the files of exact duplicates too: the manifest's loaded ETags skip those already loaded
+            return sorted(set(uploaded_keys) | set(duplicate_keys))
+
+        # redone against the newer index if another transform saved it in the meantime
+        processed_auction_keys = auction_index_module.update(s3_client, processed_auctions_bucket, route_and_upload)
+
+    manifest_module.update_manifest(
+        s3_client, processed_auctions_bucket,
+        lambda manifest: manifest_module.record_source(
+            manifest, raw_auctions_bucket, main_object_key, source_etag, processed_auction_keys, rescrape_urls
+        ),
+    )
+
+    return {"processed_auction_keys": processed_auction_keys, "rescrape_urls": rescrape_urls}
+
+
+def read_processed_file(s3_client, processed_auctions_bucket:str, key:str, etag:str=None)->pd.DataFrame:
+    data = transform_module.load_json_from_s3(s3_client, processed_auctions_bucket, key=key, ndjson=True, etag=etag)
+    return schema.apply_schema(pd.DataFrame(data))
+
+
+def prefetch(executor, func, items:list, depth:int):
+    """
+    Yields `func(item)` for every item, in order, while up to `depth` later items are already
+    being computed on `executor`.
+
+    Only `depth` results are ever held in memory (backpressure), and an exception raised by
+    `func` is re-raised to the consumer when it reaches that item.
+    """
+    items = iter(items)
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= depth:
+            break
+    while pending:
+        result = pending.popleft().result()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            break
+        yield result
+
+
+def load_keys_to_staging(s3_client, processed_auctions_bucket:str, object_keys:list, conn, staging_table:str=STAGING_TEMPLATE_TABLE)->dict:
+    """
+    Loads processed day files into the staging table as a producer/consumer pipeline.
+
+    A thread pool downloads and decodes the next files while the current one is written to
+    Postgres, so total time approaches the slower of S3 and the database instead of their sum.
+    At most LOAD_PREFETCH_DEPTH decoded files are held in memory. Auctions are deduplicated
+    across files through the set of auction_ids already inserted, newest file first.
+    Files whose current ETag is already recorded as loaded in the manifest are skipped, and
+    records the auction index places in another day file (stale copies) are not loaded.
+
+    `staging_table` is the run's own staging table (see `staging_table_name`).
+
+    Returns:
+        dict: {"inserted_rows": int, "loaded_keys": {key: etag}}
+    """
+    s3_client = metrics.counting(s3_client)
+    manifest = manifest_module.load_manifest(s3_client, processed_auctions_bucket)
+
+    with (
+        auction_index_module.opened(s3_client, processed_auctions_bucket, save=False) as auction_index,
+        ThreadPoolExecutor(max_workers=LOAD_PREFETCH_WORKERS, thread_name_prefix='staging-prefetch') as executor,
+    ):
+        # skip processed files whose current version is already in the warehouse
+        etags = executor.map(
+            lambda key: manifest_module.get_object_etag(s3_client, processed_auctions_bucket, key), object_keys
+        )
+        pending_keys = {}
+        for key, etag in zip(object_keys, etags):
+            if manifest_module.is_loaded(manifest, key, etag):
+                print(f"{key} ({etag}) already loaded, skipping")
+                continue
+            pending_keys[key] = etag
+
+        if not pending_keys:
+            return {"inserted_rows": 0, "loaded_keys": {}}
+
+        cursor = conn.cursor()
+        frames = prefetch(
+            executor,
+            lambda key: (key, read_processed_file(s3_client, processed_auctions_bucket, key, pending_keys[key])),
+            sorted(pending_keys, reverse=True),
+            LOAD_PREFETCH_DEPTH,
+        )
+        try:
+            # the staging table is UNLOGGED and rebuilt by rerunning the load, so this commit
+            # needn't wait for the WAL flush (the warehouse load's commit still does)
+            cursor.execute("SET LOCAL synchronous_commit = off")
+            seen_ids = set()
+            inserted_rows = 0
+            with metrics.stage('load_to_staging') as total:
+                while True:
+                    # time spent here is time the database writer sat idle waiting for S3
+                    with metrics.stage('wait_for_download') as m:
+                        key, df = next(frames, (None, None))
+                        m['rows'] = len(df) if df is not None else 0
+                    if df is None:
+                        break
+                    df = auction_index_module.drop_stale_copies(auction_index, df, key)
+
+                    # load to staging table
+                    with metrics.stage('load_to_postgres', rows=len(df)):
+                        inserted_rows += load_module.load_to_postgres(df, conn, cursor, seen_ids=seen_ids, commit=False, table=staging_table)
+                    del df
+
+                conn.commit()
+                total['rows'] = inserted_rows
+            return {"inserted_rows": inserted_rows, "loaded_keys": pending_keys}
+
+        except Exception:
+            conn.rollback()
+            raise
+
+        finally:
+            # stop scheduling downloads and drop the ones not started yet
+            frames.close()
+            executor.shutdown(wait=True, cancel_futures=True)
+            cursor.close()
+
+
+def mark_keys_loaded(s3_client, processed_auctions_bucket:str, loaded_keys:dict):
+    if not loaded_keys:
+        return None
+    manifest_module.update_manifest(
+        s3_client, processed_auctions_bucket, lambda manifest: manifest_module.record_loaded(manifest, loaded_keys)
+    )
+    return list(loaded_keys)
+
+
+def staging_table_name(run_id:str)->str:
+    """
+    Name of the staging table of one DAG run (or CLI load), e.g.
+    'scheduled__2025-01-04T00:00:00+00:00' -> 'staging_scheduled__2025_01_04t00_00_00_00_00'.
+
+    Names longer than Postgres' 63 character limit are shortened with a hash of the run id,
+    so two runs never share a table.
+    """
+    name = f"{STAGING_TEMPLATE_TABLE}_{re.sub(r'[^a-z0-9_]', '_', run_id.lower())}"
+    if len(name) > 63:
+        digest = hashlib.sha1(run_id.encode('utf-8')).hexdigest()[:12]
+        name = f"{name[:50]}_{digest}"
+    return name
+
+
+def run_sql_file(conn, filename:str, staging_table:str=STAGING_TEMPLATE_TABLE, params:dict=None):
+    """
+    Executes one of the scripts in `sql/` and commits.
+
+    `{staging}` in the script is replaced with the (quoted) name of the run's staging table,
+    and `%(name)s` placeholders with the values in `params`. Other braces are left as they are;
+    a literal % has to be written %% when `params` are passed.
+
+    Returns:
+        list: Rows returned by the script's last statement, or None if it returns none.
+    """
+    with open(os.path.join(sql_dir, filename)) as f:
+        query = f.read().replace('{staging}', sql.Identifier(staging_table).as_string(conn))
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        rows = cursor.fetchall() if cursor.description else None
+        conn.commit()
+        return rows
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def load_warehouse_tables(conn, staging_table:str, run_id:str=None)->dict:
+    """
+    Loads the dimension and fact tables from the run's staging table (load_tables.sql).
+
+    The auction_fact partitions the load needs are created first, committed on their own
+    (ensure_partitions.sql): creating one locks auction_fact_default, which a concurrent load
+    that has already read auction_fact would otherwise deadlock against.
+
+    The auctions the load inserts or updates are recorded in auction_changelog under `run_id`
+    (default: the staging table's name), in the same transaction.
+
+    Returns:
+        dict: Per table counts of inserted, updated and unchanged rows, e.g.
+            {"auction_fact": {"inserted": 120, "updated": 3, "unchanged": 877}, "vehicle_dim": {...}}
+    """
+    run_sql_file(conn, 'ensure_partitions.sql', staging_table)
+    rows = run_sql_file(conn, 'load_tables.sql', staging_table, {"run_id": run_id or staging_table}) or []
+    counts = {
+        table: {"inserted": inserted, "updated": updated, "unchanged": unchanged}
+        for table, inserted, updated, unchanged in rows
+    }
+    for table, values in counts.items():
+        print(f"{table}: {values['inserted']} inserted, {values['updated']} updated, {values['unchanged']} unchanged")
+    return counts
+
+
+def refresh_market_stats(conn, staging_table:str=None)->dict:
+    """
+    Updates market_daily_stats and market_monthly_stats.
+
+    With a `staging_table`, only the days (and their months) of the auctions in that run's
+    staging table are recomputed; without one, both tables are rebuilt from auction_fact.
+
+    Returns:
+        dict: {"days_refreshed": int, "months_refreshed": int}
+    """
+    if staging_table:
+        rows = run_sql_file(conn, 'refresh_market_stats.sql', staging_table)
+    else:
+        rows = run_sql_file(conn, 'rebuild_market_stats.sql')
+    days, months = rows[0]
+    print(f"market stats refreshed for {days} day(s) and {months} month(s)")
+    return {"days_refreshed": days, "months_refreshed": months}
@@ -0,0 +1,178 @@
+import os, io, sys, time, cProfile, pstats, tempfile, threading, tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+PROFILE_ENV_VAR = 'CARSNBIDS_PROFILE'
+PROFILE_PREFIX = os.getenv('PROFILE_PREFIX', '_profiles')
+SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.01))
+# each extra traceback frame makes tracemalloc noticeably slower on pandas-heavy code;
+# 1 frame gives the allocating line, raise it to see who called it
+TRACEMALLOC_FRAMES = int(os.getenv('PROFILE_TRACEMALLOC_FRAMES', 1))
+# allocation sites are snapshotted again each time traced memory exceeds the last snapshot by this factor
+SNAPSHOT_GROWTH = float(os.getenv('PROFILE_SNAPSHOT_GROWTH', 1.1))
+ALLOCATION_SITES = 30
+
+# traces of the snapshots themselves
+SNAPSHOT_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+
+
+def profiling_enabled(params:dict=None)->bool:
+    """
+    True if deep profiling is switched on for this run, through the `profile` DAG param
+    or the CARSNBIDS_PROFILE environment variable.
+    """
+    if params and params.get('profile'):
+        return True
+    return os.getenv(PROFILE_ENV_VAR, '').lower() in ('1', 'true', 'yes', 'on')
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stack of one thread at a fixed interval and counts collapsed stacks
+    (`frame;frame;frame count`), the input format of flamegraph.pl and speedscope.
+    """
+    def __init__(self, thread_id:int, interval:float=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self)->str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+class PeakAllocations(threading.Thread):
+    """
+    Keeps the top allocation sites at the traced-memory peak of a task.
+
+    Every `interval` it reads tracemalloc's current traced size; when that exceeds the size at
+    the last snapshot by `growth`, a new snapshot is taken and reduced to its top sites right
+    away. Frames freed by the end of the task still show up, unlike in a snapshot taken there.
+    """
+    def __init__(self, interval:float=SAMPLE_INTERVAL, growth:float=SNAPSHOT_GROWTH, limit:int=ALLOCATION_SITES):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.growth = growth
+        self.limit = limit
+        self.statistics = []
+        self.snapshot_size = 0
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def check(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        if current <= self.snapshot_size * self.growth:
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        self.statistics = snapshot.statistics('traceback')[:self.limit]
+        self.snapshot_size = current
+        del snapshot
+        # the snapshot itself is traced; it must not become the task's peak
+        tracemalloc.reset_peak()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.check()
+
+
+def top_allocations(statistics:list, snapshot_size:int)->str:
+    lines = [f"Top {len(statistics)} allocation sites (by size) at {snapshot_size / 2**20:.1f} MB traced memory", ""]
+    for index, stat in enumerate(statistics, 1):
+        lines.append(f"#{index}: {stat.size / 2**20:.2f} MB in {stat.count} blocks")
+        lines.extend(f"    {line}" for line in stat.traceback.format())
+        lines.append("")
+    return "\n".join(lines)
+
+
+def profile_stats_text(profiler, limit:int=60)->str:
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats('cumulative').print_stats(limit)
+    stats.sort_stats('tottime').print_stats(limit)
+    return out.getvalue()
+
+
+def profile_bytes(profiler)->bytes:
+    # pstats can only dump to a path
+    with tempfile.NamedTemporaryFile(suffix='.prof') as f:
+        profiler.dump_stats(f.name)
+        with open(f.name, 'rb') as dumped:
+            return dumped.read()
+
+
+@contextmanager
+def profile_task(task_name:str, s3_client, bucket:str, prefix:str, enabled:bool=True):
+    """
+    Runs the wrapped block under cProfile, tracemalloc and a stack sampler, then uploads:
+
+        <prefix>/<task_name>.prof               cProfile stats (snakeviz, pstats)
+        <prefix>/<task_name>.stats.txt          top functions by cumulative and own time
+        <prefix>/<task_name>.allocations.txt    top allocation sites at the traced-memory peak
+        <prefix>/<task_name>.collapsed.txt      collapsed stacks for flame graphs
+
+    Does nothing when `enabled` is False, so tasks can always wrap their body with it.
+    """
+    if not enabled:
+        yield
+        return
+
+    sampler = StackSampler(threading.get_ident())
+    allocations = PeakAllocations()
+    profiler = cProfile.Profile()
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    sampler.start()
+    allocations.start()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+        allocations.stop()
+        peak = allocations.peak
+        tracemalloc.stop()
+
+        header = f"{task_name}: {elapsed:.2f}s wall, {peak / 2**20:.1f} MB peak traced memory\n\n"
+        artifacts = {
+            f"{task_name}.prof": profile_bytes(profiler),
+            f"{task_name}.stats.txt": (header + profile_stats_text(profiler)).encode('utf-8'),
+            f"{task_name}.allocations.txt": (header + top_allocations(allocations.statistics, allocations.snapshot_size)).encode('utf-8'),
+            f"{task_name}.collapsed.txt": sampler.collapsed().encode('utf-8'),
+        }
+        for name, body in artifacts.items():
+            key = f"{prefix}/{name}"
+            try:
+                s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+                print(f"profile uploaded to {bucket}/{key}")
+            except Exception as e:
+                print(f"Could not upload profile {key}: {e}")
@@ -0,0 +1,124 @@
+import os, io, hashlib, tempfile
+from dotenv import load_dotenv
+
+from etl_scripts import storage
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+# On-disk cache of downloaded S3 objects, one file per (bucket, key, ETag), so task retries,
+# rescrape transforms, backfills and the staging load of files written earlier in the run
+# read from local disk. Least recently used files are evicted beyond S3_CACHE_MAX_BYTES.
+# Leave S3_CACHE_DIR empty to disable the cache.
+S3_CACHE_DIR = os.path.expanduser(os.getenv('S3_CACHE_DIR', '~/airflow/data/s3-cache'))
+S3_CACHE_MAX_BYTES = int(os.getenv('S3_CACHE_MAX_BYTES', 2 * 2**30))
+
+
+def is_cached_backend(s3_client)->bool:
+    # local and in-memory backends are already local: caching them would only copy the data
+    client = getattr(s3_client, '_client', s3_client)
+    return not isinstance(client, (storage.LocalS3Client, storage.MemoryS3Client))
+
+
+def entry_path(bucket:str, key:str, etag:str, directory:str=S3_CACHE_DIR)->str:
+    digest = hashlib.sha256(f"{bucket}\0{key}\0{etag}".encode('utf-8')).hexdigest()
+    return os.path.join(directory, digest[:2], digest)
+
+
+def store(bucket:str, key:str, etag:str, data:bytes, directory:str=S3_CACHE_DIR, max_bytes:int=S3_CACHE_MAX_BYTES):
+    """
+    Adds an object to the cache (written atomically) and evicts old entries if needed.
+
+    Returns:
+        str: Path of the cached file, or None if the object is larger than the whole cache.
+    """
+    if len(data) > max_bytes:
+        return None
+    path = entry_path(bucket, key, etag.strip('"'), directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    evict(directory, max_bytes)
+    return path
+
+
+def evict(directory:str=S3_CACHE_DIR, max_bytes:int=S3_CACHE_MAX_BYTES)->int:
+    """
+    Deletes the least recently used entries until the cache fits in `max_bytes`.
+
+    Returns:
+        int: Number of entries deleted.
+    """
+    entries = []
+    total = 0
+    for subdir in os.scandir(directory):
+        if not subdir.is_dir():
+            continue
+        for entry in os.scandir(subdir.path):
+            if entry.name.startswith('.tmp-'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    deleted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        deleted += 1
+    return deleted
+
+
+def get_object(s3_client, bucket:str, key:str, etag:str=None, directory:str=S3_CACHE_DIR)->dict:
+    """
+    `s3_client.get_object` through the cache.
+
+    The current ETag comes from `etag` (e.g. the one the manifest already looked up) or a HEAD
+    request. A cached copy is memory-mapped; otherwise the object is downloaded with If-Match
+    on that ETag and cached.
+
+    Returns:
+        dict: {"Body": readable body, "ETag": str, "ContentLength": int}, like boto3's get_object.
+    """
+    if not directory or not is_cached_backend(s3_client):
+        return s3_client.get_object(Bucket=bucket, Key=key)
+
+    if etag is None:
+        etag = s3_client.head_object(Bucket=bucket, Key=key)['ETag']
+    etag = etag.strip('"')
+
+    path = entry_path(bucket, key, etag, directory)
+    try:
+        # the mtime is the LRU clock
+        os.utime(path)
+        body = storage.MmapBody(path)
+    except FileNotFoundError:
+        response = s3_client.get_object(Bucket=bucket, Key=key, IfMatch=f'"{etag}"')
+        data = response['Body'].read()
+        path = store(bucket, key, etag, data, directory)
+        if path is None:
+            return {"Body": io.BytesIO(data), "ETag": f'"{etag}"', "ContentLength": len(data)}
+        body = storage.MmapBody(path)
+    return {"Body": body, "ETag": f'"{etag}"', "ContentLength": body.size}
+
+
+def put_object(s3_client, bucket:str, key:str, body:bytes, directory:str=S3_CACHE_DIR, **kwargs)->dict:
+    """
+    `s3_client.put_object` that also caches what was written, so reading it back later in the
+    run (e.g. the staging load of freshly processed day files) is a local read.
+    """
+    response = s3_client.put_object(Bucket=bucket, Key=key, Body=body, **kwargs)
+    if directory and is_cached_backend(s3_client) and response and response.get('ETag'):
+        store(bucket, key, response['ETag'], body, directory)
+    return response
@@ -0,0 +1,89 @@
+import pandas as pd
+
+# Column dtypes of processed auction data.
+#   - low-cardinality text -> category (one copy of each distinct string)
+#   - free text and ids -> Arrow-backed strings (no per-row Python objects)
+#   - counts and prices -> nullable integers sized to the data, so NaN no longer forces float64
+# List columns (bids, highlights, ...) stay as object.
+CATEGORY_COLUMNS = [
+    "make", "body_style", "drivetrain", "transmission_type", "auction_status", "reserve_status",
+    "seller_type", "state", "title_state", "title_status_cleaned", "exterior_color", "interior_color",
+]
+STRING_COLUMNS = [
+    "auction_id", "auction_url", "auction_title", "auction_subtitle", "vin", "model", "engine",
+    "transmission", "title_status", "location", "city", "seller", "buyer_username",
+    "seller_username", "dougs_take", "ownership_history",
+]
+INTEGER_COLUMNS = {
+    "mileage": "Int32",
+    "bid_count": "Int16",
+    "view_count": "Int32",
+    "watcher_count": "Int32",
+    "highest_bid_value": "Int32",
+    "max_bid": "Int32",
+    "min_bid": "Int32",
+    "bid_range": "Int32",
+    "gears": "Int8",
+    "manufacture_year": "Int16",
+    "highlight_count": "Int16",
+    "equipment_count": "Int16",
+    "mod_count": "Int16",
+    "flaw_count": "Int16",
+    "service_count": "Int16",
+    "included_items_count": "Int16",
+    "video_count": "Int16",
+}
+FLOAT_COLUMNS = {
+    "mean_bid": "Float64",
+    "median_bid": "Float64",
+}
+BOOLEAN_COLUMNS = ["reserve_met"]
+STRING_DTYPE = "string[pyarrow]"
+
+
+def to_auction_date(col:pd.Series)->pd.Series:
+    # processed NDJSON stores auction_date as epoch milliseconds
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col if getattr(col.dt, 'tz', None) is not None else col.dt.tz_localize('UTC')
+    if pd.api.types.is_numeric_dtype(col):
+        return pd.to_datetime(col, unit='ms', utc=True)
+    return pd.to_datetime(col, utc=True)
+
+
+def apply_schema(df:pd.DataFrame)->pd.DataFrame:
+    """
+    Converts the processed auction columns of `df` to their compact dtypes, in place.
+
+    Columns that are missing are ignored and columns that already have the right dtype are
+    left alone, so calling this on an already typed frame is cheap.
+
+    Args:
+        df (pd.DataFrame): Cleaned auctions (from `clean_and_transform`) or processed records read back from S3.
+
+    Returns:
+        pd.DataFrame: The same frame with compact dtypes.
+    """
+    if "auction_date" in df:
+        df["auction_date"] = to_auction_date(df["auction_date"])
+
+    for col in CATEGORY_COLUMNS:
+        if col in df and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+
+    for col in STRING_COLUMNS:
+        if col in df and df[col].dtype != STRING_DTYPE:
+            df[col] = df[col].astype(STRING_DTYPE)
+
+    for col, dtype in {**INTEGER_COLUMNS, **FLOAT_COLUMNS}.items():
+        if col in df and df[col].dtype != dtype:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+
+    for col in BOOLEAN_COLUMNS:
+        if col in df and df[col].dtype != "boolean":
+            df[col] = df[col].astype("boolean")
+
+    return df
+
+
+def memory_mb(df:pd.DataFrame)->float:
+    return round(df.memory_usage(deep=True).sum() / 2**20, 2)
@@ -0,0 +1,163 @@
+import os, pickle, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import pandas as pd
+import pyarrow as pa
+from dotenv import load_dotenv
+
+from etl_scripts import transform as transform_module
+from etl_scripts import normalizers
+from etl_scripts import schema
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+# clean_and_transform on several cores inside one task: the filtered auctions are split into
+# TRANSFORM_SHARDS shards by auction_id, each shard is cleaned in its own process, and the
+# shards come back as Arrow IPC streams in shared memory. 1 (default) keeps the single-process path.
+TRANSFORM_SHARDS = int(os.getenv('TRANSFORM_SHARDS', 1))
+# below this many auctions the process start-up costs more than it saves
+TRANSFORM_SHARD_MIN_ROWS = int(os.getenv('TRANSFORM_SHARD_MIN_ROWS', 20_000))
+
+# input position of every auction, so the shards can be put back in single-process order
+ROW_COLUMN = '_shard_row'
+
+
+def shard_numbers(df:pd.DataFrame, shards:int)->pd.Series:
+    """
+    Shard of every auction. All copies of an auction_id land in the same shard, so each shard's
+    own deduplication is also the global one.
+    """
+    auction_ids = df['auction_url'].map(transform_module.extract_auction_id)
+    return pd.Series(pd.util.hash_array(auction_ids.to_numpy(dtype=object)) % shards, index=df.index)
+
+
+def to_shared_memory(df:pd.DataFrame)->tuple:
+    """
+    Writes `df` as an Arrow IPC stream into a new shared memory block (pickle if Arrow can't
+    convert a column). The reader unlinks it.
+
+    Returns:
+        tuple: (block name, size in bytes, 'arrow' or 'pickle')
+    """
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowException, TypeError, ValueError):
+        table = None
+
+    if table is not None:
+        # measure the stream first, then write it straight into the block
+        def write_stream(sink):
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+        mock = pa.MockOutputStream()
+        write_stream(mock)
+        size, payload_format = mock.size(), 'arrow'
+    else:
+        payload = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        size, payload_format = len(payload), 'pickle'
+
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1), track=False)
+    try:
+        if table is not None:
+            write_stream(pa.FixedSizeBufferWriter(pa.py_buffer(block.buf)))
+        else:
+            block.buf[:size] = payload
+    except Exception:
+        block.close()
+        block.unlink()
+        raise
+    block.close()
+    return block.name, size, payload_format
+
+
+def from_shared_memory(name:str, size:int, payload_format:str)->pd.DataFrame:
+    block = shared_memory.SharedMemory(name=name, track=False)
+    try:
+        payload = bytes(block.buf[:size])
+    finally:
+        block.close()
+        block.unlink()
+
+    if payload_format == 'pickle':
+        return pickle.loads(payload)
+    table = pa.ipc.open_stream(payload).read_all()
+    # list columns (bids, highlights, ...) back to Python lists, as clean_and_transform makes them
+    return pd.DataFrame({
+        name: (
+            pd.Series(column.to_pylist(), dtype=object)
+            if pa.types.is_list(column.type) or pa.types.is_large_list(column.type)
+            else column.to_pandas()
+        )
+        for name, column in zip(table.column_names, table.columns)
+    })
+
+
+def discard_block(name:str):
+    try:
+        block = shared_memory.SharedMemory(name=name, track=False)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def transform_shard(df:pd.DataFrame)->tuple:
+    # runs in a worker process
+    memo = normalizers.NormalizerMemo.load()
+    cleaned = transform_module.clean_and_transform(df, memo)
+    return to_shared_memory(cleaned), memo.added
+
+
+def clean_and_transform(df:pd.DataFrame, shards:int=TRANSFORM_SHARDS, min_rows:int=TRANSFORM_SHARD_MIN_ROWS)->pd.DataFrame:
+    """
+    `transform.clean_and_transform`, on `shards` processes when there are at least `min_rows`
+    auctions.
+
+    The result is identical to the single-process path: shards keep the input order of their
+    rows, and the merged frame is sorted by (auction_date descending, input position), which is
+    what the stable sort of the single-process path produces.
+
+    Args:
+        df (pd.DataFrame): Filtered auctions (from `get_and_remove_invalid_auctions`).
+        shards (int): Number of worker processes.
+        min_rows (int): Smaller inputs are cleaned in this process.
+
+    Returns:
+        pd.DataFrame: Cleaned auctions with the compact schema.
+    """
+    if shards <= 1 or len(df) < min_rows:
+        return transform_module.clean_and_transform(df)
+
+    df = df.assign(**{ROW_COLUMN: range(len(df))})
+    numbers = shard_numbers(df, shards)
+    parts = [df[numbers == shard] for shard in range(shards)]
+    parts = [part for part in parts if not part.empty]
+    del df
+
+    memo = normalizers.NormalizerMemo.load()
+    frames = []
+    # spawn: the task process may run threads, which don't survive a fork
+    with ProcessPoolExecutor(max_workers=len(parts), mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(transform_shard, part) for part in parts]
+        del parts
+        try:
+            for future in futures:
+                block, added = future.result()
+                frames.append(from_shared_memory(*block))
+                for name, results in added.items():
+                    memo.add(name, results)
+        except Exception:
+            # let the running shards finish, then free the blocks nobody will read
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future in futures:
+                if not future.cancelled() and future.exception() is None:
+                    discard_block(future.result()[0][0])
+            raise
+    memo.save()
+
+    merged = pd.concat(frames, ignore_index=True)
+    merged = merged.sort_values(['auction_date', ROW_COLUMN], ascending=[False, True]).reset_index(drop=True)
+    merged = merged.drop(columns=ROW_COLUMN)
+    return schema.apply_schema(merged)
@@ -0,0 +1,228 @@
+import os, io, mmap, fcntl, hashlib, tempfile, threading
+from contextlib import contextmanager
+import boto3, botocore
+
+
+def not_found_error(operation:str, bucket:str, key:str):
+    return botocore.exceptions.ClientError(
+        {"Error": {"Code": "404", "Message": f"Not Found: {bucket}/{key}"}},
+        operation
+    )
+
+
+def precondition_failed_error(operation:str, bucket:str, key:str):
+    return botocore.exceptions.ClientError(
+        {"Error": {"Code": "PreconditionFailed", "Message": f"At least one of the pre-conditions you specified did not hold: {bucket}/{key}"}},
+        operation
+    )
+
+
+def error_code(error:botocore.exceptions.ClientError)->str:
+    return str(error.response.get('Error', {}).get('Code', ''))
+
+
+def is_not_found(error:botocore.exceptions.ClientError)->bool:
+    """
+    True if a ClientError means the object does not exist (GetObject reports NoSuchKey,
+    HeadObject only the status code). Access, throttling and server errors are not.
+    """
+    return error_code(error) in ('404', 'NoSuchKey', 'NotFound')
+
+
+def is_precondition_failed(error:botocore.exceptions.ClientError)->bool:
+    # 412: the object changed since it was read; 409: another conditional write of it is in flight
+    return error_code(error) in ('412', 'PreconditionFailed', '409', 'ConditionalRequestConflict')
+
+
+def write_condition(etag:str=None)->dict:
+    """
+    put_object arguments that only let the write succeed if the object still has `etag`
+    or, with no `etag`, if it does not exist yet (S3 conditional writes).
+
+    Example:
+        s3_client.put_object(Bucket=bucket, Key=key, Body=body, **storage.write_condition(etag))
+    """
+    if etag:
+        return {"IfMatch": f'"{etag.strip(chr(34))}"'}
+    return {"IfNoneMatch": "*"}
+
+
+def check_write_condition(current_etag:str, bucket:str, key:str, IfMatch:str=None, IfNoneMatch:str=None, **kwargs):
+    # raises like S3 when put_object's IfMatch/IfNoneMatch doesn't hold (current_etag None: no object)
+    if IfNoneMatch == '*' and current_etag is not None:
+        raise precondition_failed_error('PutObject', bucket, key)
+    if IfMatch is not None:
+        if current_etag is None:
+            raise not_found_error('PutObject', bucket, key)
+        if IfMatch.strip('"') != current_etag.strip('"'):
+            raise precondition_failed_error('PutObject', bucket, key)
+
+
+def to_bytes(body)->bytes:
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    if hasattr(body, 'read'):
+        return body.read()
+    return bytes(body)
+
+
+class MmapBody:
+    """
+    Read-only, memory-mapped stand-in for botocore's StreamingBody.
+    """
+    def __init__(self, path:str):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._pos = 0
+        self.size = size
+
+    def read(self, amt:int=None)->bytes:
+        if self._mmap is None:
+            return b""
+        end = self.size if amt is None else min(self.size, self._pos + amt)
+        data = self._mmap[self._pos:end]
+        self._pos = end
+        return data
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+class LocalS3Client:
+    """
+    Stores objects under `root/<bucket>/<key>`.
+
+    Implements the subset of the boto3 S3 client used by the pipeline (get_object, put_object,
+    head_object, list_objects_v2), so any function that takes an `s3_client` can run against a
+    local directory. Reads are memory-mapped and ETags are the md5 of the content, as on S3.
+    Conditional writes (IfMatch/IfNoneMatch) hold across processes sharing the directory.
+    """
+    def __init__(self, root:str):
+        self.root = os.path.abspath(os.path.expanduser(root))
+
+    def _path(self, bucket:str, key:str)->str:
+        return os.path.join(self.root, bucket, key)
+
+    def _etag(self, path:str)->str:
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    digest.update(mm)
+        return f'"{digest.hexdigest()}"'
+
+    def head_object(self, Bucket:str, Key:str, **kwargs)->dict:
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise not_found_error('HeadObject', Bucket, Key)
+        return {"ETag": self._etag(path), "ContentLength": os.path.getsize(path)}
+
+    def get_object(self, Bucket:str, Key:str, **kwargs)->dict:
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise not_found_error('GetObject', Bucket, Key)
+        body = MmapBody(path)
+        return {"Body": body, "ETag": self._etag(path), "ContentLength": body.size}
+
+    @contextmanager
+    def _write_lock(self, bucket:str):
+        # serializes the check and the rename of conditional writes (ignored by list_objects_v2)
+        bucket_dir = os.path.join(self.root, bucket)
+        os.makedirs(bucket_dir, exist_ok=True)
+        with open(os.path.join(bucket_dir, '.tmp-write.lock'), 'wb') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def put_object(self, Bucket:str, Key:str, Body, **kwargs)->dict:
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write to a temp file and rename so readers never see a partial object
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(to_bytes(Body))
+        try:
+            with self._write_lock(Bucket):
+                if 'IfMatch' in kwargs or 'IfNoneMatch' in kwargs:
+                    check_write_condition(self._etag(path) if os.path.isfile(path) else None, Bucket, Key, **kwargs)
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return {"ETag": self._etag(path)}
+
+    def list_objects_v2(self, Bucket:str, Prefix:str="", **kwargs)->dict:
+        bucket_dir = os.path.join(self.root, Bucket)
+        contents = []
+        for dirpath, _, filenames in os.walk(bucket_dir):
+            for filename in filenames:
+                if filename.startswith('.tmp-'):
+                    continue
+                key = os.path.relpath(os.path.join(dirpath, filename), bucket_dir).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    contents.append({"Key": key, "Size": os.path.getsize(os.path.join(dirpath, filename))})
+        contents.sort(key=lambda obj: obj['Key'])
+        return {"Contents": contents, "KeyCount": len(contents), "IsTruncated": False}
+
+
+class MemoryS3Client:
+    """
+    In-memory S3 stand-in with the same interface as LocalS3Client.
+    """
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def head_object(self, Bucket:str, Key:str, **kwargs)->dict:
+        if (Bucket, Key) not in self.objects:
+            raise not_found_error('HeadObject', Bucket, Key)
+        data = self.objects[(Bucket, Key)]
+        return {"ETag": f'"{hashlib.md5(data).hexdigest()}"', "ContentLength": len(data)}
+
+    def get_object(self, Bucket:str, Key:str, **kwargs)->dict:
+        if (Bucket, Key) not in self.objects:
+            raise not_found_error('GetObject', Bucket, Key)
+        data = self.objects[(Bucket, Key)]
+        return {"Body": io.BytesIO(data), "ETag": f'"{hashlib.md5(data).hexdigest()}"', "ContentLength": len(data)}
+
+    def put_object(self, Bucket:str, Key:str, Body, **kwargs)->dict:
+        data = to_bytes(Body)
+        with self._lock:
+            if 'IfMatch' in kwargs or 'IfNoneMatch' in kwargs:
+                current = self.objects.get((Bucket, Key))
+                check_write_condition(None if current is None else hashlib.md5(current).hexdigest(), Bucket, Key, **kwargs)
+            self.objects[(Bucket, Key)] = data
+        return {"ETag": f'"{hashlib.md5(data).hexdigest()}"'}
+
+    def list_objects_v2(self, Bucket:str, Prefix:str="", **kwargs)->dict:
+        contents = [
+            {"Key": key, "Size": len(data)}
+            for (bucket, key), data in sorted(self.objects.items())
+            if bucket == Bucket and key.startswith(Prefix)
+        ]
+        return {"Contents": contents, "KeyCount": len(contents), "IsTruncated": False}
+
+
+def get_s3_client(backend:str='s3', root:str=None):
+    """
+    Returns an S3-compatible client for the given storage backend.
+
+    Args:
+        backend (str): 's3' (boto3), 'local' (directory under `root`) or 'memory'.
+        root (str): Root directory for the local backend.
+
+    Returns:
+        An object implementing the boto3 S3 client methods used by the pipeline.
+    """
+    if backend == 's3':
+        return boto3.client('s3')
+    if backend == 'local':
+        if not root:
+            raise ValueError("The local storage backend needs a root directory")
+        return LocalS3Client(root)
+    if backend == 'memory':
+        return MemoryS3Client()
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -1,28 +1,66 @@
-import json,re
+import os,json,re
 import pandas as pd
 import numpy as np
 import boto3
 import json
-
-def load_json_from_s3(s3_client, bucket_name, key,ndjson:bool=False):
+from dotenv import load_dotenv
+
+from etl_scripts import schema
+from etl_scripts import normalizers
+from etl_scripts import ndjson as ndjson_module
+from etl_scripts import s3_cache
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+# Columns `convert_to_columns` keeps from the raw auctions:
+#   full       every field, list fields as lists (what the processed day files have always held)
+#   warehouse  only what clean_and_transform and the staging insert need; free text
+#              (dougs_take, seller_notes, ownership_history, ...) is dropped and list fields
+#              are reduced to their counts at ingest
+TRANSFORM_PROJECTION = os.getenv('TRANSFORM_PROJECTION', 'full')
+
+# list fields that are only ever counted -> name of their count column
+LIST_COUNT_COLUMNS = {
+    "auction_highlights": "highlight_count",
+    "auction_equipment": "equipment_count",
+    "modifications": "mod_count",
+    "known_flaws": "flaw_count",
+    "services": "service_count",
+    "included_items": "included_items_count",
+    "auction_videos": "video_count",
+}
+WAREHOUSE_COLUMNS = {
+    "auction_url", "auction_date", "auction_status", "reserve_status", "seller_type", "vin",
+    "auction_title", "auction_subtitle", "make", "model", "exterior_color", "interior_color",
+    "body_style", "mileage", "engine", "drivetrain", "transmission", "title_status", "location",
+    "seller", "bid_count", "view_count", "watcher_count", "highest_bid_value", "bids", "bid_times",
+    "bid_bidders", *LIST_COUNT_COLUMNS.values(),
+}
+# None keeps every column
+PROJECTIONS = {"full": None, "warehouse": WAREHOUSE_COLUMNS}
+
+def load_json_from_s3(s3_client, bucket_name, key,ndjson:bool=False, etag:str=None):
     """
-    Reads a JSON file from S3 and returns it as a Python object.
+    Reads a JSON file from S3 (through the local S3 cache) and returns it as a Python object.
 
     Parameters:
         bucket_name (str): Name of the S3 bucket
         key (str): Path/key to the JSON file (e.g., 'data/file.json')
         aws_conn_id (str): Optional Airflow connection ID (if using Airflow context)
+        etag (str): Current ETag of the object, if already known (saves a HEAD request)
 
     Returns:
         dict or list: Parsed JSON content
     """
 
 
-    response = s3_client.get_object(Bucket=bucket_name, Key=key)
-    content = response['Body'].read().decode('utf-8')
+    response = s3_cache.get_object(s3_client, bucket_name, key, etag=etag)
+    content = response['Body'].read()
 
     if ndjson:
-        return [json.loads(line) for line in content.splitlines()]
+        return ndjson_module.decode_records(content)
     
     return json.loads(content)
 
@@ -40,17 +78,6 @@ def convert_to_list_dicts(data) -> list:
     Returns:
         list: Flattened auction records with consistent structure
     """
-    
-    def extract_list_field(field_data, list_key=None):
-        """Extracts list from field data with flexible key handling"""
-        if field_data is None:
-            return []
-        if isinstance(field_data, list):
-            return field_data
-        if isinstance(field_data, dict):
-            if list_key:
-                return field_data.get(list_key, [])
-        return []
 
 
     def process_auction(auction, url=None):
@@ -95,9 +122,135 @@ def convert_to_list_dicts(data) -> list:
 
 
 
-def create_auction_df(auctions:list):
+def column_name(key:str)->str:
+    # 'Title Status' -> 'title_status'
+    return key.lower().replace(" ", "_")
+
+
+def extract_list_field(field_data, list_key=None):
+    """Extracts list from field data with flexible key handling"""
+    if field_data is None:
+        return []
+    if isinstance(field_data, list):
+        return field_data
+    if isinstance(field_data, dict):
+        if list_key:
+            return field_data.get(list_key, [])
+    return []
+
+
+def counted(get):
+    # wraps a RAW_FIELDS getter of a list field so it returns the list's length
+    def get_count(auction):
+        value = get(auction)
+        return len(value) if isinstance(value, list) else None
+    return get_count
+
+
+# fields every raw auction has, in output column order (after auction_url)
+RAW_FIELDS = [
+    ("auction_title", lambda auction: auction.get('auction_title')),
+    ("auction_subtitle", lambda auction: auction.get('auction_subtitle')),
+    ("dougs_take", lambda auction: auction.get('dougs_take')),
+    ("auction_highlights", lambda auction: extract_list_field(auction.get('auction_highlights'), list_key='bullet_points')),
+    ("services", lambda auction: extract_list_field(auction.get('services') or auction.get('service_history'), list_key='items')),
+    ("auction_equipment", lambda auction: auction.get('auction_equipment')),
+    ("modifications", lambda auction: auction.get('modifications')),
+    ("known_flaws", lambda auction: auction.get('known_flaws')),
+    ("included_items", lambda auction: auction.get('included_items')),
+    ("ownership_history", lambda auction: auction.get('ownership_history')),
+    ("seller_notes", lambda auction: auction.get('seller_notes')),
+    ("auction_videos", lambda auction: auction.get('auction_videos', [])),
+]
+
+
+def convert_to_columns(data, projection:str=TRANSFORM_PROJECTION)->dict:
+    """
+    Flattens raw auctions straight into per-column lists, without a dict per auction.
+
+    Produces the same columns, in the same order, as `create_auction_df(convert_to_list_dicts(data))`
+    with the 'full' projection. Other projections (see PROJECTIONS) only keep the columns
+    they need and store list fields as counts.
+
+    Args:
+        data: Input auction data (dict or list format)
+            - If dict: {url: {auction_data}}
+            - If list: [{auction_data}]
+        projection (str): Key of PROJECTIONS.
+
+    Returns:
+        dict: {column name: list of values}, ready for `create_auction_df`
+    """
+    if isinstance(data, dict):
+        auctions = [(data[url], url) for url in data]
+    elif isinstance(data, list):
+        auctions = [(auction, None) for auction in data]
+    else:
+        raise ValueError("Input must be dictionary or list")
+
+    keep = PROJECTIONS[projection]
+    count_lists = keep is not None
+    rows = len(auctions)
+    if not rows:
+        return {}
+
+    columns = {}
+    # raw quick fact / stat key -> column name, or None when the projection drops it
+    names = {}
+
+    def kept(name:str)->bool:
+        return keep is None or name in keep
+
+    fixed = []
+    for name, get in RAW_FIELDS:
+        if count_lists and name in LIST_COUNT_COLUMNS:
+            name = LIST_COUNT_COLUMNS[name]
+            get = counted(get)
+        if kept(name):
+            fixed.append((name, get))
+    if kept("auction_url"):
+        columns["auction_url"] = [np.nan] * rows
+    for name, _ in fixed:
+        columns[name] = [np.nan] * rows
+    auction_urls = columns.get("auction_url")
+
+    for i, (auction, url) in enumerate(auctions):
+        if auction_urls is not None:
+            auction_urls[i] = url if url else auction.get('auction_url')
+        for name, get in fixed:
+            columns[name][i] = get(auction)
+
+        auction_stats = auction.get('auction_stats', {}) or {}
+        for section in (auction.get('auction_quick_facts', {}), auction_stats):
+            for key, value in section.items():
+                name = names.get(key, False)
+                if name is False:
+                    name = names[key] = column_name(key) if kept(column_name(key)) else None
+                if name is None:
+                    continue
+                column = columns.get(name)
+                if column is None:
+                    column = columns[name] = [np.nan] * rows
+                column[i] = value
+
+        for key in ('view_count', 'watcher_count'):
+            if key not in auction_stats and kept(key):
+                column = columns.get(key)
+                if column is None:
+                    column = columns[key] = [np.nan] * rows
+                column[i] = 0
+
+    return columns
+
+
+def create_auction_df(auctions):
+    """
+    Builds the auction DataFrame from `convert_to_columns` output (columns already named)
+    or from `convert_to_list_dicts` records.
+    """
+    if isinstance(auctions, dict):
+        return pd.DataFrame(auctions)
     df = pd.DataFrame(auctions)
-    print(df.head(10))
     df.columns = df.columns.str.lower().str.replace(" ","_")
     return df
 
@@ -128,24 +281,60 @@ def get_and_remove_invalid_auctions(df):
     return clean_auctions_df, rescrape_urls
 
 
-def clean_and_transform(df):
+def extract_auction_id(url:str)->str:
+    return url.strip().split("/")[4]
+
+
+def align_bid_details(df):
+    """
+    Cleans bid_times (to epoch ms) and bid_bidders, which stay aligned with the cleaned `bids`.
+    Files scraped before they were captured have neither, and a mismatched list is dropped
+    rather than misattributed.
+    """
+    for col in ('bid_times', 'bid_bidders'):
+        if col not in df:
+            df[col] = None
+
+    bid_times = pd.to_datetime(df['bid_times'].explode(), utc=True, errors='coerce', format='mixed')
+    bid_times = (bid_times.astype('int64') // 10**6).where(bid_times.notna())
+    bid_times = bid_times.groupby(level=0, sort=False).agg(lambda times: [None if pd.isna(t) else int(t) for t in times])
+    df['bid_times'] = [
+        times if isinstance(times, list) and len(times) == len(bids) and any(t is not None for t in times) else None
+        for bids, times in zip(df['bids'], bid_times.reindex(df.index))
+    ]
+    df['bid_bidders'] = [
+        bidders if isinstance(bidders, list) and len(bidders) == len(bids) and any(bidders) else None
+        for bids, bidders in zip(df['bids'], df['bid_bidders'])
+    ]
+    return df
+
+
+def clean_and_transform(df, memo:normalizers.NormalizerMemo=None):
+    """
+    Cleans filtered auctions into the processed schema.
+
+    The low-cardinality text columns (model, seller, title_status, location, transmission,
+    drivetrain) are normalized once per distinct value, reusing `memo` (default: the memo
+    at NORMALIZER_MEMO_PATH, saved again afterwards).
+    """
+    save_memo = memo is None
+    if save_memo:
+        memo = normalizers.NormalizerMemo.load()
 
     # Convert 'auction_date' to datetime
     df['auction_date'] = pd.to_datetime(df['auction_date'],utc=True)
-    df = df.sort_values('auction_date', ascending=False).reset_index(drop=True)
+    # stable, so auctions with the same date keep their input order (see sharding.py)
+    df = df.sort_values('auction_date', ascending=False, kind='stable').reset_index(drop=True)
 
     # extract auction id
-    def extract_auction_id(url:str)->str:
-        return url.strip().split("/")[4]
-
     df['auction_id'] = df['auction_url'].apply(extract_auction_id)
 
 
     # drop duplicates based on auction id
-    df = df.drop_duplicates('auction_id', keep='first')
+    df = df.drop_duplicates('auction_id', keep='first').reset_index(drop=True)
 
     # clean 'model'
-    df['model'] = df['model'].str.split('\n').str[0].str.strip()
+    df['model'] = normalizers.map_unique(df['model'], normalizers.first_line, memo)
 
 
     # Convert 'mileage' to integer
@@ -181,7 +370,7 @@ def clean_and_transform(df):
     df['reserve_met'] = df['auction_status'].str.lower().eq('sold')
 
     # remove 'follow' from seller
-    df['seller'] = df['seller'].str.split('\n').str[0].str.strip()
+    df['seller'] = normalizers.map_unique(df['seller'], normalizers.first_line, memo)
 
     # clean bids
     def clean_bids(bids_list):
@@ -192,71 +381,24 @@ def clean_and_transform(df):
         
     df['bids'] = df['bids'].apply(clean_bids)
 
+    df = align_bid_details(df)
 
-    # Split 'title_status' into 'title_status_clean' and 'title_state'
-    df['title_status_cleaned'] = df['title_status'].str.extract(r'^(.*?) \(')
-    df['title_state'] = df['title_status'].str.extract(r'\((.*?)\)')
 
+    # Split 'title_status' into 'title_status_clean' and 'title_state'
+    df['title_status_cleaned'], df['title_state'] = normalizers.map_unique(
+        df['title_status'], normalizers.split_title_status, memo, fields=2
+    )
 
     # Split 'location' into 'city' and 'state'
-    def extract_city_state(location):
-            if pd.isna(location):
-                return None, None
-            try:
-                parts = location.rsplit(",", 1)
-                if len(parts) == 2:
-                    city = parts[0].strip()
-                    state = parts[1].strip().split(" ")[0]
-                    return city,state
-                else:
-                    return parts[0].strip(), None
-            except Exception:
-                raise
-
-    df[['city','state']] = df['location'].apply(extract_city_state).apply(pd.Series)
-
+    df['city'], df['state'] = normalizers.map_unique(df['location'], normalizers.extract_city_state, memo, fields=2)
 
     # clean transmission
-    def clean_transmission(trans_str):
-        if not trans_str or not isinstance(trans_str, str):
-            return None, None
-
-        trans_str = trans_str.lower()
-        transmission_type = 'Other'
-        if 'manual' in trans_str:
-            transmission_type = 'Manual' 
-        elif 'auto' in trans_str:
-            transmission_type = 'Automatic'
-
-        match = re.search(r'(\d+)-speed', trans_str)
-        gears = int(match.group(1)) if match else None
-
-        return transmission_type, gears
-
-    df['transmission_type'], df['gears'] = zip(*df['transmission'].map(clean_transmission))
-    df['transmission_type'] = df['transmission_type'].astype('object') 
+    df['transmission_type'], df['gears'] = normalizers.map_unique(
+        df['transmission'], normalizers.clean_transmission, memo, fields=2
+    )
 
     # clean drivetrain
-    def clean_drivetrain(drive_str):
-        if not drive_str or not isinstance(drive_str, str):
-            return 'Other'
-
-        drive_str = drive_str.lower()
-
-        if '4wd' in drive_str and 'awd' in drive_str:
-            return '4WD/AWD'
-        elif 'front' in drive_str:
-            return 'FWD'
-        elif 'rear' in drive_str:
-            return 'RWD'
-        elif 'awd' in drive_str or 'all-wheel' in drive_str:
-            return 'AWD'
-        elif '4wd' in drive_str or 'four-wheel' in drive_str:
-            return '4WD'
-        else:
-            return 'Other'
-        
-    df['drivetrain'] = df['drivetrain'].apply(clean_drivetrain)
+    df['drivetrain'] = normalizers.map_unique(df['drivetrain'], normalizers.clean_drivetrain, memo)
 
     # extract bids features
     def extract_bid_features(bids_list):
@@ -288,13 +430,10 @@ def clean_and_transform(df):
     def count_list(x):
         return len(x) if isinstance(x, list) else None
 
-    df['highlight_count'] = df['auction_highlights'].apply(count_list)
-    df['equipment_count'] = df['auction_equipment'].apply(count_list)
-    df['mod_count'] = df['modifications'].apply(count_list)
-    df['flaw_count'] = df['known_flaws'].apply(count_list)
-    df['service_count'] = df['services'].apply(count_list)
-    df['included_items_count'] = df['included_items'].apply(count_list)
-    df['video_count'] = df['auction_videos'].apply(count_list)
+    # (projections other than 'full' already counted them in convert_to_columns)
+    for list_col, count_col in LIST_COUNT_COLUMNS.items():
+        if list_col in df:
+            df[count_col] = df[list_col].apply(count_list)
 
     
     # extract manufacture year
@@ -308,7 +447,11 @@ def clean_and_transform(df):
 
     df['manufacture_year'] = df['auction_url'].apply(extract_manufacture_year)
 
-    return df
+    if save_memo:
+        memo.save()
+
+    # compact dtypes (categories, nullable ints, arrow strings), kept through load_to_s3 and load_to_postgres
+    return schema.apply_schema(df)
 
 
 
@@ -0,0 +1,241 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from dotenv import load_dotenv
+
+from etl_scripts import transform as transform_module
+from etl_scripts import normalizers
+from etl_scripts import sharding
+from etl_scripts import schema
+
+# polars is optional (pip install '.[polars]'); only the polars engine needs it
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+# Engine filtering and cleaning the auction frame, per run: the DAG's `transform_engine`
+# param, `main.py run --engine`, or this default.
+#   pandas  transform.get_and_remove_invalid_auctions + clean_and_transform (optionally sharded)
+#   polars  the same steps as one lazy, multi-threaded polars query
+# Both produce the same cleaned frame, so the processed day files are byte-identical
+# (src/benchmarks/bench_engines.py checks it).
+TRANSFORM_ENGINE = os.getenv('TRANSFORM_ENGINE', 'pandas')
+
+# auction_date as scraped ('Feb 25, 2025 2:30 PM UTC'); other formats go through pandas
+AUCTION_DATE_FORMATS = ['%b %d, %Y %I:%M %p UTC']
+VALID_STATUS_PATTERN = 'sold|reserve not met|cancelled'
+
+
+class PandasEngine:
+    name = 'pandas'
+
+    def get_and_remove_invalid_auctions(self, df:pd.DataFrame)->tuple:
+        return transform_module.get_and_remove_invalid_auctions(df)
+
+    def clean_and_transform(self, df:pd.DataFrame)->pd.DataFrame:
+        return sharding.clean_and_transform(df)
+
+
+def arrow_strings(col:pd.Series)->pa.Array:
+    # values the pandas `.str` accessor would see: strings, everything else null
+    try:
+        return pa.array(col, type=pa.string(), from_pandas=True)
+    except (pa.ArrowException, TypeError):
+        return pa.array([value if isinstance(value, str) else None for value in col], type=pa.string())
+
+
+def arrow_string_lists(col:pd.Series)->pa.Array:
+    # lists of strings; anything else (None, NaN, lists holding non-strings) is null
+    try:
+        return pa.array(col, type=pa.list_(pa.string()), from_pandas=True)
+    except (pa.ArrowException, TypeError):
+        return pa.array(
+            [
+                value if isinstance(value, list) and all(isinstance(item, str) for item in value) else None
+                for value in col
+            ],
+            type=pa.list_(pa.string()),
+        )
+
+
+def arrow_list_lengths(col:pd.Series)->pa.Array:
+    return pa.array([len(value) if isinstance(value, list) else None for value in col], type=pa.int64())
+
+
+def arrow_text(col:pd.Series)->pa.Array:
+    # str() of every value, like Series.astype(str)
+    return pa.array(col.astype(str), type=pa.string())
+
+
+def parse_auction_dates(raw:pd.Series)->pd.Series:
+    """
+    Parses auction_date with polars when every date has one of the known formats, and
+    otherwise the whole column with pandas, as the pandas engine does: pandas infers one
+    format per column, so a file mixing formats (or with an unparseable date) raises in both.
+    """
+    parsed = pl.DataFrame({"auction_date": arrow_strings(raw)}).select(pl.coalesce([
+        pl.col('auction_date').str.to_datetime(format=date_format, strict=False, time_zone='UTC', time_unit='ns')
+        for date_format in AUCTION_DATE_FORMATS
+    ])).to_series()
+    parsed = parsed.to_pandas().set_axis(raw.index)
+    if (parsed.isna() & raw.notna()).any():
+        return pd.to_datetime(raw, utc=True)
+    return parsed
+
+
+class PolarsEngine:
+    """
+    Runs the invalid-auction filter and the parsing, bid feature and count steps of
+    `transform.clean_and_transform` as a lazy polars query.
+
+    The query only sees the columns it derives something from (converted through Arrow);
+    it returns the surviving input rows, in output order, and the derived columns, which are
+    put back on the pandas frame. Untouched columns are never converted, so they keep their
+    exact values. The low-cardinality normalizers and the bid time/bidder alignment are
+    shared with the pandas engine.
+    """
+    name = 'polars'
+
+    def __init__(self):
+        if pl is None:
+            raise ImportError("The polars transform engine needs polars (pip install '.[polars]')")
+
+    def get_and_remove_invalid_auctions(self, df:pd.DataFrame)->tuple:
+        status = pl.Series(values=arrow_strings(df['auction_status']))
+        valid = status.str.to_lowercase().str.contains(VALID_STATUS_PATTERN).fill_null(False).to_numpy()
+        rescrape_urls = df.loc[~valid, 'auction_url'].tolist()
+        return df.loc[valid].copy(), rescrape_urls
+
+    def query(self, df:pd.DataFrame)->"pl.LazyFrame":
+        list_columns = [col for col in transform_module.LIST_COUNT_COLUMNS if col in df]
+        frame = pl.from_arrow(pa.table({
+            "_row": pa.array(np.arange(len(df), dtype=np.int64)),
+            "auction_date": pa.array(parse_auction_dates(df['auction_date'])),
+            "auction_url": arrow_strings(df['auction_url']),
+            "mileage": arrow_strings(df['mileage']),
+            "highest_bid_value": arrow_strings(df['highest_bid_value']),
+            "bid_count": pa.array(df['bid_count'].map(lambda value: None if pd.isna(value) else str(value)), type=pa.string()),
+            "view_count": arrow_text(df['view_count']),
+            "watcher_count": arrow_text(df['watcher_count']),
+            "auction_status": arrow_strings(df['auction_status']),
+            "bids": arrow_string_lists(df['bids']),
+            **{col: arrow_list_lengths(df[col]) for col in list_columns},
+        }))
+
+        def numeric_text(col:str):
+            return pl.col(col).str.replace_all(',', '', literal=True).cast(pl.Float64, strict=False)
+
+        bids = pl.col('bids').list.eval(
+            pl.element().str.replace_all('$', '', literal=True).str.replace_all(',', '', literal=True).cast(pl.Int64, strict=False)
+        )
+        # like clean_bids: a missing list, or one with an unparseable bid, becomes []
+        bids = (
+            pl.when(bids.is_not_null() & ~bids.list.eval(pl.element().is_null()).list.any())
+            .then(bids)
+            .otherwise(pl.lit([], dtype=pl.List(pl.Int64)))
+        )
+        # evaluated after `bids` is replaced by the cleaned list
+        has_features = pl.col('bids').list.len() >= 2
+
+        def feature(expr):
+            return pl.when(has_features).then(expr).otherwise(None).cast(pl.Float64)
+
+        return (
+            frame.lazy()
+            .sort(['auction_date', '_row'], descending=[True, False], nulls_last=True)
+            .with_columns(auction_id=pl.col('auction_url').str.strip_chars().str.split('/').list.get(4, null_on_oob=True))
+            .unique(subset='auction_id', keep='first', maintain_order=True)
+            .with_columns(
+                mileage=pl.col('mileage').str.extract(r'([\d,]+)', 1).str.replace_all(',', '', literal=True).cast(pl.Int64, strict=False),
+                highest_bid_value=pl.col('highest_bid_value').str.replace_all('$', '', literal=True)
+                    .str.replace_all(',', '', literal=True).cast(pl.Float64, strict=False),
+                bid_count=pl.col('bid_count').cast(pl.Float64, strict=False),
+                view_count=numeric_text('view_count').fill_nan(None).fill_null(0).cast(pl.Int64),
+                watcher_count=numeric_text('watcher_count').fill_nan(None).fill_null(0).cast(pl.Int64),
+                auction_status=pl.col('auction_status').str.replace_all('Sold to', 'Sold', literal=True),
+                bids=bids,
+                manufacture_year=pl.col('auction_url').str.strip_chars().str.split('/').list.last()
+                    .str.split('-').list.first().cast(pl.Int64, strict=False),
+            )
+            .with_columns(
+                auction_status=pl.when(pl.col('auction_status') == 'Reserve not met, bid to')
+                    .then(pl.lit('Reserve not met')).otherwise(pl.col('auction_status')),
+            )
+            .with_columns(
+                reserve_met=pl.col('auction_status').str.to_lowercase().eq('sold').fill_null(False),
+                max_bid=feature(pl.col('bids').list.max()),
+                min_bid=feature(pl.col('bids').list.min()),
+                mean_bid=feature(pl.col('bids').list.mean()),
+                median_bid=feature(pl.col('bids').list.median()),
+                bid_range=feature(pl.col('bids').list.max() - pl.col('bids').list.min()),
+                **{count_col: pl.col(list_col) for list_col, count_col in transform_module.LIST_COUNT_COLUMNS.items() if list_col in df},
+            )
+        )
+
+    def clean_and_transform(self, df:pd.DataFrame, memo:normalizers.NormalizerMemo=None)->pd.DataFrame:
+        save_memo = memo is None
+        if save_memo:
+            memo = normalizers.NormalizerMemo.load()
+
+        result = self.query(df).collect()
+        out = df.iloc[result['_row'].to_numpy()].reset_index(drop=True)
+
+        def column(name:str, values=None)->pd.Series:
+            return pd.Series(values if values is not None else result[name].to_pandas(), index=out.index)
+
+        # same columns, in the same order, as transform.clean_and_transform
+        out['auction_date'] = column('auction_date')
+        out['auction_id'] = column('auction_id')
+        out['model'] = normalizers.map_unique(out['model'], normalizers.first_line, memo)
+        out['mileage'] = column('mileage')
+        out['highest_bid_value'] = column('highest_bid_value')
+        out['bid_count'] = column('bid_count')
+        out['view_count'] = column('view_count')
+        out['watcher_count'] = column('watcher_count')
+        out['auction_status'] = column('auction_status')
+        out['reserve_met'] = column('reserve_met')
+        out['seller'] = normalizers.map_unique(out['seller'], normalizers.first_line, memo)
+        out['bids'] = column('bids', result['bids'].to_list())
+        out = transform_module.align_bid_details(out)
+
+        out['title_status_cleaned'], out['title_state'] = normalizers.map_unique(
+            out['title_status'], normalizers.split_title_status, memo, fields=2
+        )
+        out['city'], out['state'] = normalizers.map_unique(out['location'], normalizers.extract_city_state, memo, fields=2)
+        out['transmission_type'], out['gears'] = normalizers.map_unique(
+            out['transmission'], normalizers.clean_transmission, memo, fields=2
+        )
+        out['drivetrain'] = normalizers.map_unique(out['drivetrain'], normalizers.clean_drivetrain, memo)
+
+        for name in ('max_bid', 'min_bid', 'mean_bid', 'median_bid', 'bid_range'):
+            out[name] = column(name)
+        for list_col, count_col in transform_module.LIST_COUNT_COLUMNS.items():
+            if list_col in df:
+                out[count_col] = column(count_col)
+        out['manufacture_year'] = column('manufacture_year')
+
+        if save_memo:
+            memo.save()
+        return schema.apply_schema(out)
+
+
+ENGINES = {
+    'pandas': PandasEngine,
+    'polars': PolarsEngine,
+}
+
+
+def get_engine(name:str=None):
+    """
+    Returns the transform engine called `name` (default: TRANSFORM_ENGINE).
+    """
+    name = name or TRANSFORM_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown transform engine: {name} (choose from {', '.join(ENGINES)})")
+    return ENGINES[name]()
@@ -0,0 +1,60 @@
+import os
+from dotenv import load_dotenv
+
+from etl_scripts import pipeline
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+env_file_path = os.path.expanduser("~/airflow/.env")
+load_dotenv(dotenv_path=env_file_path)
+
+# VIN history (the vehicle_history table): every auction of a VIN in time order. An auction
+# is flagged as a relist when the VIN's previous auction ended at most this many days earlier;
+# changing it only affects VINs refreshed afterwards (rebuild-vehicle-history applies it to all).
+VEHICLE_RELIST_DAYS = int(os.getenv('VEHICLE_RELIST_DAYS', 90))
+
+HISTORY_QUERY = """
+SELECT auction_number, auction_id, auction_time, auction_status, sold, high_bid, mileage,
+    previous_auction_id, days_since_previous, previous_sold, previous_high_bid, is_relist
+FROM vehicle_history
+WHERE vin = %s
+ORDER BY auction_time, auction_id
+"""
+
+HISTORY_COLUMNS = [
+    "auction_number", "auction_id", "auction_time", "auction_status", "sold", "high_bid", "mileage",
+    "previous_auction_id", "days_since_previous", "previous_sold", "previous_high_bid", "is_relist",
+]
+
+
+def refresh_history(conn, staging_table:str=None, relist_days:int=VEHICLE_RELIST_DAYS)->dict:
+    """
+    Updates vehicle_history.
+
+    With a `staging_table`, only the VINs in that run's staging table are recomputed; without
+    one, the table is rebuilt from vehicle_dim and auction_fact.
+
+    Returns:
+        dict: {"vins_refreshed": int, "auctions": int, "relists": int}
+    """
+    params = {"relist_days": relist_days}
+    if staging_table:
+        rows = pipeline.run_sql_file(conn, 'refresh_vehicle_history.sql', staging_table, params)
+    else:
+        rows = pipeline.run_sql_file(conn, 'rebuild_vehicle_history.sql', params=params)
+    vins, auctions, relists = rows[0]
+    print(f"vehicle history refreshed for {vins} VIN(s): {auctions} auction(s), {relists} relist(s)")
+    return {"vins_refreshed": vins, "auctions": auctions, "relists": relists}
+
+
+def lookup(conn, vin:str)->list:
+    """
+    Auction history of one VIN, oldest first (one range of vehicle_history's primary key).
+
+    Returns:
+        list: One dict per auction with the HISTORY_COLUMNS; empty for an unknown VIN.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(HISTORY_QUERY, (vin.strip(),))
+        rows = cursor.fetchall()
+    conn.commit()
+    return [dict(zip(HISTORY_COLUMNS, row)) for row in rows]
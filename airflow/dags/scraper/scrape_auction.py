@@ -49,7 +49,10 @@ def scrape_auction_data(driver, url:str, timeout:int = 30) -> dict:
             'view_count': None,
             'watcher_count': None,
             'auction_date': None,
-            'bids':[]
+            'bids':[],
+            # bid details, aligned with `bids` (same position = same bid, None when missing)
+            'bid_times':[],
+            'bid_bidders':[]
             
         },
         'auction_quick_facts': {
@@ -302,25 +305,36 @@ def scrape_auction_data(driver, url:str, timeout:int = 30) -> dict:
                 print(f"Couldn't click bid history button: {str(e)}")
                 return auction_data
 
-            # Extract bid history
+            # Extract bid history (newest bid first, as listed on the page).
+            # Time and bidder go into lists parallel to `bids` instead of one dict per bid,
+            # which keeps the raw and processed files small.
             bids = []
+            bid_times = []
+            bid_bidders = []
             bid_items = driver.find_elements(By.CSS_SELECTOR, ".thread li.bid")
-            for bid in bid_items:
+            for bid_item in bid_items:
                 try:
-                    bid = bid.find_element(By.CSS_SELECTOR, ".bid-value").text.replace('$', '').replace(',', '')
-                    bids.append(bid)
-                    # bid_data = {
-                    #     # 'bidder': bid.find_element(By.CSS_SELECTOR, ".user").text.strip(),
-                        
-                    #     # 'time': bid.find_element(By.CSS_SELECTOR, ".time").get_attribute("data-full"),
-                    #     # 'is_verified': bool(bid.find_elements(By.CSS_SELECTOR, ".verified")),
-                    #     # 'reputation': bid.find_element(By.CSS_SELECTOR, ".rep").text.replace('Reputation Icon', '').strip()
-                    # }
-                   
+                    bid = bid_item.find_element(By.CSS_SELECTOR, ".bid-value").text.replace('$', '').replace(',', '')
                 except Exception as e:
                     print(f"Error parsing bid: {str(e)}")
                     continue
+
+                try:
+                    bid_time = bid_item.find_element(By.CSS_SELECTOR, ".time").get_attribute("data-full")
+                except NoSuchElementException:
+                    bid_time = None
+                try:
+                    bidder = bid_item.find_element(By.CSS_SELECTOR, ".user").text.strip() or None
+                except NoSuchElementException:
+                    bidder = None
+
+                bids.append(bid)
+                bid_times.append(bid_time)
+                bid_bidders.append(bidder)
+
             auction_data['auction_stats']['bids']=bids
+            auction_data['auction_stats']['bid_times']=bid_times
+            auction_data['auction_stats']['bid_bidders']=bid_bidders
 
         except Exception as e:
             print(f"Error scraping bid history: {str(e)}")
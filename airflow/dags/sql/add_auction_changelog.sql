@@ -0,0 +1,47 @@
+/*
+================================================================
+ One-off migration: auction_changelog
+================================================================
+For warehouses created before loads recorded their changes. load_tables.sql
+needs the table and the auction_change_fields_v view; changes are recorded
+from the first load after this migration.
+*/
+
+CREATE OR REPLACE VIEW auction_change_fields_v AS
+SELECT
+    af.auction_id,
+    af.auction_time,
+    af.row_hash AS auction_hash,
+    vd.row_hash AS vehicle_hash,
+    vd.vin,
+    make_dim.make,
+    model_dim.model,
+    vd.manufacture_year,
+    vd.mileage,
+    asd.status AS auction_status,
+    rsd.status AS reserve_status,
+    af.max_bid AS high_bid,
+    af.bid_count,
+    af.view_count,
+    af.watcher_count
+FROM auction_fact af
+LEFT JOIN vehicle_dim vd ON af.vehicle_id = vd.vehicle_id
+LEFT JOIN vehicle_make_dim make_dim ON vd.make_id = make_dim.id
+LEFT JOIN vehicle_model_dim model_dim ON vd.model_id = model_dim.id
+LEFT JOIN auction_status_dim asd ON af.auction_status = asd.id
+LEFT JOIN reserve_status_dim rsd ON af.reserve_status = rsd.id;
+
+CREATE TABLE IF NOT EXISTS auction_changelog (
+    run_id TEXT NOT NULL,
+    auction_id TEXT NOT NULL,
+    change_type TEXT NOT NULL,
+    auction_time TIMESTAMPTZ,
+    changed_fields TEXT[],
+    before JSONB,
+    after JSONB,
+    captured_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, auction_id)
+);
+
+CREATE INDEX IF NOT EXISTS auction_changelog_captured_at ON auction_changelog USING BRIN (captured_at);
+CREATE INDEX IF NOT EXISTS auction_changelog_auction_id ON auction_changelog (auction_id);
@@ -0,0 +1,20 @@
+/*
+================================================================
+ One-off migration: auction_fact_ids
+================================================================
+For warehouses created before load_tables.sql claimed each auction's
+auction_time in auction_fact_ids. Every auction already loaded keeps the
+auction_time it is stored under, so later loads go on updating that row.
+Run it while no load is running.
+*/
+
+CREATE TABLE IF NOT EXISTS auction_fact_ids (
+    auction_id TEXT PRIMARY KEY,
+    auction_time TIMESTAMPTZ NOT NULL
+);
+
+INSERT INTO auction_fact_ids (auction_id, auction_time)
+SELECT auction_id, MIN(auction_time)
+FROM auction_fact
+GROUP BY auction_id
+ON CONFLICT (auction_id) DO NOTHING;
@@ -0,0 +1,24 @@
+/*
+================================================================
+ One-off migration: bid details in staging and bid_fact
+================================================================
+For warehouses created before individual bids were loaded. Bids of auctions
+loaded earlier only get bid_fact rows (without time and bidder) when their
+day files are loaded again.
+*/
+
+ALTER TABLE staging ADD COLUMN IF NOT EXISTS bid_times BIGINT[];
+ALTER TABLE staging ADD COLUMN IF NOT EXISTS bid_bidders TEXT[];
+
+CREATE TABLE IF NOT EXISTS bid_fact (
+    auction_id TEXT NOT NULL,
+    seq INT NOT NULL,
+    bid_amount INT,
+    bid_time TIMESTAMPTZ,
+    bidder TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (auction_id, seq)
+);
+
+CREATE INDEX IF NOT EXISTS bid_fact_bidder ON bid_fact (bidder);
+CREATE INDEX IF NOT EXISTS bid_fact_bid_time_brin ON bid_fact USING BRIN (bid_time);
@@ -0,0 +1,11 @@
+/*
+================================================================
+ One-off migration: row_hash on vehicle_dim and auction_fact
+================================================================
+For warehouses created before load_tables.sql started skipping unchanged rows.
+Existing rows start with a NULL hash, so each is rewritten once (and gets its
+hash) the next time its auction is loaded.
+*/
+
+ALTER TABLE vehicle_dim ADD COLUMN IF NOT EXISTS row_hash TEXT;
+ALTER TABLE auction_fact ADD COLUMN IF NOT EXISTS row_hash TEXT;
@@ -0,0 +1,30 @@
+/*
+================================================================
+ One-off migration: vehicle_history
+================================================================
+For warehouses created before VIN histories were kept. Run once after
+creating refresh_vehicle_history() (the FUNCTIONS section of
+create_tables.sql), then fill the table with
+`python main.py rebuild-vehicle-history`.
+*/
+
+CREATE TABLE IF NOT EXISTS vehicle_history (
+    vin TEXT NOT NULL,
+    auction_time TIMESTAMPTZ NOT NULL,
+    auction_id TEXT NOT NULL,
+    vehicle_id INT,
+    auction_number INT,
+    auction_status TEXT,
+    sold BOOLEAN,
+    high_bid NUMERIC(12,2),
+    mileage BIGINT,
+    previous_auction_id TEXT,
+    days_since_previous INT,
+    previous_sold BOOLEAN,
+    previous_high_bid NUMERIC(12,2),
+    is_relist BOOLEAN,
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (vin, auction_time, auction_id)
+);
+
+CREATE INDEX IF NOT EXISTS vehicle_history_relists ON vehicle_history (auction_time) WHERE is_relist;
@@ -0,0 +1,7 @@
+
+-- Per-run staging table, named after the run (see pipeline.staging_table_name).
+-- UNLOGGED: staging rows are rebuilt from S3 on a retry, so they don't need WAL.
+-- Recreated from scratch so a retried run starts from an empty table.
+
+DROP TABLE IF EXISTS {staging};
+CREATE UNLOGGED TABLE {staging} (LIKE staging INCLUDING DEFAULTS);
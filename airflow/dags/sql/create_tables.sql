@@ -15,6 +15,17 @@ It contains statements to create the following:
 
 3. Fact Table (auction_fact):
    - Contains aggregated data such as bid counts, highest bid values, and other metrics for each auction entry.
+   - Partitioned by month on auction_time, with a BRIN index on auction_time.
+   - bid_fact holds the individual bids (amount, time, bidder) of each auction.
+
+4. Market Aggregates (market_daily_stats, market_monthly_stats):
+   - Pre-aggregated price, bid and reserve statistics for dashboards.
+
+5. Vehicle History (vehicle_history):
+   - Every auction of a VIN in time order, with relist flags, for relist and flip analysis.
+
+6. Change Feed (auction_changelog):
+   - The auctions each load inserted or updated, with before and after values of key fields.
 */
 
 
@@ -22,6 +33,8 @@ It contains statements to create the following:
 ====================================================================
                     STAGING TABLE
 ====================================================================
+ Template for the per-run staging tables (create_staging.sql); loads
+ never write to it directly.
 */
 
 CREATE TABLE staging (
@@ -59,6 +72,8 @@ CREATE TABLE staging (
     median_bid INT,
     bid_range INT,
     bids INTEGER[], 
+    bid_times BIGINT[],  -- epoch ms, aligned with bids (newest first)
+    bid_bidders TEXT[],  -- aligned with bids
     highlight_count INT,
     equipment_count INT,
     mod_count INT,
@@ -171,6 +186,7 @@ CREATE TABLE vehicle_dim (
     flaw_count INT,
     service_count INT,
     included_items_count INT,
+    row_hash TEXT,  -- md5 of the loaded columns, see load_tables.sql
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(vin, auction_id)
 );
@@ -182,9 +198,12 @@ CREATE TABLE vehicle_dim (
 ====================================================================
 */
 
+-- Partitioned by month on auction_time (partitions are named auction_fact_yYYYYmMM and created
+-- by ensure_auction_fact_partitions() before each load). A partitioned table's primary key must
+-- contain the partition key, hence (auction_id, auction_time).
 CREATE TABLE auction_fact (
-	auction_id TEXT PRIMARY KEY,
-    auction_time TIMESTAMPTZ,
+	auction_id TEXT NOT NULL,
+    auction_time TIMESTAMPTZ NOT NULL,
     vehicle_id INT REFERENCES vehicle_dim(vehicle_id),
     auction_status INT REFERENCES auction_status_dim(id),
     reserve_status INT REFERENCES reserve_status_dim(id),
@@ -205,6 +224,397 @@ CREATE TABLE auction_fact (
     auction_title TEXT,
     auction_subtitle TEXT,
     auction_url TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    row_hash TEXT,  -- md5 of the loaded columns, see load_tables.sql
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (auction_id, auction_time)
+) PARTITION BY RANGE (auction_time);
+
+-- catches rows outside the months created so far; ensure_auction_fact_partitions() moves them out
+CREATE TABLE auction_fact_default PARTITION OF auction_fact DEFAULT;
+
+-- auctions arrive roughly in time order, so a BRIN index is a few pages per partition
+-- and still lets range queries skip most blocks
+CREATE INDEX auction_fact_auction_time_brin ON auction_fact USING BRIN (auction_time);
+
+-- The partitioned primary key has to include auction_time, so it can't keep auction_id unique on
+-- its own. Every auction_id gets its auction_time here first (load_tables.sql): a concurrent load
+-- of the same new auction waits on this key and then reuses the time the first load stored.
+CREATE TABLE auction_fact_ids (
+    auction_id TEXT PRIMARY KEY,
+    auction_time TIMESTAMPTZ NOT NULL
 );
 
+
+-- One row per bid. seq numbers the bids of an auction in the order they were placed
+-- (1 = opening bid), so an auction's bids are one range of the primary key.
+CREATE TABLE bid_fact (
+    auction_id TEXT NOT NULL,
+    seq INT NOT NULL,
+    bid_amount INT,
+    bid_time TIMESTAMPTZ,
+    bidder TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (auction_id, seq)
+);
+
+CREATE INDEX bid_fact_bidder ON bid_fact (bidder);
+-- bids are loaded roughly in time order
+CREATE INDEX bid_fact_bid_time_brin ON bid_fact USING BRIN (bid_time);
+
+
+/*
+====================================================================
+                    MARKET AGGREGATES
+====================================================================
+ Daily and monthly auction statistics for dashboards, keyed by make, model,
+ 5-year band of manufacture year, body style and state. Kept up to date by
+ refresh_market_stats.sql after every load; rebuild_market_stats.sql
+ recomputes them from scratch. Unknown keys are stored as 'unknown'.
+*/
+
+-- one row per auction with the dashboard keys resolved, used to fill the aggregates
+CREATE VIEW market_auction_v AS
+SELECT
+    af.auction_id,
+    af.auction_time,
+    (af.auction_time AT TIME ZONE 'UTC')::date AS auction_day,
+    date_trunc('month', af.auction_time AT TIME ZONE 'UTC')::date AS auction_month,
+    COALESCE(make_dim.make, 'unknown') AS make,
+    COALESCE(model_dim.model, 'unknown') AS model,
+    COALESCE((vd.manufacture_year / 5 * 5)::TEXT || '-' || (vd.manufacture_year / 5 * 5 + 4)::TEXT, 'unknown') AS year_band,
+    COALESCE(bsd.body_style, 'unknown') AS body_style,
+    COALESCE(sd.state_abbr, 'unknown') AS state,
+    asd.status = 'sold' AS sold,
+    rsd.status = 'reserve' AS has_reserve,
+    af.max_bid,
+    af.bid_count,
+    af.view_count
+FROM auction_fact af
+LEFT JOIN vehicle_dim vd ON af.vehicle_id = vd.vehicle_id
+LEFT JOIN vehicle_make_dim make_dim ON vd.make_id = make_dim.id
+LEFT JOIN vehicle_model_dim model_dim ON vd.model_id = model_dim.id
+LEFT JOIN body_style_dim bsd ON vd.body_style_id = bsd.id
+LEFT JOIN state_dim sd ON af.auction_state = sd.id
+LEFT JOIN auction_status_dim asd ON af.auction_status = asd.id
+LEFT JOIN reserve_status_dim rsd ON af.reserve_status = rsd.id;
+
+CREATE TABLE market_daily_stats (
+    auction_day DATE,
+    make TEXT,
+    model TEXT,
+    year_band TEXT,
+    body_style TEXT,
+    state TEXT,
+    auction_count INT,
+    sold_count INT,
+    reserve_auction_count INT,
+    reserve_met_count INT,          -- reserve auctions that sold
+    median_sale_price NUMERIC(12,2),
+    avg_sale_price NUMERIC(12,2),
+    min_sale_price NUMERIC(12,2),
+    max_sale_price NUMERIC(12,2),
+    avg_bid_count NUMERIC(8,2),
+    total_view_count BIGINT,
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (auction_day, make, model, year_band, body_style, state)
+);
+
+CREATE TABLE market_monthly_stats (
+    LIKE market_daily_stats INCLUDING DEFAULTS
+);
+ALTER TABLE market_monthly_stats RENAME COLUMN auction_day TO auction_month;
+ALTER TABLE market_monthly_stats ADD PRIMARY KEY (auction_month, make, model, year_band, body_style, state);
+
+-- "median price of a make/model per month" style queries
+CREATE INDEX market_monthly_stats_make_model ON market_monthly_stats (make, model, auction_month);
+
+
+/*
+====================================================================
+                    VEHICLE HISTORY
+====================================================================
+ The auctions of every VIN in time order, so a car's history (prices,
+ mileage, relists) is one index range instead of a self-join of
+ vehicle_dim and auction_fact. Kept up to date for the VINs of every load
+ by refresh_vehicle_history.sql; rebuild_vehicle_history.sql recomputes it.
+*/
+
+CREATE TABLE vehicle_history (
+    vin TEXT NOT NULL,
+    auction_time TIMESTAMPTZ NOT NULL,
+    auction_id TEXT NOT NULL,
+    vehicle_id INT,
+    auction_number INT,             -- 1 = first auction of the VIN
+    auction_status TEXT,
+    sold BOOLEAN,
+    high_bid NUMERIC(12,2),         -- sale price when sold
+    mileage BIGINT,
+    previous_auction_id TEXT,
+    days_since_previous INT,
+    previous_sold BOOLEAN,
+    previous_high_bid NUMERIC(12,2),
+    is_relist BOOLEAN,              -- previous auction ended at most relist_days earlier
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (vin, auction_time, auction_id)
+);
+
+-- dashboards listing recent relists and flips
+CREATE INDEX vehicle_history_relists ON vehicle_history (auction_time) WHERE is_relist;
+
+
+/*
+====================================================================
+                    CHANGE FEED
+====================================================================
+ One row per auction a load inserted or updated (row_hash changed), with
+ the key fields before and after, so consumers only process deltas.
+ Written by load_tables.sql in the load's transaction; each run's rows are
+ also exported as NDJSON to _changes/ in the processed bucket.
+*/
+
+-- key fields of an auction as the change feed reports them
+CREATE VIEW auction_change_fields_v AS
+SELECT
+    af.auction_id,
+    af.auction_time,
+    af.row_hash AS auction_hash,
+    vd.row_hash AS vehicle_hash,
+    vd.vin,
+    make_dim.make,
+    model_dim.model,
+    vd.manufacture_year,
+    vd.mileage,
+    asd.status AS auction_status,
+    rsd.status AS reserve_status,
+    af.max_bid AS high_bid,
+    af.bid_count,
+    af.view_count,
+    af.watcher_count
+FROM auction_fact af
+LEFT JOIN vehicle_dim vd ON af.vehicle_id = vd.vehicle_id
+LEFT JOIN vehicle_make_dim make_dim ON vd.make_id = make_dim.id
+LEFT JOIN vehicle_model_dim model_dim ON vd.model_id = model_dim.id
+LEFT JOIN auction_status_dim asd ON af.auction_status = asd.id
+LEFT JOIN reserve_status_dim rsd ON af.reserve_status = rsd.id;
+
+CREATE TABLE auction_changelog (
+    run_id TEXT NOT NULL,
+    auction_id TEXT NOT NULL,
+    change_type TEXT NOT NULL,      -- 'insert' or 'update'
+    auction_time TIMESTAMPTZ,
+    changed_fields TEXT[],          -- key fields whose value changed (all of them for inserts)
+    before JSONB,                   -- NULL for inserts
+    after JSONB,
+    captured_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, auction_id)
+);
+
+-- "everything since my last poll" reads
+CREATE INDEX auction_changelog_captured_at ON auction_changelog USING BRIN (captured_at);
+CREATE INDEX auction_changelog_auction_id ON auction_changelog (auction_id);
+
+
+/*
+====================================================================
+                    FUNCTIONS
+====================================================================
+*/
+
+-- Creates the monthly auction_fact partitions covering [from_time, to_time] (UTC months).
+-- Rows for a new month that already sit in the default partition are moved into it.
+-- Returns the number of partitions created.
+-- Safe for concurrent loads: creation is serialized by an advisory lock and the partition is
+-- looked up again once it is held. The default partition is locked before rows are moved, so a
+-- load still writing to it finishes first; call this in a transaction of its own
+-- (ensure_partitions.sql), not inside a load that has already read auction_fact.
+CREATE OR REPLACE FUNCTION ensure_auction_fact_partitions(from_time TIMESTAMPTZ, to_time TIMESTAMPTZ)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start TIMESTAMPTZ;
+    month_end TIMESTAMPTZ;
+    partition_name TEXT;
+    created INT := 0;
+BEGIN
+    IF from_time IS NULL OR to_time IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    month_start := date_trunc('month', from_time AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+    WHILE month_start <= to_time LOOP
+        month_end := month_start + INTERVAL '1 month';
+        partition_name := 'auction_fact_' || to_char(month_start AT TIME ZONE 'UTC', '"y"YYYY"m"MM');
+
+        IF to_regclass(partition_name) IS NULL THEN
+            -- another load may be creating the same month: wait for it, then look again
+            PERFORM pg_advisory_xact_lock(hashtext('auction_fact_partitions'));
+            LOCK TABLE auction_fact_default IN ACCESS EXCLUSIVE MODE;
+        END IF;
+
+        IF to_regclass(partition_name) IS NULL THEN
+            -- attaching (instead of CREATE TABLE ... PARTITION OF) lets rows be moved out of the
+            -- default partition first, which would otherwise make the new bound invalid
+            EXECUTE format('CREATE TABLE %I (LIKE auction_fact INCLUDING DEFAULTS)', partition_name);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM auction_fact_default WHERE auction_time >= %L AND auction_time < %L RETURNING *)
+                 INSERT INTO %I SELECT * FROM moved',
+                month_start, month_end, partition_name
+            );
+            EXECUTE format(
+                'ALTER TABLE auction_fact ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, month_end
+            );
+            created := created + 1;
+        END IF;
+
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+
+-- Recomputes market_daily_stats for the given UTC days and market_monthly_stats for the months
+-- they fall in, from auction_fact. Whole days/months are replaced, so an auction whose make,
+-- state, ... changed doesn't leave a stale row under its old key.
+-- Concurrent refreshes of the same month are serialized by an advisory lock per month (taken
+-- in month order, so they can't deadlock); the second one recomputes from what both loaded.
+CREATE OR REPLACE FUNCTION refresh_market_stats(refresh_days DATE[])
+RETURNS TABLE(days_refreshed INT, months_refreshed INT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    refresh_months DATE[];
+    lock_month DATE;
+    first_day DATE;
+    last_day DATE;
+BEGIN
+    SELECT ARRAY_AGG(DISTINCT d), MIN(d), MAX(d) INTO refresh_days, first_day, last_day
+    FROM UNNEST(refresh_days) AS d
+    WHERE d IS NOT NULL;
+    IF first_day IS NULL THEN
+        RETURN QUERY SELECT 0, 0;
+        RETURN;
+    END IF;
+    SELECT ARRAY_AGG(DISTINCT date_trunc('month', d)::date) INTO refresh_months FROM UNNEST(refresh_days) AS d;
+
+    -- a day is only replaced under its month's lock
+    FOR lock_month IN SELECT m FROM UNNEST(refresh_months) AS m ORDER BY m LOOP
+        PERFORM pg_advisory_xact_lock(
+            hashtext('market_stats'),
+            (EXTRACT(YEAR FROM lock_month) * 12 + EXTRACT(MONTH FROM lock_month))::INT
+        );
+    END LOOP;
+
+    DELETE FROM market_daily_stats WHERE auction_day = ANY(refresh_days);
+    INSERT INTO market_daily_stats (auction_day, make, model, year_band, body_style, state,
+        auction_count, sold_count, reserve_auction_count, reserve_met_count, median_sale_price,
+        avg_sale_price, min_sale_price, max_sale_price, avg_bid_count, total_view_count)
+    SELECT
+        auction_day, make, model, year_band, body_style, state,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE sold),
+        COUNT(*) FILTER (WHERE has_reserve),
+        COUNT(*) FILTER (WHERE has_reserve AND sold),
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY max_bid) FILTER (WHERE sold),
+        AVG(max_bid) FILTER (WHERE sold),
+        MIN(max_bid) FILTER (WHERE sold),
+        MAX(max_bid) FILTER (WHERE sold),
+        AVG(bid_count),
+        SUM(view_count)
+    FROM market_auction_v
+    -- the time range lets the planner skip partitions and BRIN ranges
+    WHERE auction_time >= first_day::timestamp AT TIME ZONE 'UTC'
+        AND auction_time < (last_day + 1)::timestamp AT TIME ZONE 'UTC'
+        AND auction_day = ANY(refresh_days)
+    GROUP BY auction_day, make, model, year_band, body_style, state;
+
+    -- medians can't be combined from daily rows, so months are recomputed from the auctions
+    first_day := (SELECT MIN(m) FROM UNNEST(refresh_months) AS m);
+    last_day := ((SELECT MAX(m) FROM UNNEST(refresh_months) AS m) + INTERVAL '1 month')::date;
+    DELETE FROM market_monthly_stats WHERE auction_month = ANY(refresh_months);
+    INSERT INTO market_monthly_stats (auction_month, make, model, year_band, body_style, state,
+        auction_count, sold_count, reserve_auction_count, reserve_met_count, median_sale_price,
+        avg_sale_price, min_sale_price, max_sale_price, avg_bid_count, total_view_count)
+    SELECT
+        auction_month, make, model, year_band, body_style, state,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE sold),
+        COUNT(*) FILTER (WHERE has_reserve),
+        COUNT(*) FILTER (WHERE has_reserve AND sold),
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY max_bid) FILTER (WHERE sold),
+        AVG(max_bid) FILTER (WHERE sold),
+        MIN(max_bid) FILTER (WHERE sold),
+        MAX(max_bid) FILTER (WHERE sold),
+        AVG(bid_count),
+        SUM(view_count)
+    FROM market_auction_v
+    WHERE auction_time >= first_day::timestamp AT TIME ZONE 'UTC'
+        AND auction_time < last_day::timestamp AT TIME ZONE 'UTC'
+        AND auction_month = ANY(refresh_months)
+    GROUP BY auction_month, make, model, year_band, body_style, state;
+
+    RETURN QUERY SELECT CARDINALITY(refresh_days), CARDINALITY(refresh_months);
+END;
+$$;
+
+
+-- Recomputes the vehicle_history rows of the given VINs from vehicle_dim and auction_fact.
+-- A VIN's rows are replaced as a whole, since one new auction changes the numbering and the
+-- relist flags of the ones after it.
+-- Concurrent refreshes of the same VIN are serialized by advisory locks on VIN hash buckets
+-- (one lock per VIN could exhaust the lock table on a large load), taken in bucket order.
+CREATE OR REPLACE FUNCTION refresh_vehicle_history(refresh_vins TEXT[], relist_days INT)
+RETURNS TABLE(vins_refreshed INT, auctions INT, relists INT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    inserted INT;
+    vin_bucket INT;
+BEGIN
+    SELECT ARRAY_AGG(DISTINCT v) INTO refresh_vins
+    FROM UNNEST(refresh_vins) AS v
+    WHERE v IS NOT NULL AND v <> '';
+    IF refresh_vins IS NULL THEN
+        RETURN QUERY SELECT 0, 0, 0;
+        RETURN;
+    END IF;
+
+    FOR vin_bucket IN SELECT DISTINCT ABS(hashtext(v) % 256) FROM UNNEST(refresh_vins) AS v ORDER BY 1 LOOP
+        PERFORM pg_advisory_xact_lock(hashtext('vehicle_history'), vin_bucket);
+    END LOOP;
+
+    DELETE FROM vehicle_history WHERE vin = ANY(refresh_vins);
+    INSERT INTO vehicle_history (vin, auction_time, auction_id, vehicle_id, auction_number,
+        auction_status, sold, high_bid, mileage, previous_auction_id, days_since_previous,
+        previous_sold, previous_high_bid, is_relist)
+    SELECT
+        vd.vin,
+        af.auction_time,
+        af.auction_id,
+        vd.vehicle_id,
+        ROW_NUMBER() OVER w,
+        asd.status,
+        COALESCE(asd.status = 'sold', FALSE),
+        af.max_bid,
+        vd.mileage,
+        LAG(af.auction_id) OVER w,
+        (EXTRACT(EPOCH FROM af.auction_time - LAG(af.auction_time) OVER w) / 86400)::INT,
+        LAG(COALESCE(asd.status = 'sold', FALSE)) OVER w,
+        LAG(af.max_bid) OVER w,
+        COALESCE(af.auction_time - LAG(af.auction_time) OVER w <= make_interval(days => relist_days), FALSE)
+    -- vehicle_dim's UNIQUE (vin, auction_id) index finds the VINs
+    FROM vehicle_dim vd
+    JOIN auction_fact af ON af.vehicle_id = vd.vehicle_id
+    LEFT JOIN auction_status_dim asd ON af.auction_status = asd.id
+    WHERE vd.vin = ANY(refresh_vins)
+    WINDOW w AS (PARTITION BY vd.vin ORDER BY af.auction_time, af.auction_id);
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+
+    RETURN QUERY
+    SELECT CARDINALITY(refresh_vins), inserted, COUNT(*)::INT
+    FROM vehicle_history
+    WHERE vin = ANY(refresh_vins) AND is_relist;
+END;
+$$;
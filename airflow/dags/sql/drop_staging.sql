@@ -0,0 +1,4 @@
+
+-- Drop the per-run staging table once its rows are in the fact & dim tables.
+
+DROP TABLE IF EXISTS {staging};
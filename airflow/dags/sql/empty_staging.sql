@@ -1,4 +0,0 @@
-
--- Empty staging table after every load.
-
-TRUNCATE TABLE staging;
@@ -0,0 +1,14 @@
+/*
+=========================================
+    Monthly auction_fact partitions for the run's staging table
+    - runs in its own transaction before load_tables.sql: creating a
+      partition locks auction_fact_default, which a load transaction
+      that already read auction_fact could otherwise deadlock on
+=========================================
+*/
+SELECT ensure_auction_fact_partitions(
+	TO_TIMESTAMP(MIN(auction_date) / 1000),
+	TO_TIMESTAMP(MAX(auction_date) / 1000)
+)
+FROM {staging}
+WHERE auction_id IS NOT NULL;
@@ -7,7 +7,7 @@
 */
 INSERT INTO auction_status_dim(status)
 SELECT DISTINCT TRIM(LOWER(auction_status))
-FROM staging
+FROM {staging}
 WHERE auction_status IS NOT NULL
 ON CONFLICT(status) DO NOTHING;
 
@@ -19,7 +19,7 @@ ON CONFLICT(status) DO NOTHING;
 */
 INSERT INTO reserve_status_dim(status)
 SELECT DISTINCT TRIM(LOWER(reserve_status))
-FROM staging
+FROM {staging}
 WHERE reserve_status IS NOT NULL
 ON CONFLICT(status) DO NOTHING;
 
@@ -30,7 +30,7 @@ ON CONFLICT(status) DO NOTHING;
 */
 INSERT INTO body_style_dim(body_style)
 SELECT DISTINCT TRIM(LOWER(body_style))
-FROM staging
+FROM {staging}
 WHERE body_style IS NOT NULL
 ON CONFLICT(body_style) DO NOTHING;
 
@@ -41,7 +41,7 @@ ON CONFLICT(body_style) DO NOTHING;
 */
 INSERT INTO seller_type_dim(seller_type)
 SELECT DISTINCT TRIM(LOWER(seller_type))
-FROM staging
+FROM {staging}
 WHERE seller_type IS NOT NULL
 ON CONFLICT(seller_type) DO NOTHING;
 
@@ -52,7 +52,7 @@ ON CONFLICT(seller_type) DO NOTHING;
 */
 INSERT INTO drivetrain_dim(drivetrain)
 SELECT DISTINCT TRIM(UPPER(drivetrain))
-FROM staging
+FROM {staging}
 WHERE drivetrain IS NOT NULL
 ON CONFLICT(drivetrain) DO NOTHING;
 
@@ -63,7 +63,7 @@ ON CONFLICT(drivetrain) DO NOTHING;
 */
 INSERT INTO transmission_dim(transmission)
 SELECT DISTINCT TRIM(LOWER(transmission_type)) AS transmission
-FROM staging
+FROM {staging}
 WHERE transmission_type IS NOT NULL
 ORDER BY transmission ASC
 ON CONFLICT(transmission) DO NOTHING;
@@ -78,7 +78,7 @@ ON CONFLICT(transmission) DO NOTHING;
 
 INSERT INTO city_dim(city_name, state_id)
 SELECT DISTINCT TRIM(s.city) AS city, sd.id
-FROM staging s
+FROM {staging} s
 LEFT JOIN state_dim sd 
 	ON s.title_state=sd.state_abbr OR s.title_state=sd.state
 WHERE s.city IS NOT NULL
@@ -94,7 +94,7 @@ ON CONFLICT(city_name,state_id) DO NOTHING;
 */
 INSERT INTO vehicle_make_dim(make)
 SELECT DISTINCT TRIM(make) AS make
-FROM staging
+FROM {staging}
 WHERE make IS NOT NULL
 ORDER BY make ASC
 ON CONFLICT(make) DO NOTHING;
@@ -106,7 +106,7 @@ ON CONFLICT(make) DO NOTHING;
 */
 INSERT INTO vehicle_model_dim(model,make_id)
 SELECT DISTINCT TRIM(s.model) AS model,vmd.id
-FROM staging s
+FROM {staging} s
 LEFT JOIN vehicle_make_dim vmd
 	ON TRIM(s.make)=TRIM(vmd.make)
 WHERE model IS NOT NULL
@@ -114,110 +114,325 @@ ORDER BY model ASC
 ON CONFLICT(model,make_id) DO NOTHING;
 
 
+/*
+==================================================================
+    CHANGE COUNTS
+    - vehicle_dim and auction_fact rows carry row_hash, an md5 of the
+      columns the load writes; an existing row is only rewritten when
+      its hash differs, so replayed auctions cost no dead tuples
+    - per-table inserted/updated/unchanged counts are returned by the
+      last statement of this script
+==================================================================
+*/
+CREATE TEMP TABLE load_counts (
+	table_name TEXT,
+	source_rows BIGINT,
+	inserted BIGINT,
+	updated BIGINT
+) ON COMMIT DROP;
+
+
+/*
+==================================================================
+    CHANGE FEED (before)
+    - key fields and row hashes of the staged auctions already in
+      the warehouse, compared with the loaded rows at the end
+==================================================================
+*/
+CREATE TEMP TABLE change_before ON COMMIT DROP AS
+SELECT *
+FROM auction_change_fields_v
+WHERE auction_id IN (SELECT auction_id FROM {staging});
+
+
 /*
 ==================================================================
     LOAD vehicle_dim
 ==================================================================
 */
-INSERT INTO vehicle_dim(vin,auction_id,make_id,model_id,body_style_id,manufacture_year,mileage,engine,
-    transmission_id,gear_count,drivetrain_id,exterior_color,interior_color,title_status, title_state,
-	equipment_count, mod_count,flaw_count,service_count,included_items_count)
-SELECT 
-	TRIM(s.vin) AS vin,
-	s.auction_id,
-	make_dim.id AS make_id,
-	model_dim.id AS model_id,
-	bsd.id AS body_style_id,
-	s.manufacture_year,
-	s.mileage,
-	s.engine,
-	td.id AS transmission_id,
-	s.gears,
-	dd.id as drivetrain_id,
-    s.exterior_color,
-    s.interior_color,
-	s.title_status_cleaned,
-	s.title_state,
-	s.equipment_count,
-	s.mod_count,
-	s.flaw_count,
-	s.service_count,
-	s.included_items_count
-	
-FROM staging s
-LEFT JOIN vehicle_make_dim make_dim
-	ON TRIM(s.make)=make_dim.make
-LEFT JOIN vehicle_model_dim model_dim
-	ON TRIM(s.model)=model_dim.model AND make_dim.id=model_dim.make_id
-LEFT JOIN body_style_dim bsd
-	ON TRIM(LOWER(s.body_style))=bsd.body_style
-LEFT JOIN transmission_dim td
-	ON TRIM(LOWER(s.transmission_type))=td.transmission
-LEFT JOIN drivetrain_dim dd
-	ON TRIM(UPPER(s.drivetrain))=dd.drivetrain
-ON CONFLICT(vin,auction_id) 
-DO UPDATE SET
-	make_id = EXCLUDED.make_id,
-	model_id = EXCLUDED.model_id,
-	body_style_id = EXCLUDED.body_style_id,
-	manufacture_year = EXCLUDED.manufacture_year,
-	engine = EXCLUDED.engine,
-	transmission_id = EXCLUDED.transmission_id,
-	gear_count = EXCLUDED.gear_count,
-	drivetrain_id = EXCLUDED.drivetrain_id,
-    mileage = EXCLUDED.mileage,
-    exterior_color = EXCLUDED.exterior_color,
-    interior_color = EXCLUDED.interior_color,
-	title_status = EXCLUDED.title_status,
-	title_state = EXCLUDED.title_state,
-	equipment_count = EXCLUDED.equipment_count,
-	mod_count = EXCLUDED.mod_count,
-	flaw_count = EXCLUDED.flaw_count,
-	service_count = EXCLUDED.service_count,
-	included_items_count = EXCLUDED.included_items_count;
+WITH source AS (
+	SELECT 
+		TRIM(s.vin) AS vin,
+		s.auction_id,
+		make_dim.id AS make_id,
+		model_dim.id AS model_id,
+		bsd.id AS body_style_id,
+		s.manufacture_year,
+		s.mileage,
+		s.engine,
+		td.id AS transmission_id,
+		s.gears,
+		dd.id as drivetrain_id,
+		s.exterior_color,
+		s.interior_color,
+		s.title_status_cleaned,
+		s.title_state,
+		s.equipment_count,
+		s.mod_count,
+		s.flaw_count,
+		s.service_count,
+		s.included_items_count
+	FROM {staging} s
+	LEFT JOIN vehicle_make_dim make_dim
+		ON TRIM(s.make)=make_dim.make
+	LEFT JOIN vehicle_model_dim model_dim
+		ON TRIM(s.model)=model_dim.model AND make_dim.id=model_dim.make_id
+	LEFT JOIN body_style_dim bsd
+		ON TRIM(LOWER(s.body_style))=bsd.body_style
+	LEFT JOIN transmission_dim td
+		ON TRIM(LOWER(s.transmission_type))=td.transmission
+	LEFT JOIN drivetrain_dim dd
+		ON TRIM(UPPER(s.drivetrain))=dd.drivetrain
+),
+upserted AS (
+	INSERT INTO vehicle_dim(vin,auction_id,make_id,model_id,body_style_id,manufacture_year,mileage,engine,
+	    transmission_id,gear_count,drivetrain_id,exterior_color,interior_color,title_status, title_state,
+		equipment_count, mod_count,flaw_count,service_count,included_items_count,row_hash)
+	SELECT
+		src.*,
+		MD5(ROW(src.make_id, src.model_id, src.body_style_id, src.manufacture_year, src.mileage, src.engine,
+			src.transmission_id, src.gears, src.drivetrain_id, src.exterior_color, src.interior_color,
+			src.title_status_cleaned, src.title_state, src.equipment_count, src.mod_count, src.flaw_count,
+			src.service_count, src.included_items_count)::TEXT) AS row_hash
+	FROM source src
+	ON CONFLICT(vin,auction_id) 
+	DO UPDATE SET
+		make_id = EXCLUDED.make_id,
+		model_id = EXCLUDED.model_id,
+		body_style_id = EXCLUDED.body_style_id,
+		manufacture_year = EXCLUDED.manufacture_year,
+		engine = EXCLUDED.engine,
+		transmission_id = EXCLUDED.transmission_id,
+		gear_count = EXCLUDED.gear_count,
+		drivetrain_id = EXCLUDED.drivetrain_id,
+	    mileage = EXCLUDED.mileage,
+	    exterior_color = EXCLUDED.exterior_color,
+	    interior_color = EXCLUDED.interior_color,
+		title_status = EXCLUDED.title_status,
+		title_state = EXCLUDED.title_state,
+		equipment_count = EXCLUDED.equipment_count,
+		mod_count = EXCLUDED.mod_count,
+		flaw_count = EXCLUDED.flaw_count,
+		service_count = EXCLUDED.service_count,
+		included_items_count = EXCLUDED.included_items_count,
+		row_hash = EXCLUDED.row_hash
+	WHERE vehicle_dim.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+	-- xmax is 0 for freshly inserted rows
+	RETURNING (xmax = 0) AS inserted
+)
+INSERT INTO load_counts
+SELECT
+	'vehicle_dim',
+	(SELECT COUNT(*) FROM source),
+	COUNT(*) FILTER (WHERE inserted),
+	COUNT(*) FILTER (WHERE NOT inserted)
+FROM upserted;
 
 
 /*
 ==================================================================
     LOAD auction_fact
+    - the monthly partitions this load needs were created before it
+      (ensure_partitions.sql, its own transaction)
+    - auction_id stays unique across partitions: an auction's
+      auction_time is claimed once in auction_fact_ids and reused by
+      every later load, so the upsert always conflicts on the existing
+      row. A concurrent load of the same new auction waits on that
+      key until the first load commits (ids are claimed in order, so
+      two loads can't deadlock on them)
+==================================================================
+*/
+INSERT INTO auction_fact_ids(auction_id, auction_time)
+SELECT DISTINCT ON (auction_id) auction_id, TO_TIMESTAMP(auction_date / 1000)::timestamptz
+FROM {staging}
+WHERE auction_id IS NOT NULL
+	AND auction_date IS NOT NULL
+ORDER BY auction_id, auction_date DESC
+ON CONFLICT(auction_id) DO NOTHING;
+
+WITH source AS (
+	SELECT 
+		s.auction_id,
+		ids.auction_time,
+		vd.vehicle_id,
+		asd.id AS auction_status,
+		rsd.id AS reserve_status,
+		sd.id AS auction_state, 
+		cd.id AS auction_city,
+		std.id AS seller_type,
+		s.view_count,
+		s.watcher_count,
+		s.bid_count,
+		s.max_bid,
+		s.min_bid,
+		s.mean_bid,
+		s.median_bid,
+		s.bid_range,
+		s.bids,
+		s.highlight_count,
+	    s.video_count,
+		s.auction_title,
+		s.auction_subtitle,
+		s.auction_url,
+		af.auction_id IS NULL AS is_new
+	FROM {staging} s
+	JOIN auction_fact_ids ids
+		ON s.auction_id=ids.auction_id
+	LEFT JOIN auction_fact af
+		ON s.auction_id=af.auction_id
+	LEFT JOIN vehicle_dim vd 
+		ON TRIM(s.vin)=vd.vin AND s.auction_id=vd.auction_id
+	LEFT JOIN auction_status_dim asd
+		ON TRIM(LOWER(s.auction_status))=asd.status
+	LEFT JOIN reserve_status_dim rsd
+		ON TRIM(LOWER(s.reserve_status))=rsd.status
+	LEFT JOIN state_dim sd
+		ON TRIM(UPPER(s.title_state))=sd.state_abbr
+	LEFT JOIN city_dim CD
+		ON TRIM(s.city)=cd.city_name AND sd.id=cd.state_id
+	LEFT JOIN seller_type_dim std
+		ON TRIM(LOWER(s.seller_type))=std.seller_type
+	WHERE s.auction_id IS NOT NULL
+		AND s.auction_date IS NOT NULL
+),
+upserted AS (
+	INSERT INTO auction_fact(auction_id, auction_time, vehicle_id, auction_status, reserve_status, auction_state,
+		auction_city, seller_type, view_count, watcher_count, bid_count, max_bid, min_bid, mean_bid, median_bid,
+		bid_range, bids, highlight_count, video_count, auction_title, auction_subtitle, auction_url, row_hash)
+	SELECT
+		src.auction_id, src.auction_time, src.vehicle_id, src.auction_status, src.reserve_status,
+		src.auction_state, src.auction_city, src.seller_type, src.view_count, src.watcher_count,
+		src.bid_count, src.max_bid, src.min_bid, src.mean_bid, src.median_bid, src.bid_range, src.bids,
+		src.highlight_count, src.video_count, src.auction_title, src.auction_subtitle, src.auction_url,
+		MD5(ROW(src.vehicle_id, src.auction_status, src.reserve_status, src.auction_state, src.auction_city,
+			src.seller_type, src.view_count, src.watcher_count, src.bid_count, src.max_bid, src.min_bid,
+			src.mean_bid, src.median_bid, src.bid_range, src.bids, src.highlight_count, src.video_count,
+			src.auction_title, src.auction_subtitle, src.auction_url)::TEXT) AS row_hash
+	FROM source src
+	ON CONFLICT(auction_id, auction_time)
+	DO UPDATE SET
+		vehicle_id = EXCLUDED.vehicle_id,
+		auction_status = EXCLUDED.auction_status,
+		reserve_status = EXCLUDED.reserve_status,
+		auction_state = EXCLUDED.auction_state,
+		auction_city = EXCLUDED.auction_city,
+		seller_type = EXCLUDED.seller_type,
+		view_count = EXCLUDED.view_count,
+		watcher_count = EXCLUDED.watcher_count,
+		bid_count = EXCLUDED.bid_count,
+		max_bid = EXCLUDED.max_bid,
+		min_bid = EXCLUDED.min_bid,
+		mean_bid = EXCLUDED.mean_bid,
+		median_bid = EXCLUDED.median_bid,
+		bid_range = EXCLUDED.bid_range,
+		bids = EXCLUDED.bids,
+		highlight_count = EXCLUDED.highlight_count,
+		video_count = EXCLUDED.video_count,
+		auction_title = EXCLUDED.auction_title,
+		auction_subtitle = EXCLUDED.auction_subtitle,
+		auction_url = EXCLUDED.auction_url,
+		row_hash = EXCLUDED.row_hash
+	WHERE auction_fact.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+	-- xmax can't be returned from a partitioned table, so new rows are told apart by the join above
+	RETURNING auction_id
+)
+INSERT INTO load_counts
+SELECT
+	'auction_fact',
+	(SELECT COUNT(*) FROM source),
+	COUNT(*) FILTER (WHERE src.is_new),
+	COUNT(*) FILTER (WHERE NOT src.is_new)
+FROM upserted
+JOIN source src USING (auction_id);
+
+
+/*
+==================================================================
+    LOAD bid_fact
+    - staging keeps bids newest first; seq counts from the opening
+      bid so a rescrape with more bids keeps the existing numbers
+    - bids beyond the auction's current bid count are removed
+==================================================================
+*/
+DELETE FROM bid_fact bf
+USING {staging} s
+WHERE bf.auction_id = s.auction_id
+	AND bf.seq > COALESCE(CARDINALITY(s.bids), 0);
+
+WITH source AS (
+	SELECT
+		s.auction_id,
+		(CARDINALITY(s.bids) - b.position + 1)::INT AS seq,
+		b.bid_amount,
+		TO_TIMESTAMP(b.bid_time / 1000.0) AS bid_time,
+		b.bidder
+	FROM {staging} s
+	CROSS JOIN LATERAL UNNEST(s.bids, s.bid_times, s.bid_bidders)
+		WITH ORDINALITY AS b(bid_amount, bid_time, bidder, position)
+	WHERE s.auction_id IS NOT NULL
+		AND b.position <= CARDINALITY(s.bids)
+),
+upserted AS (
+	INSERT INTO bid_fact(auction_id, seq, bid_amount, bid_time, bidder)
+	SELECT auction_id, seq, bid_amount, bid_time, bidder
+	FROM source
+	ON CONFLICT(auction_id, seq)
+	DO UPDATE SET
+		bid_amount = EXCLUDED.bid_amount,
+		bid_time = EXCLUDED.bid_time,
+		bidder = EXCLUDED.bidder
+	WHERE (bid_fact.bid_amount, bid_fact.bid_time, bid_fact.bidder)
+		IS DISTINCT FROM (EXCLUDED.bid_amount, EXCLUDED.bid_time, EXCLUDED.bidder)
+	RETURNING (xmax = 0) AS inserted
+)
+INSERT INTO load_counts
+SELECT
+	'bid_fact',
+	(SELECT COUNT(*) FROM source),
+	COUNT(*) FILTER (WHERE inserted),
+	COUNT(*) FILTER (WHERE NOT inserted)
+FROM upserted;
+
+
+/*
+==================================================================
+    CHANGE FEED (after)
+    - one auction_changelog row per staged auction that is new or
+      whose auction_fact/vehicle_dim row_hash changed
+    - a retried load finds nothing changed and keeps the rows of the
+      attempt that committed
 ==================================================================
 */
-INSERT INTO auction_fact
-SELECT 
-	s.auction_id,
-	TO_TIMESTAMP(s.auction_date / 1000)::timestamptz AS auction_time,
-	vd.vehicle_id,
-	asd.id AS auction_status,
-	rsd.id AS reserve_status,
-	sd.id AS auction_state, 
-	cd.id AS auction_city,
-	std.id AS seller_type,
-	s.view_count,
-	s.watcher_count,
-	s.bid_count,
-	s.max_bid,
-	s.min_bid,
-	s.mean_bid,
-	s.median_bid,
-	s.bid_range,
-	s.bids,
-	s.highlight_count,
-    s.video_count,
-	s.auction_title,
-	s.auction_subtitle,
-	s.auction_url
-FROM staging s
-LEFT JOIN vehicle_dim vd 
-	ON TRIM(s.vin)=vd.vin AND s.auction_id=vd.auction_id
-LEFT JOIN auction_status_dim asd
-	ON TRIM(LOWER(s.auction_status))=asd.status
-LEFT JOIN reserve_status_dim rsd
-	ON TRIM(LOWER(s.reserve_status))=rsd.status
-LEFT JOIN state_dim sd
-	ON TRIM(UPPER(s.title_state))=sd.state_abbr
-LEFT JOIN city_dim CD
-	ON TRIM(s.city)=cd.city_name AND sd.id=cd.state_id
-LEFT JOIN seller_type_dim std
-	ON TRIM(LOWER(s.seller_type))=std.seller_type
-WHERE s.auction_id IS NOT NULL
-ON CONFLICT(auction_id) DO NOTHING; 
\ No newline at end of file
+INSERT INTO auction_changelog (run_id, auction_id, change_type, auction_time, changed_fields, before, after)
+SELECT
+	%(run_id)s,
+	a.auction_id,
+	CASE WHEN b.auction_id IS NULL THEN 'insert' ELSE 'update' END,
+	a.auction_time,
+	ARRAY(
+		SELECT field.key
+		FROM jsonb_each(a.fields) AS field
+		WHERE b.fields IS NULL OR b.fields -> field.key IS DISTINCT FROM field.value
+		ORDER BY field.key
+	),
+	b.fields,
+	a.fields
+FROM (
+	SELECT v.auction_id, v.auction_time, v.auction_hash, v.vehicle_hash,
+		to_jsonb(v) - 'auction_hash' - 'vehicle_hash' AS fields
+	FROM auction_change_fields_v v
+	WHERE v.auction_id IN (SELECT auction_id FROM {staging})
+) a
+LEFT JOIN (
+	SELECT cb.auction_id, cb.auction_hash, cb.vehicle_hash,
+		to_jsonb(cb) - 'auction_hash' - 'vehicle_hash' AS fields
+	FROM change_before cb
+) b USING (auction_id)
+WHERE b.auction_id IS NULL
+	OR (a.auction_hash, a.vehicle_hash) IS DISTINCT FROM (b.auction_hash, b.vehicle_hash)
+ON CONFLICT (run_id, auction_id) DO NOTHING;
+
+
+SELECT table_name, inserted, updated, source_rows - inserted - updated AS unchanged
+FROM load_counts
+ORDER BY table_name;
@@ -0,0 +1,45 @@
+/*
+================================================================
+ One-off migration: heap auction_fact -> partitioned auction_fact
+================================================================
+For warehouses created before auction_fact was partitioned. Run once after
+creating ensure_auction_fact_partitions() (the FUNCTIONS section of
+create_tables.sql); new warehouses get the partitioned table from create_tables.sql.
+Rows without an auction_time cannot be placed in a partition and are kept in
+auction_fact_unpartitioned for inspection.
+*/
+
+BEGIN;
+
+ALTER TABLE auction_fact RENAME TO auction_fact_unpartitioned;
+ALTER TABLE auction_fact_unpartitioned RENAME CONSTRAINT auction_fact_pkey TO auction_fact_unpartitioned_pkey;
+
+CREATE TABLE auction_fact (
+    LIKE auction_fact_unpartitioned INCLUDING DEFAULTS,
+    PRIMARY KEY (auction_id, auction_time)
+) PARTITION BY RANGE (auction_time);
+
+ALTER TABLE auction_fact
+    ADD FOREIGN KEY (vehicle_id) REFERENCES vehicle_dim(vehicle_id),
+    ADD FOREIGN KEY (auction_status) REFERENCES auction_status_dim(id),
+    ADD FOREIGN KEY (reserve_status) REFERENCES reserve_status_dim(id),
+    ADD FOREIGN KEY (auction_state) REFERENCES state_dim(id),
+    ADD FOREIGN KEY (auction_city) REFERENCES city_dim(id),
+    ADD FOREIGN KEY (seller_type) REFERENCES seller_type_dim(id);
+
+CREATE TABLE auction_fact_default PARTITION OF auction_fact DEFAULT;
+CREATE INDEX auction_fact_auction_time_brin ON auction_fact USING BRIN (auction_time);
+
+SELECT ensure_auction_fact_partitions(MIN(auction_time), MAX(auction_time))
+FROM auction_fact_unpartitioned;
+
+WITH moved AS (
+    DELETE FROM auction_fact_unpartitioned
+    WHERE auction_time IS NOT NULL
+    RETURNING *
+)
+INSERT INTO auction_fact
+SELECT * FROM moved
+ORDER BY auction_time;
+
+COMMIT;
@@ -0,0 +1,10 @@
+
+-- Rebuild the market aggregates from the whole of auction_fact (repairs, definition changes).
+
+TRUNCATE TABLE market_daily_stats, market_monthly_stats;
+
+SELECT days_refreshed, months_refreshed
+FROM refresh_market_stats(ARRAY(
+    SELECT DISTINCT (auction_time AT TIME ZONE 'UTC')::date
+    FROM auction_fact
+));
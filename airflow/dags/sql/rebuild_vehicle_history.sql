@@ -0,0 +1,9 @@
+-- Rebuild vehicle_history from the whole of vehicle_dim (repairs, a new relist window).
+
+TRUNCATE TABLE vehicle_history;
+
+SELECT vins_refreshed, auctions, relists
+FROM refresh_vehicle_history(ARRAY(
+    SELECT DISTINCT vin
+    FROM vehicle_dim
+), %(relist_days)s);
@@ -0,0 +1,11 @@
+
+-- Refresh the market aggregates for the days touched by this run's staging rows.
+-- Runs after load_tables.sql; uses the auction_time stored in auction_fact.
+
+SELECT days_refreshed, months_refreshed
+FROM refresh_market_stats(ARRAY(
+    SELECT DISTINCT (af.auction_time AT TIME ZONE 'UTC')::date
+    FROM {staging} s
+    JOIN auction_fact af
+        ON s.auction_id = af.auction_id
+));
@@ -0,0 +1,8 @@
+-- Refresh vehicle_history for the VINs in this run's staging rows.
+-- Runs after load_tables.sql (vehicle_dim stores the trimmed VIN).
+
+SELECT vins_refreshed, auctions, relists
+FROM refresh_vehicle_history(ARRAY(
+    SELECT DISTINCT TRIM(vin)
+    FROM {staging}
+), %(relist_days)s);
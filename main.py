@@ -1,5 +1,185 @@
-def main():
-    print("Hello from carsnbids-local!")
+"""
+Command-line runner for the ETL pipeline, without Airflow.
+
+Runs the same extract -> transform -> load code paths as `carsnbids_dag` against a
+pluggable storage backend (S3, a local directory or memory) and a Postgres DSN.
+
+Examples:
+    # transform a raw file kept under ./data/raw-auctions/ and load it into a local Postgres
+    python main.py --storage local --root ./data run auctions_2025-01-01.json \\
+        --dsn postgresql://postgres@localhost:5432/carsnbids
+
+    # in-memory storage, seeded from a local raw file, transform only
+    python main.py --storage memory run auctions_2025-01-01.json --seed ~/Downloads/auctions_2025-01-01.json
+"""
+import os, sys, argparse, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'airflow', 'dags'))
+
+from etl_scripts import storage
+from etl_scripts import pipeline
+from etl_scripts import metrics
+from etl_scripts import profiling
+from etl_scripts import db
+from etl_scripts import comparables
+from etl_scripts import vehicle_history
+from etl_scripts import changes
+from etl_scripts import transform_engines
+
+
+def seed_objects(s3_client, bucket:str, paths:list, keys:list):
+    for path, key in zip(paths, keys):
+        body = storage.MmapBody(os.path.expanduser(path))
+        try:
+            s3_client.put_object(Bucket=bucket, Key=key, Body=body.read())
+        finally:
+            body.close()
+        print(f"seeded {bucket}/{key} from {path}")
+
+
+def init_db(conn):
+    pipeline.run_sql_file(conn, 'create_tables.sql')
+    pipeline.run_sql_file(conn, 'load_auction_states.sql')
+    print("warehouse tables created")
+
+
+def load(s3_client, processed_bucket:str, object_keys:list, dsn:str)->dict:
+    # own staging table per invocation, so CLI loads can run next to each other and the DAG
+    run_id = f"cli_{os.getpid()}_{int(time.time())}"
+    staging_table = pipeline.staging_table_name(run_id)
+    with db.connection(dsn) as conn:
+        pipeline.run_sql_file(conn, 'create_staging.sql', staging_table)
+        try:
+            results = pipeline.load_keys_to_staging(s3_client, processed_bucket, object_keys, conn, staging_table)
+            results['table_counts'] = pipeline.load_warehouse_tables(conn, staging_table, run_id)
+            results['market_stats'] = pipeline.refresh_market_stats(conn, staging_table)
+            results['vehicle_history'] = vehicle_history.refresh_history(conn, staging_table)
+            results['comparables'] = comparables.refresh_index(conn, staging_table)
+        finally:
+            pipeline.run_sql_file(conn, 'drop_staging.sql', staging_table)
+        results['changes'] = changes.export_changes(conn, s3_client, processed_bucket, run_id)
+    pipeline.mark_keys_loaded(s3_client, processed_bucket, results['loaded_keys'])
+    return results
+
+
+def run(args, s3_client):
+    if args.seed:
+        seed_objects(s3_client, args.raw_bucket, args.seed, args.keys)
+
+    processed_keys = []
+    for key in args.keys:
+        start = time.perf_counter()
+        metrics.reset()
+        with profiling.profile_task(
+            f"transform_{key}", s3_client, args.processed_bucket, f"{profiling.PROFILE_PREFIX}/cli", args.profile
+        ):
+            results = pipeline.transform_object(s3_client, key, args.raw_bucket, args.processed_bucket, engine=args.engine)
+        metrics.export("transform")
+        processed_keys.extend(k for k in results['processed_auction_keys'] if k not in processed_keys)
+        print(
+            f"transformed {key} in {time.perf_counter() - start:.2f}s: "
+            f"{len(results['processed_auction_keys'])} processed file(s), {len(results['rescrape_urls'])} url(s) to rescrape"
+        )
+
+    if not args.dsn:
+        print("no --dsn given, skipping the Postgres load")
+        return
+
+    start = time.perf_counter()
+    metrics.reset()
+    with profiling.profile_task(
+        "load_to_postgres_staging", s3_client, args.processed_bucket, f"{profiling.PROFILE_PREFIX}/cli", args.profile
+    ):
+        results = load(s3_client, args.processed_bucket, processed_keys, args.dsn)
+    metrics.export("load_to_postgres_staging")
+    print(f"loaded {results['inserted_rows']} row(s) from {len(results['loaded_keys'])} file(s) in {time.perf_counter() - start:.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the carsnbids ETL pipeline without Airflow.")
+    parser.add_argument('--storage', choices=['s3', 'local', 'memory'], default='local', help="storage backend")
+    parser.add_argument('--root', default='./data', help="root directory of the local storage backend")
+    parser.add_argument('--raw-bucket', default=os.getenv('RAW_AUCTIONS_BUCKET') or 'raw-auctions')
+    parser.add_argument('--processed-bucket', default=os.getenv('PROCESSED_AUCTIONS_BUCKET') or 'processed-auctions')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="transform raw auction files and load them into Postgres")
+    run_parser.add_argument('keys', nargs='+', help="raw auction object keys, e.g. auctions_2025-01-01.json")
+    run_parser.add_argument('--seed', nargs='+', help="local files to upload as the raw objects first (one per key)")
+    run_parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'), help="Postgres DSN; the load is skipped without one")
+    run_parser.add_argument('--engine', choices=list(transform_engines.ENGINES), default=None, help="transform engine (default: TRANSFORM_ENGINE)")
+    run_parser.add_argument(
+        '--profile', action='store_true', default=profiling.profiling_enabled(),
+        help="cProfile + tracemalloc each step and store the results under _profiles/cli/ in the processed bucket"
+    )
+
+    load_parser = subparsers.add_parser('load', help="load processed day files into Postgres")
+    load_parser.add_argument('keys', nargs='+', help="processed object keys, e.g. 2025-01-01.json")
+    load_parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'), required=not os.getenv('DATABASE_URL'))
+
+    rebuild_parser = subparsers.add_parser('rebuild-market-stats', help="recompute the market aggregate tables from auction_fact")
+    rebuild_parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'), required=not os.getenv('DATABASE_URL'))
+
+    history_parser = subparsers.add_parser('vehicle-history', help="auction history of a VIN, oldest first, with relist flags")
+    history_parser.add_argument('vin')
+    history_parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'), required=not os.getenv('DATABASE_URL'))
+
+    rebuild_history_parser = subparsers.add_parser('rebuild-vehicle-history', help="recompute vehicle_history from the warehouse")
+    rebuild_history_parser.add_argument('--relist-days', type=int, default=vehicle_history.VEHICLE_RELIST_DAYS)
+    rebuild_history_parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'), required=not os.getenv('DATABASE_URL'))
+
+    comparables_parser = subparsers.add_parser('comparables', help="closest sold auctions of a make/model by year and mileage")
+    comparables_parser.add_argument('make')
+    comparables_parser.add_argument('model')
+    comparables_parser.add_argument('year', type=int)
+    comparables_parser.add_argument('--mileage', type=int)
+    comparables_parser.add_argument('-k', type=int, default=5, help="number of sales to return")
+    comparables_parser.add_argument('--rebuild', action='store_true', help="rebuild the index from the warehouse first (needs --dsn)")
+    comparables_parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+
+    init_parser = subparsers.add_parser('init-db', help="create the warehouse tables and load state_dim")
+    init_parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'), required=not os.getenv('DATABASE_URL'))
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'seed', None) and len(args.seed) != len(args.keys):
+        parser.error("--seed needs one file per key")
+
+    s3_client = storage.get_s3_client(args.storage, args.root)
+
+    if args.command == 'run':
+        run(args, s3_client)
+    elif args.command == 'load':
+        results = load(s3_client, args.processed_bucket, args.keys, args.dsn)
+        print(f"loaded {results['inserted_rows']} row(s) from {len(results['loaded_keys'])} file(s)")
+    elif args.command == 'rebuild-market-stats':
+        with db.connection(args.dsn) as conn:
+            pipeline.refresh_market_stats(conn)
+    elif args.command == 'vehicle-history':
+        with db.connection(args.dsn) as conn:
+            start = time.perf_counter()
+            auctions = vehicle_history.lookup(conn, args.vin)
+            elapsed_ms = (time.perf_counter() - start) * 1e3
+        for auction in auctions:
+            print(auction)
+        print(f"{len(auctions)} auction(s) of {args.vin} in {elapsed_ms:.1f}ms")
+    elif args.command == 'rebuild-vehicle-history':
+        with db.connection(args.dsn) as conn:
+            vehicle_history.refresh_history(conn, relist_days=args.relist_days)
+    elif args.command == 'comparables':
+        if args.rebuild:
+            if not args.dsn:
+                parser.error("--rebuild needs --dsn")
+            with db.connection(args.dsn) as conn:
+                comparables.refresh_index(conn)
+        start = time.perf_counter()
+        sales = comparables.ComparablesIndex.open().nearest(args.make, args.model, args.year, args.mileage, args.k)
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        for sale in sales:
+            print(sale)
+        print(f"{len(sales)} comparable sale(s) in {elapsed_us:.0f}us (including opening the index)")
+    elif args.command == 'init-db':
+        with db.connection(args.dsn) as conn:
+            init_db(conn)
 
 
 if __name__ == "__main__":
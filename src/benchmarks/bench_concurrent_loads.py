@@ -0,0 +1,148 @@
+"""
+Concurrent warehouse loads into the same new month (sql/ensure_partitions.sql, load_tables.sql).
+
+Seeds a Postgres schema of its own (BENCH_SCHEMA, dropped first) and then, for each of --rounds
+months that have no auction_fact partition yet, stages --loads batches of synthetic auctions of
+that month in separate staging tables and runs `pipeline.load_warehouse_tables` on all of them
+at once, released together by a barrier. A round passes when no load raised (deadlock, duplicate
+partition, failed ATTACH), the month's partition exists and holds every staged auction, and no
+auction of the month was left in auction_fact_default. The script exits non-zero if a round fails.
+
+Usage:
+    python bench_concurrent_loads.py --dsn postgresql://postgres@localhost:5432/carsnbids
+    python bench_concurrent_loads.py --rounds 10 --loads 4 --records 5000 --dsn ...
+"""
+import os, sys, json, time, argparse, threading
+from datetime import datetime
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(os.path.dirname(script_dir))
+sys.path.insert(0, os.path.join(repo_dir, 'airflow', 'dags'))
+sys.path.insert(0, script_dir)
+
+from etl_scripts import storage
+from etl_scripts import pipeline
+from generate_auctions import generate_auctions
+from bench_warehouse import bench_connection, reset_schema, scalar
+
+BENCH_SCHEMA = 'bench_concurrent_loads'
+# far from the other benchmarks' data, one month per round
+FIRST_MONTH = datetime(2031, 1, 1)
+
+
+def month_start(round_index:int)->datetime:
+    months = FIRST_MONTH.month - 1 + round_index
+    return FIRST_MONTH.replace(year=FIRST_MONTH.year + months // 12, month=months % 12 + 1)
+
+
+def stage(dsn:str, round_index:int, load_index:int, records:int, engine:str=None)->tuple:
+    """
+    Transforms `records` auctions of the round's month into in-memory S3 and loads them into a
+    new staging table.
+
+    Returns:
+        tuple: (staging table, number of staged auctions)
+    """
+    offset = (round_index * 100 + load_index) * records
+    raw_data = generate_auctions(records, seed=offset, start=month_start(round_index), days=25, offset=offset)
+    s3_client = storage.MemoryS3Client()
+    key = f"concurrent_{round_index}_{load_index}.json"
+    s3_client.put_object(Bucket='raw-auctions', Key=key, Body=json.dumps(raw_data).encode('utf-8'))
+
+    results = pipeline.transform_object(s3_client, key, 'raw-auctions', 'processed-auctions', engine=engine)
+    staging_table = pipeline.staging_table_name(f"concurrent_{os.getpid()}_{round_index}_{load_index}")
+    with bench_connection(dsn, BENCH_SCHEMA) as conn:
+        pipeline.run_sql_file(conn, 'create_staging.sql', staging_table)
+        pipeline.load_keys_to_staging(s3_client, 'processed-auctions', results['processed_auction_keys'], conn, staging_table)
+        staged = scalar(conn, f'SELECT COUNT(DISTINCT auction_id) FROM "{staging_table}"')
+    return staging_table, staged
+
+
+def load_concurrently(dsn:str, staging_tables:list)->tuple:
+    """
+    Runs load_warehouse_tables for every staging table in its own thread, all started together.
+
+    Returns:
+        tuple: (list of exceptions raised by the loads, seconds until the last load finished)
+    """
+    barrier = threading.Barrier(len(staging_tables))
+    errors = []
+
+    def load(staging_table):
+        with bench_connection(dsn, BENCH_SCHEMA) as conn:
+            barrier.wait()
+            try:
+                pipeline.load_warehouse_tables(conn, staging_table)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=load, args=(staging_table,)) for staging_table in staging_tables]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors, time.perf_counter() - start
+
+
+def check_round(dsn:str, round_index:int, staged:int)->list:
+    start = month_start(round_index)
+    partition = f"auction_fact_y{start.year:04d}m{start.month:02d}"
+    problems = []
+    with bench_connection(dsn, BENCH_SCHEMA) as conn:
+        if scalar(conn, "SELECT to_regclass(%s) IS NULL", (partition,)):
+            return [f"partition {partition} was not created"]
+        in_partition = scalar(conn, f'SELECT COUNT(*) FROM "{partition}"')
+        in_default = scalar(conn, "SELECT COUNT(*) FROM auction_fact_default WHERE auction_time >= %s AND auction_time < %s",
+                            (start, month_start(round_index + 1)))
+    if in_partition != staged:
+        problems.append(f"{partition} holds {in_partition} auctions, {staged} were staged")
+    if in_default:
+        problems.append(f"{in_default} auctions of {partition} are in auction_fact_default")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load several staging tables of the same new month at once and check the partitions.")
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'), required=not os.getenv('DATABASE_URL'))
+    parser.add_argument('--rounds', type=int, default=5, help="new months to load")
+    parser.add_argument('--loads', type=int, default=2, help="concurrent loads per month")
+    parser.add_argument('--records', type=int, default=2000, help="auctions per load")
+    parser.add_argument('--engine', default=None, help="transform engine used for staging")
+    parser.add_argument('--keep', action='store_true', help="keep the benchmark schema afterwards")
+    args = parser.parse_args()
+
+    reset_schema(args.dsn, BENCH_SCHEMA)
+    problems = []
+    try:
+        for round_index in range(args.rounds):
+            staged = [stage(args.dsn, round_index, load_index, args.records, args.engine) for load_index in range(args.loads)]
+            staging_tables = [staging_table for staging_table, _ in staged]
+            try:
+                errors, seconds = load_concurrently(args.dsn, staging_tables)
+            finally:
+                with bench_connection(args.dsn, BENCH_SCHEMA) as conn:
+                    for staging_table in staging_tables:
+                        pipeline.run_sql_file(conn, 'drop_staging.sql', staging_table)
+
+            round_problems = [f"load failed: {type(e).__name__}: {e}".strip() for e in errors]
+            if not errors:
+                round_problems = check_round(args.dsn, round_index, sum(count for _, count in staged))
+            status = "ok" if not round_problems else "FAILED"
+            print(f"{month_start(round_index):%Y-%m}: {args.loads} loads in {seconds:.2f}s {status}")
+            for problem in round_problems:
+                print(f"  {problem}")
+            problems.extend(round_problems)
+    finally:
+        if not args.keep:
+            with bench_connection(args.dsn, BENCH_SCHEMA) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(f'DROP SCHEMA IF EXISTS "{BENCH_SCHEMA}" CASCADE')
+                conn.commit()
+
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
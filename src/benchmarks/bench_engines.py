@@ -0,0 +1,91 @@
+"""
+Parity check and benchmark of the transform engines (etl_scripts/transform_engines.py).
+
+Runs every engine's get_and_remove_invalid_auctions + clean_and_transform on the same
+auctions (synthetic, or raw files given with --input), writes the result as processed day
+files with `load_to_s3` (in-memory S3), and compares the files byte for byte with the
+pandas engine's. Exits non-zero if any engine differs.
+
+Usage:
+    python bench_engines.py --records 10000 100000
+    python bench_engines.py --input ../../data/raw-auctions/auctions_2025-01-04.json --projection warehouse
+"""
+import os, sys, json, time, argparse
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(os.path.dirname(script_dir))
+sys.path.insert(0, os.path.join(repo_dir, 'airflow', 'dags'))
+sys.path.insert(0, script_dir)
+# normalizer results must come from this run, not from a memo written by other code
+os.environ['NORMALIZER_MEMO_PATH'] = ''
+
+from etl_scripts import transform as transform_module
+from etl_scripts import transform_engines
+from etl_scripts import load as load_module
+from etl_scripts import storage
+from generate_auctions import generate_auctions
+
+
+def run_engine(name:str, raw_data, projection:str)->tuple:
+    """
+    Returns ({day file key: bytes}, rescrape urls, seconds spent in the engine).
+    """
+    engine = transform_engines.get_engine(name)
+    df = transform_module.create_auction_df(transform_module.convert_to_columns(raw_data, projection))
+    start = time.perf_counter()
+    filtered_df, rescrape_urls = engine.get_and_remove_invalid_auctions(df)
+    cleaned_df = engine.clean_and_transform(filtered_df)
+    seconds = time.perf_counter() - start
+
+    s3_client = storage.MemoryS3Client()
+    load_module.load_to_s3(s3_client, 'processed-auctions', cleaned_df)
+    files = {key: data for (_, key), data in s3_client.objects.items()}
+    return files, rescrape_urls, seconds
+
+
+def compare(reference:dict, files:dict)->list:
+    # day files missing on either side or with different bytes
+    return sorted(key for key in set(reference) | set(files) if reference.get(key) != files.get(key))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the transform engines produce identical output and time them.")
+    parser.add_argument('--records', type=int, nargs='+', default=[10_000])
+    parser.add_argument('--input', nargs='+', help="raw auction files to use instead of synthetic data")
+    parser.add_argument('--engines', nargs='+', default=list(transform_engines.ENGINES))
+    parser.add_argument('--projection', choices=list(transform_module.PROJECTIONS), default='full')
+    args = parser.parse_args()
+
+    if args.input:
+        datasets = []
+        for path in args.input:
+            with open(os.path.expanduser(path)) as f:
+                datasets.append((os.path.basename(path), json.load(f)))
+    else:
+        datasets = [(f"{records} synthetic auctions", generate_auctions(records)) for records in args.records]
+
+    mismatches = 0
+    for label, raw_data in datasets:
+        print(f"\n{label} ({args.projection} projection)")
+        reference = None
+        for name in args.engines:
+            files, rescrape_urls, seconds = run_engine(name, raw_data, args.projection)
+            line = f"  {name:<8} {seconds:>9.3f}s  {len(files):>5} day file(s)"
+            if reference is None:
+                reference = (name, files, rescrape_urls, seconds)
+                print(line)
+                continue
+            differing = compare(reference[1], files)
+            same_urls = rescrape_urls == reference[2]
+            status = "identical" if not differing and same_urls else f"DIFFERS ({len(differing)} file(s){'' if same_urls else ', rescrape urls'})"
+            print(f"{line}  {reference[3] / seconds:>5.1f}x vs {reference[0]}  {status}")
+            for key in differing[:5]:
+                print(f"    {key}")
+            mismatches += bool(differing) or not same_urls
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+CPU time of the processed NDJSON round trip, before and after etl_scripts/ndjson.py.
+
+The merge in `load_to_s3` decodes the existing day file, concatenates the new records and
+encodes the result again. This times that round trip both ways on synthetic, cleaned auctions:
+
+    pandas   DataFrame.to_json(lines=True) + one json.loads per line (the previous code)
+    ndjson   ndjson.encode_frame + ndjson.decode_records (orjson when installed, else json)
+
+CPU time is measured with time.process_time, fastest of --repeat runs.
+
+Usage:
+    python bench_ndjson.py --records 10000 100000
+"""
+import os, sys, json, time, argparse
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(os.path.dirname(script_dir))
+sys.path.insert(0, os.path.join(repo_dir, 'airflow', 'dags'))
+sys.path.insert(0, script_dir)
+
+import pandas as pd
+
+from etl_scripts import transform as transform_module
+from etl_scripts import ndjson
+from generate_auctions import generate_auctions
+
+
+def cleaned_auctions(records:int)->pd.DataFrame:
+    raw_data = generate_auctions(records)
+    df = transform_module.create_auction_df(transform_module.convert_to_columns(raw_data))
+    df, _ = transform_module.get_and_remove_invalid_auctions(df)
+    return transform_module.clean_and_transform(df)
+
+
+def pandas_encode(df:pd.DataFrame)->bytes:
+    return df.to_json(orient='records', lines=True).encode('utf-8')
+
+
+def pandas_decode(body:bytes)->list:
+    return [json.loads(line) for line in body.decode('utf-8').splitlines()]
+
+
+def cpu_time(func, *args, repeat:int=3)->tuple:
+    """
+    Returns (result, fastest CPU seconds) of `repeat` calls.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        result = func(*args)
+        timings.append(time.process_time() - start)
+    return result, min(timings)
+
+
+def bench(df:pd.DataFrame, repeat:int)->dict:
+    results = {}
+    for name, encode, decode in (
+        ("pandas", pandas_encode, pandas_decode),
+        ("ndjson", ndjson.encode_frame, ndjson.decode_records),
+    ):
+        body, encode_seconds = cpu_time(encode, df, repeat=repeat)
+        records, decode_seconds = cpu_time(decode, body, repeat=repeat)
+        assert len(records) == len(df)
+        results[name] = {"encode": encode_seconds, "decode": decode_seconds, "bytes": len(body)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark processed NDJSON encoding and decoding.")
+    parser.add_argument('--records', type=int, nargs='+', default=[10_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"ndjson backend: {ndjson.BACKEND}")
+    for records in args.records:
+        df = cleaned_auctions(records)
+        results = bench(df, args.repeat)
+        print(f"\n{len(df)} cleaned auctions")
+        for name, result in results.items():
+            total = result['encode'] + result['decode']
+            print(f"  {name:<7} encode {result['encode']:>8.3f}s  decode {result['decode']:>8.3f}s  "
+                  f"round trip {total:>8.3f}s  {result['bytes'] / 2**20:>8.1f} MB")
+        before = results['pandas']['encode'] + results['pandas']['decode']
+        after = results['ndjson']['encode'] + results['ndjson']['decode']
+        print(f"  round trip CPU time {after / before - 1:+.1%}")
+
+
+if __name__ == "__main__":
+    main()
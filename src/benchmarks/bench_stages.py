@@ -0,0 +1,228 @@
+"""
+Stage-by-stage benchmark of the transform and load code.
+
+Times `convert_to_columns`, `create_auction_df`, `get_and_remove_invalid_auctions`,
+`clean_and_transform`, `load_to_s3` (against the in-memory S3 stand-in) and, when a DSN is
+given, `load_to_postgres`, on synthetic data. Reports rows/second, peak traced memory and the
+size of the resulting DataFrame (`memory_usage(deep=True)`) for each stage, and saves the
+results as JSON so runs can be compared between versions.
+
+Usage:
+    python bench_stages.py --records 10000 100000 1000000
+    python bench_stages.py --records 10000 --dsn postgresql://postgres@localhost:5432/carsnbids
+    python bench_stages.py --records 10000 --compare results/<previous label>.json
+"""
+import os, sys, json, time, argparse, subprocess, tracemalloc, platform
+from datetime import datetime, timezone
+from functools import partial
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(os.path.dirname(script_dir))
+sys.path.insert(0, os.path.join(repo_dir, 'airflow', 'dags'))
+sys.path.insert(0, script_dir)
+
+import pandas as pd
+
+from etl_scripts import transform as transform_module
+from etl_scripts import load as load_module
+from etl_scripts import storage
+from etl_scripts import pipeline
+from etl_scripts import schema
+from etl_scripts import db
+from generate_auctions import generate_auctions
+
+results_dir = os.path.join(script_dir, 'results')
+
+
+def measure(func, *args, trace_memory:bool=True):
+    """
+    Runs `func(*args)` once and returns (result, seconds, peak traced bytes).
+    """
+    if trace_memory:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def row_count(data)->int:
+    # convert_to_columns output is {column: list of values}
+    if isinstance(data, dict) and data and isinstance(next(iter(data.values())), list):
+        return len(next(iter(data.values())))
+    return len(data)
+
+
+def bench_stages(raw_data, dsn:str=None, repeat:int=1, trace_memory:bool=True)->list:
+    """
+    Runs every stage `repeat` times on the same input and keeps the fastest time.
+
+    Memory is traced on a separate final run so tracemalloc's overhead does not skew timings.
+    """
+    stages = [
+        ("convert_to_columns", transform_module.convert_to_columns, None),
+        ("create_auction_df", transform_module.create_auction_df, None),
+        ("get_and_remove_invalid_auctions", lambda df: transform_module.get_and_remove_invalid_auctions(df)[0], None),
+        ("clean_and_transform", transform_module.clean_and_transform, lambda prev: prev.copy()),
+        ("load_to_s3", lambda df: load_module.load_to_s3(storage.MemoryS3Client(), 'processed-auctions', df), lambda prev: prev.copy()),
+    ]
+
+    results = []
+    stage_input = raw_data
+    cleaned_df = None
+    for name, func, prepare in stages:
+        timings = []
+        for _ in range(repeat):
+            args = prepare(stage_input) if prepare else stage_input
+            output, elapsed, _ = measure(func, args, trace_memory=False)
+            timings.append(elapsed)
+        peak = None
+        if trace_memory:
+            args = prepare(stage_input) if prepare else stage_input
+            _, _, peak = measure(func, args)
+        rows = row_count(stage_input)
+        frame_mb = schema.memory_mb(output) if isinstance(output, pd.DataFrame) else None
+        results.append(stage_result(name, rows, min(timings), peak, frame_mb))
+        print(format_result(results[-1]))
+
+        if name == 'clean_and_transform':
+            cleaned_df = output
+        if name != 'load_to_s3':
+            stage_input = output
+
+    if dsn:
+        results.append(bench_load_to_postgres(cleaned_df, dsn, repeat, trace_memory))
+        print(format_result(results[-1]))
+
+    return results
+
+
+def bench_load_to_postgres(cleaned_df, dsn:str, repeat:int, trace_memory:bool)->dict:
+    # load_to_postgres reads processed records, so round-trip through the NDJSON format first
+    s3_client = storage.MemoryS3Client()
+    keys = load_module.load_to_s3(s3_client, 'processed-auctions', cleaned_df.copy())
+    records = []
+    for key in keys:
+        records.extend(transform_module.load_json_from_s3(s3_client, 'processed-auctions', key, ndjson=True))
+    df = schema.apply_schema(pd.DataFrame(records))
+
+    staging_table = pipeline.staging_table_name(f"bench_{os.getpid()}")
+    with db.connection(dsn) as conn:
+        cursor = conn.cursor()
+        try:
+            timings = []
+            peak = None
+            for attempt in range(repeat + int(trace_memory)):
+                pipeline.run_sql_file(conn, 'create_staging.sql', staging_table)
+                traced = trace_memory and attempt == repeat
+                _, elapsed, attempt_peak = measure(
+                    partial(load_module.load_to_postgres, table=staging_table), df, conn, cursor, trace_memory=traced
+                )
+                if traced:
+                    peak = attempt_peak
+                else:
+                    timings.append(elapsed)
+        finally:
+            cursor.close()
+            pipeline.run_sql_file(conn, 'drop_staging.sql', staging_table)
+    return stage_result('load_to_postgres', len(df), min(timings), peak, schema.memory_mb(df))
+
+
+def stage_result(name:str, rows:int, seconds:float, peak_bytes, frame_mb:float=None)->dict:
+    return {
+        "stage": name,
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_second": round(rows / seconds, 1) if seconds else None,
+        "peak_memory_mb": round(peak_bytes / 2**20, 2) if peak_bytes is not None else None,
+        "frame_memory_mb": frame_mb,
+    }
+
+
+def format_result(result:dict)->str:
+    memory = f"{result['peak_memory_mb']:>9.1f} MB peak" if result['peak_memory_mb'] is not None else "        - MB peak"
+    frame = f"{result['frame_memory_mb']:>9.1f} MB frame" if result.get('frame_memory_mb') is not None else ""
+    return f"  {result['stage']:<33} {result['rows']:>9} rows {result['seconds']:>9.3f}s {result['rows_per_second']:>12.0f} rows/s {memory} {frame}"
+
+
+def git_label()->str:
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], cwd=repo_dir, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+
+
+def compare_results(current:dict, baseline:dict, threshold:float)->list:
+    """
+    Compares two result files and returns the stages that got slower than `threshold` (e.g. 0.1 = 10%).
+    """
+    baseline_index = {
+        (run['records'], run['shape'], stage['stage']): stage
+        for run in baseline['runs'] for stage in run['stages']
+    }
+    regressions = []
+    print(f"\ncompared with {baseline['label']}:")
+    for run in current['runs']:
+        for stage in run['stages']:
+            previous = baseline_index.get((run['records'], run['shape'], stage['stage']))
+            if not previous:
+                continue
+            change = stage['seconds'] / previous['seconds'] - 1 if previous['seconds'] else 0
+            flag = "  REGRESSION" if change > threshold else ""
+            print(f"  {run['records']:>9} {stage['stage']:<33} {previous['seconds']:>9.3f}s -> {stage['seconds']:>9.3f}s ({change:+.1%}){flag}")
+            if flag:
+                regressions.append((run['records'], stage['stage'], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ETL stages on synthetic auctions.")
+    parser.add_argument('--records', type=int, nargs='+', default=[10_000])
+    parser.add_argument('--shape', choices=['list', 'dict'], default='list')
+    parser.add_argument('--repeat', type=int, default=1, help="timed runs per stage (fastest is kept)")
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'), help="Postgres DSN for the load_to_postgres stage")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc pass")
+    parser.add_argument('--label', default=None, help="name of the results file (defaults to git describe)")
+    parser.add_argument('--results-dir', default=results_dir, help="directory the results file is written to")
+    parser.add_argument('--compare', default=None, help="results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    label = args.label or git_label()
+    report = {
+        "label": label,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "runs": [],
+    }
+    for records in args.records:
+        print(f"\n{records} auctions ({args.shape} input)")
+        raw_data = generate_auctions(records, args.shape)
+        stages = bench_stages(raw_data, args.dsn, args.repeat, not args.no_memory)
+        report['runs'].append({"records": records, "shape": args.shape, "stages": stages})
+        del raw_data
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    path = os.path.join(args.results_dir, f"{label}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults saved to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare_results(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+"""
+Query workload benchmark of the warehouse (sql/create_tables.sql).
+
+Seeds a Postgres schema of its own (BENCH_SCHEMA, dropped first unless --keep) with synthetic
+auctions through the real load path: transform_object into in-memory S3, then the staging
+load, load_tables.sql, the market stats and the vehicle history refresh, in batches. At every
+size in --records (cumulative: 100000 then 1000000 adds 900000) it runs the query catalog
+(QUERIES), once without and once with sql/recommended_indexes.sql, and records:
+    - latency percentiles over --runs executions (after one warm-up)
+    - the EXPLAIN (ANALYZE, BUFFERS) plan, its buffer counts and the indexes it used
+
+The recommended index set is validated at every size: each index must be used by at least one
+query, and no query may get more than --threshold slower with the indexes. The script exits
+non-zero if either check fails. Results are saved to results/warehouse_<label>.json (or --results-dir).
+
+Usage:
+    python bench_warehouse.py --records 100000 1000000 10000000 --dsn postgresql://postgres@localhost:5432/carsnbids
+    python bench_warehouse.py --records 1000000 --keep --runs 50 --dsn ...   # reuse the seeded schema
+"""
+import os, re, sys, json, time, argparse, platform
+from datetime import datetime, timezone, timedelta
+from contextlib import contextmanager
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(os.path.dirname(script_dir))
+sys.path.insert(0, os.path.join(repo_dir, 'airflow', 'dags'))
+sys.path.insert(0, script_dir)
+
+import numpy as np
+from psycopg2 import sql
+
+from etl_scripts import storage
+from etl_scripts import pipeline
+from etl_scripts import vehicle_history
+from etl_scripts import db
+from generate_auctions import generate_auctions
+from bench_stages import git_label
+
+results_dir = os.path.join(script_dir, 'results')
+sql_dir = os.path.join(repo_dir, 'airflow', 'dags', 'sql')
+INDEX_FILE = 'recommended_indexes.sql'
+
+BENCH_SCHEMA = 'bench_warehouse'
+# auctions are seeded in time order, AUCTIONS_PER_DAY per day from SEED_START, so every load
+# covers consecutive days like the daily runs do (and the BRIN indexes see realistic correlation);
+# 1M auctions span ~2.7 years of monthly auction_fact partitions
+SEED_START = datetime(2015, 1, 1)
+AUCTIONS_PER_DAY = 1000
+
+# name, what a dashboard or analyst uses it for, query (parameters from `query_params`)
+QUERIES = [
+    ("price_trend_make_model", "monthly median sale price of one make/model, last 3 years", """
+        SELECT date_trunc('month', af.auction_time) AS month, COUNT(*) AS sales,
+            PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY af.max_bid) AS median_price
+        FROM auction_fact af
+        JOIN vehicle_dim vd ON af.vehicle_id = vd.vehicle_id
+        JOIN vehicle_make_dim make_dim ON vd.make_id = make_dim.id
+        JOIN vehicle_model_dim model_dim ON vd.model_id = model_dim.id
+        JOIN auction_status_dim asd ON af.auction_status = asd.id
+        WHERE make_dim.make = %(make)s AND model_dim.model = %(model)s
+            AND asd.status = 'sold'
+            AND af.auction_time >= %(now)s - INTERVAL '3 years'
+        GROUP BY month
+        ORDER BY month
+    """),
+    ("price_trend_market_stats", "the same trend from the monthly aggregates", """
+        SELECT auction_month, SUM(sold_count) AS sales, MAX(median_sale_price) AS median_price
+        FROM market_monthly_stats
+        WHERE make = %(make)s AND model = %(model)s
+            AND auction_month >= (%(now)s - INTERVAL '3 years')::date
+        GROUP BY auction_month
+        ORDER BY auction_month
+    """),
+    ("reserve_met_rate_by_state", "share of reserve auctions that sold, per state, last 12 months", """
+        SELECT sd.state_abbr, COUNT(*) AS reserve_auctions,
+            AVG((asd.status = 'sold')::INT) AS reserve_met_rate
+        FROM auction_fact af
+        JOIN reserve_status_dim rsd ON af.reserve_status = rsd.id
+        JOIN auction_status_dim asd ON af.auction_status = asd.id
+        LEFT JOIN state_dim sd ON af.auction_state = sd.id
+        WHERE rsd.status = 'reserve'
+            AND af.auction_time >= %(now)s - INTERVAL '12 months'
+        GROUP BY sd.state_abbr
+        ORDER BY reserve_auctions DESC
+    """),
+    ("reserve_met_rate_by_seller_type", "share of reserve auctions that sold, per seller type, all time", """
+        SELECT std.seller_type, COUNT(*) AS reserve_auctions,
+            AVG((asd.status = 'sold')::INT) AS reserve_met_rate
+        FROM auction_fact af
+        JOIN reserve_status_dim rsd ON af.reserve_status = rsd.id
+        JOIN auction_status_dim asd ON af.auction_status = asd.id
+        LEFT JOIN seller_type_dim std ON af.seller_type = std.id
+        WHERE rsd.status = 'reserve'
+        GROUP BY std.seller_type
+    """),
+    ("bid_count_distribution", "histogram of bids per auction, last 90 days", """
+        SELECT WIDTH_BUCKET(bid_count, 0, 100, 20) AS bucket, COUNT(*) AS auctions
+        FROM auction_fact
+        WHERE auction_time >= %(now)s - INTERVAL '90 days'
+        GROUP BY bucket
+        ORDER BY bucket
+    """),
+    ("latest_auctions_of_make", "50 most recent auctions of one make (listing page)", """
+        SELECT af.auction_id, af.auction_time, af.auction_title, af.max_bid, asd.status
+        FROM auction_fact af
+        JOIN vehicle_dim vd ON af.vehicle_id = vd.vehicle_id
+        JOIN vehicle_make_dim make_dim ON vd.make_id = make_dim.id
+        LEFT JOIN auction_status_dim asd ON af.auction_status = asd.id
+        WHERE make_dim.make = %(make)s
+        ORDER BY af.auction_time DESC
+        LIMIT 50
+    """),
+    ("top_bidders_30_days", "most active bidders of the last 30 days", """
+        SELECT bidder, COUNT(*) AS bids, COUNT(DISTINCT auction_id) AS auctions
+        FROM bid_fact
+        WHERE bid_time >= %(now)s - INTERVAL '30 days'
+        GROUP BY bidder
+        ORDER BY bids DESC
+        LIMIT 20
+    """),
+    ("bidder_history", "every bid of one bidder with its auction", """
+        SELECT bf.auction_id, bf.seq, bf.bid_amount, bf.bid_time, af.auction_title
+        FROM bid_fact bf
+        JOIN auction_fact af ON af.auction_id = bf.auction_id
+        WHERE bf.bidder = %(bidder)s
+        ORDER BY bf.bid_time DESC
+    """),
+    ("auction_detail", "one auction with its vehicle and bids (auction page)", """
+        SELECT af.auction_id, af.auction_time, af.max_bid, vd.vin, vd.mileage, bf.seq, bf.bid_amount, bf.bidder
+        FROM auction_fact af
+        LEFT JOIN vehicle_dim vd ON af.vehicle_id = vd.vehicle_id
+        LEFT JOIN bid_fact bf ON bf.auction_id = af.auction_id
+        WHERE af.auction_id = %(auction_id)s
+        ORDER BY bf.seq
+    """),
+    ("vin_history", "auction history of one VIN", """
+        SELECT auction_number, auction_id, auction_time, sold, high_bid, mileage, is_relist
+        FROM vehicle_history
+        WHERE vin = %(vin)s
+        ORDER BY auction_time, auction_id
+    """),
+    ("sold_per_year_band_body_style", "sales and average price by model-year band and body style, last 12 months", """
+        SELECT year_band, body_style, SUM(sold_count) AS sales,
+            SUM(avg_sale_price * sold_count) / NULLIF(SUM(sold_count), 0) AS avg_price
+        FROM market_monthly_stats
+        WHERE auction_month >= (%(now)s - INTERVAL '12 months')::date
+        GROUP BY year_band, body_style
+        ORDER BY sales DESC
+    """),
+]
+
+
+@contextmanager
+def bench_connection(dsn:str, schema:str=BENCH_SCHEMA):
+    # pooled connection with the benchmark schema first on the search_path, so the unqualified
+    # names in sql/ resolve to the benchmark's tables
+    with db.connection(dsn) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("SET search_path TO {}, public").format(sql.Identifier(schema)))
+        conn.commit()
+        yield conn
+
+
+def reset_schema(dsn:str, schema:str=BENCH_SCHEMA):
+    with db.connection(dsn) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("DROP SCHEMA IF EXISTS {0} CASCADE; CREATE SCHEMA {0}").format(sql.Identifier(schema)))
+        conn.commit()
+    with bench_connection(dsn, schema) as conn:
+        pipeline.run_sql_file(conn, 'create_tables.sql')
+        pipeline.run_sql_file(conn, 'load_auction_states.sql')
+        with conn.cursor() as cursor:
+            # raw auctions seeded so far (the load drops invalid ones, so auction_fact has fewer)
+            cursor.execute("CREATE TABLE bench_seed (auctions BIGINT NOT NULL)")
+            cursor.execute("INSERT INTO bench_seed VALUES (0)")
+        conn.commit()
+
+
+def scalar(conn, query:str, params=None):
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        value = cursor.fetchone()[0]
+    conn.commit()
+    return value
+
+
+def seed(dsn:str, start_count:int, target:int, batch_size:int, engine:str=None)->dict:
+    """
+    Loads auctions start_count..target-1 through the real load path, `batch_size` at a time.
+
+    Returns:
+        dict: {"auctions": int, "seconds": float, "auctions_per_second": float}
+    """
+    start = time.perf_counter()
+    for offset in range(start_count, target, batch_size):
+        records = min(batch_size, target - offset)
+        raw_data = generate_auctions(
+            records, seed=offset, start=SEED_START + timedelta(days=offset / AUCTIONS_PER_DAY),
+            days=max(1, records // AUCTIONS_PER_DAY), offset=offset,
+        )
+        s3_client = storage.MemoryS3Client()
+        key = f"bench_{offset}.json"
+        s3_client.put_object(Bucket='raw-auctions', Key=key, Body=json.dumps(raw_data).encode('utf-8'))
+        del raw_data
+
+        results = pipeline.transform_object(s3_client, key, 'raw-auctions', 'processed-auctions', engine=engine)
+        run_id = f"bench_{os.getpid()}_{offset}"
+        staging_table = pipeline.staging_table_name(run_id)
+        with bench_connection(dsn) as conn:
+            pipeline.run_sql_file(conn, 'create_staging.sql', staging_table)
+            try:
+                pipeline.load_keys_to_staging(s3_client, 'processed-auctions', results['processed_auction_keys'], conn, staging_table)
+                pipeline.load_warehouse_tables(conn, staging_table, run_id)
+                pipeline.refresh_market_stats(conn, staging_table)
+                vehicle_history.refresh_history(conn, staging_table)
+            finally:
+                pipeline.run_sql_file(conn, 'drop_staging.sql', staging_table)
+            with conn.cursor() as cursor:
+                cursor.execute("UPDATE bench_seed SET auctions = %s", (offset + records,))
+            conn.commit()
+        print(f"seeded {offset + records}/{target} auctions")
+
+    with bench_connection(dsn) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE")
+        conn.autocommit = False
+    seconds = time.perf_counter() - start
+    loaded = target - start_count
+    return {"auctions": loaded, "seconds": round(seconds, 2), "auctions_per_second": round(loaded / seconds, 1) if seconds else None}
+
+
+def query_params(conn)->dict:
+    """
+    Parameters of the catalog, taken from the seeded data so every query finds rows.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT MAX(auction_time) FROM auction_fact")
+        now = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT af.auction_id, vd.vin FROM auction_fact af
+            JOIN vehicle_dim vd ON af.vehicle_id = vd.vehicle_id
+            ORDER BY af.auction_id LIMIT 1
+        """)
+        auction_id, vin = cursor.fetchone()
+        cursor.execute("SELECT bidder FROM bid_fact WHERE auction_id = %s AND bidder IS NOT NULL LIMIT 1", (auction_id,))
+        row = cursor.fetchone()
+    conn.commit()
+    return {
+        "now": now, "make": "Porsche", "model": "911", "auction_id": auction_id, "vin": vin,
+        "bidder": row[0] if row else 'bidder1',
+    }
+
+
+def recommended_index_names(path:str=os.path.join(sql_dir, INDEX_FILE))->list:
+    with open(path) as f:
+        return re.findall(r'CREATE INDEX IF NOT EXISTS (\w+)', f.read())
+
+
+def drop_recommended_indexes(conn):
+    with conn.cursor() as cursor:
+        for name in recommended_index_names():
+            cursor.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(name)))
+        cursor.execute("ANALYZE")
+    conn.commit()
+
+
+def create_recommended_indexes(conn)->float:
+    start = time.perf_counter()
+    pipeline.run_sql_file(conn, INDEX_FILE)
+    seconds = time.perf_counter() - start
+    with conn.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    conn.commit()
+    return seconds
+
+
+def index_family(conn, name:str)->set:
+    # the index and, for an index on a partitioned table, the per-partition indexes attached to it
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT relid::regclass::TEXT FROM pg_partition_tree(%s::regclass)", (name,))
+        names = {row[0].split('.')[-1] for row in cursor.fetchall()}
+    conn.commit()
+    return names | {name}
+
+
+def plan_nodes(plan:dict):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def explain(conn, query:str, params:dict)->dict:
+    with conn.cursor() as cursor:
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+        result = cursor.fetchone()[0][0]
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+        text = "\n".join(row[0] for row in cursor.fetchall())
+    conn.rollback()
+    nodes = list(plan_nodes(result['Plan']))
+    return {
+        "execution_ms": result['Execution Time'],
+        "shared_hit_blocks": result['Plan'].get('Shared Hit Blocks', 0),
+        "shared_read_blocks": result['Plan'].get('Shared Read Blocks', 0),
+        "scans": sorted({f"{node['Node Type']} on {node['Relation Name']}" for node in nodes if 'Relation Name' in node}),
+        "indexes": sorted({node['Index Name'] for node in nodes if 'Index Name' in node}),
+        "plan": text,
+    }
+
+
+def time_query(conn, query:str, params:dict, runs:int)->dict:
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        cursor.fetchall()
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            cursor.execute(query, params)
+            cursor.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+    conn.rollback()
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        "min_ms": round(min(timings), 3), "p50_ms": round(p50, 3), "p95_ms": round(p95, 3),
+        "p99_ms": round(p99, 3), "max_ms": round(max(timings), 3),
+    }
+
+
+def run_catalog(conn, params:dict, runs:int)->dict:
+    results = {}
+    for name, _, query in QUERIES:
+        results[name] = {**time_query(conn, query, params, runs), **explain(conn, query, params)}
+        result = results[name]
+        print(f"  {name:<33} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  p99 {result['p99_ms']:>9.2f}ms"
+              f"  {result['shared_hit_blocks'] + result['shared_read_blocks']:>8} buffers  {', '.join(result['indexes']) or '-'}")
+    return results
+
+
+def validate(conn, baseline:dict, indexed:dict, threshold:float, slack_ms:float=1.0)->list:
+    """
+    Returns the problems of the recommended index set: indexes no query used, and queries
+    whose fastest run is more than `threshold` (plus `slack_ms`, for sub-millisecond noise)
+    slower with the indexes. Queries whose plan reads the same tables and indexes either way
+    are not compared, as their timings only differ by noise.
+    """
+    problems = []
+    used = set().union(*(result['indexes'] for result in indexed.values()))
+    for name in recommended_index_names():
+        if not index_family(conn, name) & used:
+            problems.append(f"index {name} is not used by any query")
+    for name, result in indexed.items():
+        if (result['scans'], result['indexes']) == (baseline[name]['scans'], baseline[name]['indexes']):
+            continue
+        before = baseline[name]['min_ms']
+        if result['min_ms'] > before * (1 + threshold) + slack_ms:
+            problems.append(f"{name} is slower with the indexes ({before:.2f}ms -> {result['min_ms']:.2f}ms)")
+    return problems
+
+
+def table_sizes(conn)->dict:
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT name, pg_total_relation_size(name::regclass)
+            FROM UNNEST(ARRAY['auction_fact', 'vehicle_dim', 'bid_fact', 'vehicle_history', 'auction_changelog']) AS name
+        """)
+        sizes = {name: size for name, size in cursor.fetchall()}
+        # a partitioned table has no storage of its own
+        cursor.execute("SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0) FROM pg_partition_tree('auction_fact')")
+        sizes['auction_fact'] = int(cursor.fetchone()[0])
+    conn.commit()
+    return {name: round(size / 2**20, 1) for name, size in sizes.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the warehouse query workload and validate the recommended indexes.")
+    parser.add_argument('--records', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'), required=not os.getenv('DATABASE_URL'))
+    parser.add_argument('--runs', type=int, default=20, help="timed executions per query")
+    parser.add_argument('--batch-size', type=int, default=50_000, help="auctions per seeding load")
+    parser.add_argument('--engine', default=None, help="transform engine used for seeding")
+    parser.add_argument('--keep', action='store_true', help="reuse the auctions already in the benchmark schema")
+    parser.add_argument('--threshold', type=float, default=0.25, help="slowdown with the indexes that fails validation")
+    parser.add_argument('--label', default=None, help="name of the results file (defaults to git describe)")
+    parser.add_argument('--results-dir', default=results_dir, help="directory the results file is written to")
+    args = parser.parse_args()
+
+    if not args.keep:
+        reset_schema(args.dsn)
+
+    label = args.label or git_label()
+    report = {
+        "label": label,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "queries": {name: description for name, description, _ in QUERIES},
+        "runs": [],
+    }
+    problems = []
+    for records in sorted(args.records):
+        with bench_connection(args.dsn) as conn:
+            existing = scalar(conn, "SELECT auctions FROM bench_seed")
+            postgres_version = scalar(conn, "SHOW server_version")
+        seeding = None
+        if existing < records:
+            print(f"\nseeding {records - existing} auctions")
+            seeding = seed(args.dsn, existing, records, args.batch_size, args.engine)
+
+        with bench_connection(args.dsn) as conn:
+            auctions = scalar(conn, "SELECT COUNT(*) FROM auction_fact")
+            params = query_params(conn)
+            sizes = table_sizes(conn)
+            print(f"\n{auctions} auctions ({', '.join(f'{name} {mb} MB' for name, mb in sizes.items())})")
+
+            drop_recommended_indexes(conn)
+            print("without recommended indexes")
+            baseline = run_catalog(conn, params, args.runs)
+
+            index_seconds = create_recommended_indexes(conn)
+            print(f"with recommended indexes (built in {index_seconds:.1f}s)")
+            indexed = run_catalog(conn, params, args.runs)
+
+            run_problems = validate(conn, baseline, indexed, args.threshold)
+        for problem in run_problems:
+            print(f"  VALIDATION: {problem}")
+        problems.extend(f"{auctions}: {problem}" for problem in run_problems)
+
+        report['postgres'] = postgres_version
+        report['runs'].append({
+            "seeded_auctions": max(existing, records),
+            "records": auctions,
+            "seeding": seeding,
+            "table_mb": sizes,
+            "index_build_seconds": round(index_seconds, 2),
+            "baseline": baseline,
+            "indexed": indexed,
+            "problems": run_problems,
+        })
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    path = os.path.join(args.results_dir, f"warehouse_{label}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"\nresults saved to {path}")
+
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
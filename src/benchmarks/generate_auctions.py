@@ -0,0 +1,180 @@
+"""
+Generates synthetic raw auction files that look like the scraper's output.
+
+Both input shapes accepted by `transform.convert_to_columns` are supported:
+    - list: [{auction_data}, ...]        (scraper / rescrape output)
+    - dict: {url: {auction_data}, ...}   (older archive files)
+
+Usage:
+    python generate_auctions.py --records 10000 100000 1000000 --shape list --output-dir ./data/raw-auctions
+"""
+import os, json, random, argparse
+from datetime import datetime, timedelta
+
+
+MAKES = {
+    "Porsche": ["911", "Cayman", "Boxster", "Cayenne", "Macan", "Panamera"],
+    "BMW": ["M3", "M5", "Z4", "X5", "335i", "M2"],
+    "Toyota": ["Land Cruiser", "4Runner", "Tacoma", "Supra", "MR2", "Tundra"],
+    "Ford": ["Mustang", "F-150", "Bronco", "Ranger", "GT", "Focus RS"],
+    "Chevrolet": ["Corvette", "Camaro", "Silverado 1500", "Tahoe", "C10"],
+    "Mercedes-Benz": ["G-Class", "SL-Class", "E-Class", "C63 AMG"],
+    "Honda": ["S2000", "Civic Type R", "NSX", "Prelude"],
+    "Land Rover": ["Defender", "Range Rover", "Discovery"],
+    "Audi": ["RS6", "R8", "S4", "TT RS"],
+    "Nissan": ["GT-R", "350Z", "Skyline", "Frontier"],
+}
+BODY_STYLES = ["Coupe", "Sedan", "SUV/Crossover", "Convertible", "Truck", "Hatchback", "Wagon", "Van/Minivan"]
+DRIVETRAINS = ["Rear-wheel drive", "Front-wheel drive", "4WD/AWD", "All-wheel drive", "Four-wheel drive", None]
+TRANSMISSIONS = [
+    "Manual (6-Speed)", "Manual (5-Speed)", "Manual (4-Speed)", "Automatic (8-Speed)", "Automatic (7-Speed)",
+    "Automatic (4-Speed)", "Automatic (10-Speed)", "Automatic (CVT)", "Automatic", "Manual", None,
+]
+COLORS = ["Black", "White", "Silver", "Guards Red", "Grey", "Blue", "Green", "Yellow", "Orange", "Brown"]
+LOCATIONS = [
+    "Buford, GA 30518", "Eugene, OR 97404", "Scottsboro, AL 35769", "Tualatin, OR 97062", "Weston, FL 33326",
+    "Los Angeles, CA 90001", "Austin, TX 78701", "Brooklyn, NY 11201", "Denver, CO 80202", "Seattle, WA 98101",
+    "Scottsdale, AZ 85251", "Chicago, IL 60601", "Toronto, ON M5V 2T6", "Vancouver, BC V6B 1A1", "Miami", None,
+]
+TITLE_STATES = ["CA", "FL", "TX", "NY", "OR", "GA", "AZ", "WA", "CO", "IL", "ON", "BC"]
+TITLE_STATUSES = ["Clean ({state})", "Salvage ({state})", "Rebuilt ({state})", "Clean ({state})", "Clean ({state})"]
+STATUSES = ["Sold to", "Sold to", "Sold to", "Reserve not met, bid to", "Cancelled", "Sold", "Reserve Not Met", None]
+SELLER_TYPES = ["Private Party", "Dealer"]
+
+
+def format_mileage(rng:random.Random)->str:
+    miles = rng.randint(5, 250_000)
+    style = rng.random()
+    if style < 0.75:
+        return f"{miles:,} Miles"
+    if style < 0.85:
+        return f"{miles // 1000}k Miles"
+    if style < 0.9:
+        return f"{miles:,} Miles Shown, True Mileage Unknown"
+    if style < 0.95:
+        return f"{miles:,} Kilometers (~{int(miles * 0.62):,} Miles)"
+    return "TMU"
+
+
+def format_money(value:int)->str:
+    return f"${value:,}"
+
+
+def generate_auction(rng:random.Random, index:int, start:datetime, days:int=60)->dict:
+    make = rng.choice(list(MAKES))
+    model = rng.choice(MAKES[make])
+    year = rng.randint(1965, 2024)
+    auction_id = f"{index:08x}"[-8:]
+    slug = f"{year}-{make}-{model}".lower().replace(" ", "-")
+    url = f"https://carsandbids.com/auctions/{auction_id}/{slug}"
+    status = rng.choice(STATUSES)
+    state = rng.choice(TITLE_STATES)
+
+    bid_count = rng.randint(0, 60)
+    price = rng.randint(20, 4000) * 250
+    bids = sorted((max(100, price - rng.randint(0, price)) // 50 * 50 for _ in range(bid_count)), reverse=True)
+    if bids:
+        bids[0] = price
+    auction_date = start + timedelta(minutes=rng.randint(0, days * 24 * 60))
+    # newest bid first, like the bid history on the page
+    bid_times = []
+    bid_time = auction_date
+    for _ in bids:
+        bid_time -= timedelta(seconds=rng.randint(5, 6 * 3600))
+        bid_times.append(bid_time.strftime("%Y-%m-%dT%H:%M:%S.000Z"))
+
+    return {
+        "auction_url": url,
+        "auction_title": f"{year} {make} {model}",
+        "auction_subtitle": rng.choice(["~1 Owner", "No Reserve", "Modified", "Unmodified, Clean Carfax", "6-Speed Manual"]),
+        "auction_stats": {
+            "reserve_status": rng.choice(["Reserve", "No Reserve"]),
+            "auction_status": status,
+            "highest_bid_value": format_money(price) if status else None,
+            "buyer_username": None,
+            "seller_username": f"seller{rng.randint(1, 50_000)}",
+            "bid_count": bid_count,
+            "view_count": f"{rng.randint(100, 60_000):,}",
+            "watcher_count": rng.randint(0, 3000),
+            "auction_date": auction_date.strftime("%b %d, %Y %-I:%M %p UTC"),
+            "bids": [format_money(bid) for bid in bids],
+            "bid_times": bid_times,
+            "bid_bidders": [f"bidder{rng.randint(1, 20_000)}" for _ in bids],
+        },
+        "auction_quick_facts": {
+            "Make": make,
+            "Model": f"{model}\nSave",
+            "Mileage": format_mileage(rng),
+            "VIN": "".join(rng.choices("ABCDEFGHJKLMNPRSTUVWXYZ0123456789", k=17)),
+            "Title Status": rng.choice(TITLE_STATUSES).format(state=state),
+            "Location": rng.choice(LOCATIONS),
+            "Seller": f"seller{rng.randint(1, 50_000)}\nFollow",
+            "Engine": rng.choice(["3.8L Flat-6", "5.0L V8", "2.0L Turbo I4", "4.4L Twin-Turbo V8", "3.0L Turbo I6"]),
+            "Drivetrain": rng.choice(DRIVETRAINS),
+            "Transmission": rng.choice(TRANSMISSIONS),
+            "Body Style": rng.choice(BODY_STYLES),
+            "Exterior Color": rng.choice(COLORS),
+            "Interior Color": rng.choice(COLORS),
+            "Seller Type": rng.choice(SELLER_TYPES),
+        },
+        "dougs_take": "This is a well-kept example with desirable options. " * rng.randint(1, 6),
+        "auction_highlights": {
+            "description": "Highlights of this car.",
+            "bullet_points": [f"Highlight {i}" for i in range(rng.randint(0, 12))],
+        },
+        "known_flaws": [f"Flaw {i}" for i in range(rng.randint(0, 6))],
+        "service_history": {
+            "description": "Recent service",
+            "items": [f"Service item {i}" for i in range(rng.randint(0, 8))],
+        },
+        "included_items": [f"Item {i}" for i in range(rng.randint(0, 4))],
+        "ownership_history": "Purchased new by the seller." if rng.random() < 0.5 else None,
+        "seller_notes": [f"Note {i}" for i in range(rng.randint(0, 4))],
+        "auction_videos": [f"vid{rng.randint(0, 10**6)}" for _ in range(rng.randint(0, 2))],
+        "auction_equipment": [f"Equipment {i}" for i in range(rng.randint(0, 15))],
+        "modifications": [f"Mod {i}" for i in range(rng.randint(0, 5))] if rng.random() < 0.3 else None,
+    }
+
+
+def generate_auctions(records:int, shape:str='list', seed:int=0, start:datetime=datetime(2025, 1, 1), days:int=60, offset:int=0):
+    """
+    Generates `records` synthetic raw auctions.
+
+    Args:
+        records (int): Number of auctions.
+        shape (str): 'list' for [{auction_data}] or 'dict' for {url: {auction_data}}.
+        seed (int): Random seed, so runs are reproducible.
+        start (datetime): Earliest auction end date; dates spread over the following `days` days.
+        days (int): Length of the date range.
+        offset (int): Index of the first auction, so batches generated separately get distinct auction_ids.
+
+    Returns:
+        list or dict: Raw auction data in the requested shape.
+    """
+    rng = random.Random(seed)
+    auctions = [generate_auction(rng, index, start, days) for index in range(offset, offset + records)]
+    if shape == 'list':
+        return auctions
+    if shape == 'dict':
+        return {auction.pop('auction_url'): auction for auction in auctions}
+    raise ValueError("shape must be 'list' or 'dict'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic raw auction files.")
+    parser.add_argument('--records', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--shape', choices=['list', 'dict'], default='list')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', default='./data/raw-auctions')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for records in args.records:
+        path = os.path.join(args.output_dir, f"synthetic_{args.shape}_{records}.json")
+        with open(path, 'w') as f:
+            json.dump(generate_auctions(records, args.shape, args.seed), f)
+        print(f"wrote {records} auctions to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import os, sys, json
+import pytest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(tests_dir)
+sys.path.insert(0, os.path.join(repo_dir, 'airflow', 'dags'))
+# normalizer results must come from the code under test, not from a memo of earlier runs
+os.environ['NORMALIZER_MEMO_PATH'] = ''
+
+FIXTURES_DIR = os.path.join(tests_dir, 'fixtures')
+
+
+@pytest.fixture
+def raw_auctions()->list:
+    """
+    Raw auctions as the scraper writes them, with the edge cases the transform must handle
+    (see fixtures/README.md).
+    """
+    with open(os.path.join(FIXTURES_DIR, 'raw_auctions.json')) as f:
+        return json.load(f)
@@ -0,0 +1,76 @@
+import json
+import botocore.exceptions
+import pytest
+
+from etl_scripts import auction_index
+from etl_scripts import manifest as manifest_module
+from etl_scripts import pipeline
+from etl_scripts import storage
+
+BUCKET = 'processed-auctions'
+
+
+def put_raw(s3_client, key:str, raw_auctions):
+    s3_client.put_object(Bucket='raw-auctions', Key=key, Body=json.dumps(raw_auctions).encode('utf-8'))
+
+
+def indexed(s3_client)->dict:
+    with auction_index.opened(s3_client, BUCKET, save=False) as index:
+        return dict(((auction_id, key) for auction_id, key, _ in index.conn.execute("SELECT * FROM auctions")))
+
+
+def test_retry_after_index_saved_still_reports_day_files(raw_auctions):
+    s3_client = storage.MemoryS3Client()
+    put_raw(s3_client, 'a.json', raw_auctions)
+    first = pipeline.transform_object(s3_client, 'a.json', 'raw-auctions', BUCKET)
+    assert first['processed_auction_keys']
+
+    # the task failed after the index was saved but before the manifest recorded the source
+    s3_client.objects.pop((BUCKET, manifest_module.MANIFEST_OBJECT_KEY))
+    retried = pipeline.transform_object(s3_client, 'a.json', 'raw-auctions', BUCKET)
+    assert retried['processed_auction_keys'] == first['processed_auction_keys']
+
+    manifest = manifest_module.load_manifest(s3_client, BUCKET)
+    entry = manifest["sources"]["raw-auctions/a.json"]
+    assert entry['processed_keys'] == first['processed_auction_keys']
+
+
+def test_update_reruns_apply_when_another_run_saved_first(raw_auctions):
+    s3_client = storage.MemoryS3Client()
+    calls = []
+
+    def apply(index):
+        calls.append(len(calls))
+        if len(calls) == 1:
+            # another transform records its auction between our download and save
+            auction_index.update(s3_client, BUCKET, lambda other: other.record(['other'], ['2025-01-01.json'], ['h1']))
+        index.record([f"mine{len(calls)}"], ['2025-01-02.json'], ['h2'])
+        return len(calls)
+
+    assert auction_index.update(s3_client, BUCKET, apply) == 2
+    assert indexed(s3_client) == {'other': '2025-01-01.json', 'mine2': '2025-01-02.json'}
+
+
+def test_update_gives_up_after_attempts():
+    s3_client = storage.MemoryS3Client()
+
+    def apply(index):
+        auction_index.update(s3_client, BUCKET, lambda other: other.record([f"x{id(index)}"], ['k.json'], ['h']))
+        index.record(['mine'], ['k.json'], ['h'])
+
+    with pytest.raises(RuntimeError):
+        auction_index.update(s3_client, BUCKET, apply, attempts=2)
+
+
+def test_read_errors_other_than_missing_are_raised():
+    class Throttled(storage.MemoryS3Client):
+        def get_object(self, **kwargs):
+            raise botocore.exceptions.ClientError({'Error': {'Code': 'SlowDown'}}, 'GetObject')
+
+    with pytest.raises(botocore.exceptions.ClientError):
+        with auction_index.opened(Throttled(), BUCKET):
+            pass
+
+
+def test_missing_index_starts_empty():
+    assert indexed(storage.MemoryS3Client()) == {}
@@ -0,0 +1,74 @@
+import json, math
+import pandas as pd
+import pytest
+
+from etl_scripts import ndjson
+from etl_scripts import load as load_module
+from etl_scripts import pipeline
+from etl_scripts import storage
+from etl_scripts import transform as transform_module
+from etl_scripts import transform_engines
+
+
+def processed_frame(raw_auctions:list)->pd.DataFrame:
+    df = transform_module.create_auction_df(transform_module.convert_to_columns(raw_auctions))
+    engine = transform_engines.get_engine('pandas')
+    filtered_df, _ = engine.get_and_remove_invalid_auctions(df)
+    return engine.clean_and_transform(filtered_df)
+
+
+def legacy_day_file(df:pd.DataFrame)->bytes:
+    # how load_to_s3 merged day files before ndjson.py: JSON records read back into a frame,
+    # then json.dumps per record, which writes the NaN of a numeric column with nulls as NaN
+    records = ndjson.decode_records(ndjson.encode_frame(df))
+    legacy_records = pd.DataFrame(records).to_dict(orient='records')
+    return "\n".join(json.dumps(record) for record in legacy_records).encode('utf-8')
+
+
+def test_decode_legacy_nan_tokens():
+    records = ndjson.decode_records(b'{"auction_id": "a", "mileage": NaN, "max_bid": 100}\n{"auction_id": "b", "mileage": 5, "max_bid": Infinity}')
+    assert records[0]['auction_id'] == 'a' and math.isnan(records[0]['mileage'])
+    assert records[1]['max_bid'] == float('inf')
+
+
+def test_round_trip_keeps_nulls_dates_and_lists(raw_auctions):
+    df = processed_frame(raw_auctions)
+    records = ndjson.decode_records(ndjson.encode_frame(df))
+    assert [record['auction_id'] for record in records] == df['auction_id'].tolist()
+    empty = next(record for record in records if record['auction_id'] == '00000001')
+    assert empty['bids'] == [] and empty['bid_times'] is None
+    nulls = next(record for record in records if record['auction_id'] == '00000000')
+    assert nulls['mileage'] is None and nulls['highest_bid_value'] is None and nulls['bid_count'] is None
+    assert all(isinstance(record['auction_date'], int) for record in records)
+
+
+def test_merge_into_legacy_day_file(raw_auctions):
+    df = processed_frame(raw_auctions)
+    day = df['auction_date'].dt.date.astype(str) + '.json'
+    key = day.value_counts().index[0]
+    existing, new = df[day == key].iloc[:-1], df[day == key].iloc[-1:]
+    body = legacy_day_file(existing)
+    assert b'NaN' in body
+
+    s3_client = storage.MemoryS3Client()
+    s3_client.put_object(Bucket='processed-auctions', Key=key, Body=body)
+    assert load_module.load_to_s3(s3_client, 'processed-auctions', new) == [key]
+
+    merged = pipeline.read_processed_file(s3_client, 'processed-auctions', key)
+    assert sorted(merged['auction_id']) == sorted(df.loc[day == key, 'auction_id'])
+
+
+def test_staging_read_of_legacy_day_file(raw_auctions):
+    df = processed_frame(raw_auctions)
+    s3_client = storage.MemoryS3Client()
+    s3_client.put_object(Bucket='processed-auctions', Key='2025-01-04.json', Body=legacy_day_file(df))
+
+    staged = pipeline.read_processed_file(s3_client, 'processed-auctions', '2025-01-04.json')
+    assert len(staged) == len(df)
+    assert staged['mileage'].isna().sum() == df['mileage'].isna().sum()
+
+
+@pytest.mark.skipif(ndjson.orjson is None, reason="orjson not installed")
+def test_orjson_backend_falls_back_for_nan():
+    assert ndjson.BACKEND == 'orjson'
+    assert math.isnan(ndjson.decode_records(b'{"mileage": NaN}')[0]['mileage'])
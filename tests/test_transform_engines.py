@@ -0,0 +1,114 @@
+import copy
+import pytest
+
+pytest.importorskip('polars')
+
+from etl_scripts import ndjson
+from etl_scripts import load as load_module
+from etl_scripts import storage
+from etl_scripts import transform as transform_module
+from etl_scripts import transform_engines
+
+ENGINES = list(transform_engines.ENGINES)
+
+
+def run_engine(name:str, raw_auctions, projection:str='full')->tuple:
+    """
+    Returns ({day file key: bytes}, rescrape urls) of one engine, written with load_to_s3.
+    """
+    engine = transform_engines.get_engine(name)
+    df = transform_module.create_auction_df(transform_module.convert_to_columns(raw_auctions, projection))
+    filtered_df, rescrape_urls = engine.get_and_remove_invalid_auctions(df)
+    cleaned_df = engine.clean_and_transform(filtered_df)
+
+    s3_client = storage.MemoryS3Client()
+    load_module.load_to_s3(s3_client, 'processed-auctions', cleaned_df)
+    return {key: data for (_, key), data in s3_client.objects.items()}, rescrape_urls
+
+
+def processed_records(name:str, raw_auctions)->dict:
+    files, _ = run_engine(name, raw_auctions)
+    return {
+        record['auction_id']: record
+        for body in files.values() for record in ndjson.decode_records(body)
+    }
+
+
+def assert_same_output(raw_auctions, projection:str='full'):
+    reference = run_engine('pandas', raw_auctions, projection)
+    for name in ENGINES:
+        files, rescrape_urls = run_engine(name, raw_auctions, projection)
+        assert sorted(files) == sorted(reference[0]), name
+        for key in files:
+            assert files[key] == reference[0][key], f"{name}: {key} differs"
+        assert rescrape_urls == reference[1], name
+
+
+@pytest.mark.parametrize('projection', list(transform_module.PROJECTIONS))
+def test_engines_write_identical_day_files(raw_auctions, projection):
+    assert_same_output(raw_auctions, projection)
+
+
+def test_engines_accept_dict_shaped_files(raw_auctions):
+    # older archive files are {url: auction}; the duplicated auction keeps its newest copy
+    assert_same_output({auction.pop('auction_url'): auction for auction in raw_auctions})
+
+
+@pytest.mark.parametrize('name', ENGINES)
+def test_invalid_auctions_are_rescraped(raw_auctions, name):
+    _, rescrape_urls = run_engine(name, raw_auctions)
+    assert [url.split('/')[4] for url in rescrape_urls] == ['00000002', '00000007']
+
+
+@pytest.mark.parametrize('name', ENGINES)
+def test_nulls_and_empty_lists(raw_auctions, name):
+    records = processed_records(name, raw_auctions)
+    nulls = records['00000000']
+    assert nulls['mileage'] is None and nulls['highest_bid_value'] is None and nulls['location'] is None
+    empty = records['00000001']
+    assert empty['bids'] == [] and empty['bid_count'] == 0
+    assert empty['bid_times'] is None and empty['bid_bidders'] is None
+    assert empty['known_flaws'] == [] and empty['flaw_count'] == 0 and empty['video_count'] == 0
+
+
+@pytest.mark.parametrize('name', ENGINES)
+def test_bid_details_stay_aligned_with_bids(raw_auctions, name):
+    records = processed_records(name, raw_auctions)
+    for record in records.values():
+        for col in ('bid_times', 'bid_bidders'):
+            assert record[col] is None or len(record[col]) == len(record['bids']), (record['auction_id'], col)
+
+    # lists that don't match the bids are dropped, not misattributed
+    assert records['00000003']['bid_times'] is None and records['00000003']['bid_bidders'] is None
+    # an unparseable bid time is null at its position only
+    times = records['00000004']['bid_times']
+    assert times[0] is None and all(isinstance(t, int) for t in times[1:])
+    # unparseable bid amounts leave no bids, so no details either
+    assert records['0000000a']['bids'] == [] and records['0000000a']['bid_times'] is None
+
+
+@pytest.mark.parametrize('name', ENGINES)
+def test_newest_copy_of_a_duplicate_wins(raw_auctions, name):
+    records = processed_records(name, raw_auctions)
+    assert records['00000009']['view_count'] == 99_999
+
+
+def test_engines_agree_on_other_date_formats(raw_auctions):
+    for auction in raw_auctions:
+        auction['auction_stats']['auction_date'] = '2025-01-03T10:15:00Z'
+    assert_same_output(raw_auctions)
+
+
+@pytest.mark.parametrize('auction_date', [None, ''])
+def test_engines_agree_on_missing_dates(raw_auctions, auction_date):
+    raw_auctions[3]['auction_stats']['auction_date'] = auction_date
+    assert_same_output(raw_auctions)
+
+
+@pytest.mark.parametrize('auction_date', ['not a date', '2025-01-03T10:15:00Z'])
+def test_malformed_dates_fail_in_every_engine(raw_auctions, auction_date):
+    # pandas infers one format per file: an unparseable date, or a second format, fails the file
+    raw_auctions[3]['auction_stats']['auction_date'] = auction_date
+    for name in ENGINES:
+        with pytest.raises(ValueError):
+            run_engine(name, copy.deepcopy(raw_auctions))
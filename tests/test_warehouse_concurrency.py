@@ -0,0 +1,150 @@
+import os, json, copy, threading
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+import pytest
+from psycopg2 import sql
+
+from etl_scripts import db
+from etl_scripts import pipeline
+from etl_scripts import storage
+from etl_scripts import vehicle_history
+
+# a scratch database: the tests create and drop their own schema in it
+DSN = os.getenv('TEST_DATABASE_URL')
+SCHEMA = 'test_warehouse_concurrency'
+ROUNDS = 5
+
+pytestmark = pytest.mark.skipif(not DSN, reason="needs TEST_DATABASE_URL (a scratch Postgres database)")
+
+
+@contextmanager
+def connection():
+    # pooled connection with the test schema first on the search_path, so the unqualified
+    # names in sql/ resolve to the test's tables
+    with db.connection(DSN) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("SET search_path TO {}, public").format(sql.Identifier(SCHEMA)))
+        conn.commit()
+        yield conn
+
+
+def scalar(query:str, params=None):
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            value = cursor.fetchone()[0]
+        conn.commit()
+    return value
+
+
+@pytest.fixture
+def warehouse():
+    with db.connection(DSN) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("DROP SCHEMA IF EXISTS {0} CASCADE; CREATE SCHEMA {0}").format(sql.Identifier(SCHEMA)))
+        conn.commit()
+    with connection() as conn:
+        pipeline.run_sql_file(conn, 'create_tables.sql')
+        pipeline.run_sql_file(conn, 'load_auction_states.sql')
+    yield
+    with db.connection(DSN) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("DROP SCHEMA {} CASCADE").format(sql.Identifier(SCHEMA)))
+        conn.commit()
+
+
+def stage(raw_auctions, name:str)->str:
+    """
+    Transforms raw auctions into in-memory S3 and loads them into a new staging table.
+    """
+    s3_client = storage.MemoryS3Client()
+    s3_client.put_object(Bucket='raw-auctions', Key=f"{name}.json", Body=json.dumps(raw_auctions).encode('utf-8'))
+    results = pipeline.transform_object(s3_client, f"{name}.json", 'raw-auctions', 'processed-auctions')
+    staging_table = pipeline.staging_table_name(name)
+    with connection() as conn:
+        pipeline.run_sql_file(conn, 'create_staging.sql', staging_table)
+        pipeline.load_keys_to_staging(s3_client, 'processed-auctions', results['processed_auction_keys'], conn, staging_table)
+    return staging_table
+
+
+def run_concurrently(*funcs)->list:
+    """
+    Runs every function on its own pooled connection, all released together.
+
+    Returns:
+        list: The exceptions raised.
+    """
+    barrier = threading.Barrier(len(funcs))
+    errors = []
+
+    def run(func):
+        with connection() as conn:
+            barrier.wait()
+            try:
+                func(conn)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(func,)) for func in funcs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_concurrent_market_stats_refreshes_of_the_same_days(warehouse, raw_auctions):
+    staging_table = stage(raw_auctions, 'market_stats')
+    with connection() as conn:
+        pipeline.load_warehouse_tables(conn, staging_table)
+
+    for _ in range(ROUNDS):
+        refresh = lambda conn: pipeline.refresh_market_stats(conn, staging_table)
+        assert run_concurrently(refresh, refresh) == []
+
+    assert scalar("SELECT SUM(auction_count) FROM market_daily_stats") == scalar("SELECT COUNT(*) FROM auction_fact")
+    assert scalar("SELECT SUM(auction_count) FROM market_monthly_stats") == scalar("SELECT COUNT(*) FROM auction_fact")
+
+
+def test_concurrent_vehicle_history_refreshes_of_the_same_vins(warehouse, raw_auctions):
+    staging_table = stage(raw_auctions, 'vehicle_history')
+    with connection() as conn:
+        pipeline.load_warehouse_tables(conn, staging_table)
+
+    for _ in range(ROUNDS):
+        refresh = lambda conn: vehicle_history.refresh_history(conn, staging_table)
+        assert run_concurrently(refresh, refresh) == []
+
+    assert scalar("SELECT COUNT(*) FROM vehicle_history") == scalar("SELECT COUNT(*) FROM auction_fact")
+
+
+def shift_auction_dates(raw_auctions, days:int):
+    for auction in raw_auctions:
+        date = datetime.strptime(auction['auction_stats']['auction_date'], '%b %d, %Y %I:%M %p UTC') + timedelta(days=days)
+        auction['auction_stats']['auction_date'] = f"{date:%b %d, %Y} {date.hour % 12 or 12}:{date:%M %p} UTC"
+
+
+def test_concurrent_loads_of_the_same_new_auctions(warehouse, raw_auctions):
+    # both loads see the same new auctions with their dates resolved a day apart (and a corrected
+    # VIN, so vehicle_dim doesn't happen to serialize them): the partitioned
+    # (auction_id, auction_time) key alone would let each insert its own row
+    for round_index in range(ROUNDS):
+        first = copy.deepcopy(raw_auctions)
+        for auction in first:
+            auction['auction_url'] = auction['auction_url'].replace('/auctions/00', f"/auctions/{round_index + 1:02d}")
+        second = copy.deepcopy(first)
+        shift_auction_dates(second, 1)
+        for auction in second:
+            auction['auction_quick_facts']['VIN'] = f"{auction['auction_quick_facts']['VIN'] or ''}X"
+        staging_tables = [stage(first, f"same_{round_index}_a"), stage(second, f"same_{round_index}_b")]
+
+        errors = run_concurrently(*[
+            lambda conn, staging_table=staging_table: pipeline.load_warehouse_tables(conn, staging_table)
+            for staging_table in staging_tables
+        ])
+        assert errors == []
+
+    # two of the fixture's auctions are sent back for a rescrape instead of loaded
+    loadable = len({auction['auction_url'] for auction in raw_auctions}) - 2
+    assert scalar("SELECT COUNT(DISTINCT auction_id) FROM auction_fact") == ROUNDS * loadable
+    assert scalar("SELECT COUNT(*) FROM auction_fact") == ROUNDS * loadable